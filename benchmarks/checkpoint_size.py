@@ -0,0 +1,94 @@
+"""
+Tamaño de los checkpoints del grafo por paso al generar un libro completo.
+
+Genera un libro con el modelo local (LLM_BACKEND="fake") y un checkpointer en
+memoria, y serializa cada checkpoint guardado para medir cuántos bytes ocupa
+el estado en cada paso del grafo y en total.
+
+Uso:
+    python benchmarks/checkpoint_size.py [--chapters 20] [--mode sequential]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["BOOKS_DIR"] = tempfile.mkdtemp(prefix="books_gen_checkpoints_")
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument(
+        "--mode", choices=["sequential", "parallel", "pipelined"], default="sequential"
+    )
+    return parser.parse_args()
+
+
+async def main(args):
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from books_gen.graphs.graph import create_book_generation_graph
+    from books_gen.models.book_models import Book
+
+    now = datetime.now().isoformat()
+    book = Book(
+        title="El misterio de la casa abandonada",
+        synopsis="Una historia de misterio y aventura en una casa antigua.",
+        book_style="misterio",
+        pages=args.chapters * 10,
+        index={},
+        created_at=now,
+        updated_at=now,
+    )
+    index_state = await create_book_generation_graph().compile().ainvoke(
+        {
+            "book": book,
+            "book_id": None,
+            "title": book.title,
+            "synopsis": book.synopsis,
+            "book_style": book.book_style,
+            "pages": book.pages,
+            "current_chapter": "",
+            "error": "",
+        }
+    )
+
+    checkpointer = InMemorySaver()
+    config = {"configurable": {"thread_id": "benchmark"}}
+    final_state = await create_book_generation_graph().compile(
+        checkpointer=checkpointer
+    ).ainvoke(
+        {
+            "book_id": index_state["book_id"],
+            "title": book.title,
+            "synopsis": book.synopsis,
+            "current_chapter": "",
+            "error": "",
+            "generation_mode": args.mode,
+        },
+        config=config,
+    )
+    if final_state.get("error"):
+        print(f"Error en la generación: {final_state['error']}")
+
+    sizes = [
+        len(checkpointer.serde.dumps_typed(checkpoint.checkpoint)[1])
+        for checkpoint in checkpointer.list(config)
+    ][::-1]
+
+    print(f"Capítulos: {args.chapters}, modo: {args.mode}")
+    print(f"Pasos con checkpoint: {len(sizes)}")
+    print(f"Bytes por paso: primero {sizes[0]}, último {sizes[-1]}, máximo {max(sizes)}")
+    print(f"Bytes totales: {sum(sizes)}")
+
+
+if __name__ == "__main__":
+    arguments = _parse_args()
+    os.environ["FAKE_LLM_INDEX_CHAPTERS"] = str(arguments.chapters)
+    asyncio.run(main(arguments))
@@ -0,0 +1,95 @@
+"""
+Impacto en latencia y tokens de enrutar los resúmenes al modelo rápido.
+
+Ejecuta la cadena de resumen de capítulo con el modelo por defecto
+(GROQ_LLM_MODEL) y con el modelo rápido (GROQ_LLM_MODEL_CONTEXT_SUMMARY) sobre
+el mismo capítulo, y extrapola la diferencia a un libro completo, ya que el
+resumen se ejecuta una vez por capítulo.
+
+Hace llamadas reales a Groq salvo que LLM_BACKEND="fake".
+
+Uso:
+    python benchmarks/model_routing.py [--runs 3] [--chapters 30]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+from books_gen.config import settings  # noqa: E402
+from books_gen.graphs.chains import (  # noqa: E402
+    EXTEND_SUMMARY_PROMPT_TEMPLATE,
+    get_chat_model,
+)
+
+INPUTS = {
+    "title": "El misterio de la casa abandonada",
+    "synopsis": "Una historia de misterio y aventura en una casa antigua.",
+    "book_style": "misterio",
+    "summary_book": (
+        "Ana y Tomás heredan una casa en las afueras del pueblo. Al llegar "
+        "descubren que la casa guarda cartas de su abuela que hablan de un "
+        "secreto familiar escondido en el sótano."
+    ),
+    "chapter_content": (
+        "La tormenta golpeaba las ventanas cuando Ana bajó al sótano con la "
+        "linterna. Entre cajas polvorientas encontró un baúl cerrado con un "
+        "candado oxidado. Tomás, que la seguía en silencio, reconoció el "
+        "escudo grabado en la tapa: era el mismo que aparecía en las cartas. "
+    )
+    * 15,
+}
+
+
+async def _measure(model_name: str, runs: int) -> dict:
+    chain = EXTEND_SUMMARY_PROMPT_TEMPLATE | get_chat_model(model_name=model_name)
+    latencies = []
+    input_tokens = []
+    output_tokens = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = await chain.ainvoke(INPUTS)
+        latencies.append(time.perf_counter() - start)
+
+        usage = response.usage_metadata or {}
+        input_tokens.append(usage.get("input_tokens", 0))
+        output_tokens.append(usage.get("output_tokens", 0))
+
+    return {
+        "model": model_name,
+        "latency_s": statistics.mean(latencies),
+        "input_tokens": statistics.mean(input_tokens),
+        "output_tokens": statistics.mean(output_tokens),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--chapters", type=int, default=30)
+    args = parser.parse_args()
+
+    default = await _measure(settings.GROQ_LLM_MODEL, args.runs)
+    fast = await _measure(settings.GROQ_LLM_MODEL_CONTEXT_SUMMARY, args.runs)
+
+    print(f"{'modelo':<28}{'latencia (s)':>14}{'tokens in':>12}{'tokens out':>12}")
+    for result in (default, fast):
+        print(
+            f"{result['model']:<28}{result['latency_s']:>14.2f}"
+            f"{result['input_tokens']:>12.0f}{result['output_tokens']:>12.0f}"
+        )
+
+    saved = (default["latency_s"] - fast["latency_s"]) * args.chapters
+    print(
+        f"\nAhorro estimado en resúmenes para un libro de {args.chapters} "
+        f"capítulos: {saved:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
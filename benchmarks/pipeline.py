@@ -0,0 +1,354 @@
+"""
+Rendimiento de extremo a extremo del grafo de generación con el modelo local.
+
+Genera libros completos (índice y capítulos) con el grafo de
+`books_gen/graphs/graph.py` y el modelo local determinista
+(LLM_BACKEND="fake"), con la latencia que se indique, para varios números de
+capítulos. Cada tamaño se ejecuta en un proceso propio para que el pico de
+memoria y la configuración no se mezclen entre ejecuciones. Por cada tamaño
+mide:
+
+- `wall_seconds`: duración total (índice y capítulos).
+- `llm_busy_seconds`: tiempo en que había al menos una llamada al LLM en curso.
+- `overhead_per_chapter_seconds`: (wall_seconds - llm_busy_seconds) / capítulos,
+  es decir, el tiempo del propio framework (grafo, prompts, contexto,
+  almacenamiento) que no se solapa con el modelo.
+- `bytes_written` y `disk_bytes`: bytes escritos en los archivos del libro y
+  tamaño final del directorio de libros.
+- `peak_rss_bytes`: pico de memoria residente del proceso.
+- `checkpoint_*`: pasos con checkpoint y bytes serializados del estado.
+
+Los resultados se guardan en JSON; con `--baseline` se comparan con una
+ejecución anterior para detectar regresiones.
+
+Uso:
+    python benchmarks/pipeline.py [--chapters 5 50 500] [--mode sequential]
+        [--latency 0.0] [--tokens-per-second 0] [--output resultados.json]
+        [--baseline resultados_anteriores.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+ROOT_DIR = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(ROOT_DIR))
+
+# Métricas que se comparan con --baseline (mayor es peor en todas)
+COMPARED_METRICS = (
+    "wall_seconds",
+    "overhead_per_chapter_seconds",
+    "bytes_written",
+    "peak_rss_bytes",
+    "checkpoint_bytes_total",
+)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chapters", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument(
+        "--mode", choices=["sequential", "parallel", "pipelined"], default="sequential"
+    )
+    parser.add_argument(
+        "--pages-per-chapter",
+        type=int,
+        default=4,
+        help="Páginas del libro por capítulo (4 = 1000 palabras por capítulo)",
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument(
+        "--verbose", action="store_true", help="Muestra los logs de cada ejecución"
+    )
+    # Uso interno: ejecuta un único tamaño e imprime su resultado en JSON
+    parser.add_argument("--run", type=int, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en bytes en macOS y en kilobytes en Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _directory_bytes(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.rglob("*") if path.is_file())
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _run(args) -> Dict[str, Any]:
+    from langchain_core.callbacks import AsyncCallbackHandler
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from books_gen.config import settings
+    from books_gen.graphs.graph import create_book_generation_graph
+    from books_gen.graphs.summary import content_hash
+    from books_gen.infrastructure.llm.usage import UsageTracker
+    from books_gen.models.book_models import Book
+    from books_gen.tools.book_tools import (
+        _get_book_index_without_content,
+        _get_chapter_contents,
+    )
+    from books_gen.tools.io_stats import get_io_stats
+
+    class LLMBusyTime(AsyncCallbackHandler):
+        """Tiempo en que hay al menos una llamada al LLM en curso."""
+
+        def __init__(self) -> None:
+            self.busy_seconds = 0.0
+            self._active: set[UUID] = set()
+            self._busy_since = 0.0
+
+        def _begin(self, run_id: UUID) -> None:
+            if not self._active:
+                self._busy_since = time.perf_counter()
+            self._active.add(run_id)
+
+        def _end(self, run_id: UUID) -> None:
+            if run_id not in self._active:
+                return
+            self._active.discard(run_id)
+            if not self._active:
+                self.busy_seconds += time.perf_counter() - self._busy_since
+
+        async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._begin(run_id)
+
+        async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._begin(run_id)
+
+        async def on_llm_end(self, response, *, run_id, **kwargs):
+            self._end(run_id)
+
+        async def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id)
+
+    usage_tracker = UsageTracker()
+    busy = LLMBusyTime()
+    callbacks = [usage_tracker, busy]
+
+    now = datetime.now().isoformat()
+    book = Book(
+        title="El misterio de la casa abandonada",
+        synopsis="Una historia de misterio y aventura en una casa antigua.",
+        book_style="misterio",
+        pages=args.run * args.pages_per_chapter,
+        index={},
+        created_at=now,
+        updated_at=now,
+    )
+
+    start = time.perf_counter()
+    index_state = await create_book_generation_graph().compile().ainvoke(
+        {
+            "book": book,
+            "book_id": None,
+            "title": book.title,
+            "synopsis": book.synopsis,
+            "book_style": book.book_style,
+            "pages": book.pages,
+            "current_chapter": "",
+            "error": "",
+        },
+        config={"callbacks": callbacks},
+    )
+    index_seconds = time.perf_counter() - start
+    if index_state.get("error"):
+        raise RuntimeError(f"Error al generar el índice: {index_state['error']}")
+
+    checkpointer = InMemorySaver()
+    config = {"configurable": {"thread_id": "benchmark"}}
+    chapters_start = time.perf_counter()
+    final_state = await create_book_generation_graph().compile(
+        checkpointer=checkpointer
+    ).ainvoke(
+        {
+            "book_id": index_state["book_id"],
+            "title": book.title,
+            "synopsis": book.synopsis,
+            "current_chapter": "",
+            "error": "",
+            "generation_mode": args.mode,
+        },
+        config={**config, "callbacks": callbacks},
+    )
+    end = time.perf_counter()
+    if final_state.get("error"):
+        raise RuntimeError(f"Error en la generación: {final_state['error']}")
+
+    # Cada resumen guardado debe corresponder al contenido guardado del capítulo
+    contents = _get_chapter_contents(index_state["book_id"])
+    stale_summaries = [
+        chapter.id
+        for chapter in _get_book_index_without_content(index_state["book_id"]).index.chapters
+        if not chapter.summary_hash
+        or chapter.summary_hash != content_hash(contents.get(chapter.id, ""))
+        or chapter.content_hash != chapter.summary_hash
+    ]
+    if stale_summaries:
+        raise RuntimeError(f"Resúmenes que no corresponden al contenido: {stale_summaries}")
+
+    checkpoint_sizes = [
+        len(checkpointer.serde.dumps_typed(checkpoint.checkpoint)[1])
+        for checkpoint in checkpointer.list(config)
+    ][::-1]
+    io_stats = get_io_stats()
+    wall_seconds = end - start
+
+    return {
+        "chapters": args.run,
+        "wall_seconds": round(wall_seconds, 4),
+        "index_seconds": round(index_seconds, 4),
+        "chapters_seconds": round(end - chapters_start, 4),
+        "llm_calls": usage_tracker.total["llm_calls"],
+        "llm_seconds": round(usage_tracker.total["llm_seconds"], 4),
+        "llm_busy_seconds": round(busy.busy_seconds, 4),
+        "overhead_per_chapter_seconds": round(
+            max(wall_seconds - busy.busy_seconds, 0.0) / args.run, 6
+        ),
+        "output_tokens": usage_tracker.total["output_tokens"],
+        "bytes_written": io_stats["bytes_written"],
+        "bytes_read": io_stats["bytes_read"],
+        "disk_bytes": _directory_bytes(Path(settings.BOOKS_DIR)),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "checkpoint_steps": len(checkpoint_sizes),
+        "checkpoint_bytes_max": max(checkpoint_sizes, default=0),
+        "checkpoint_bytes_last": checkpoint_sizes[-1] if checkpoint_sizes else 0,
+        "checkpoint_bytes_total": sum(checkpoint_sizes),
+    }
+
+
+def _run_in_subprocess(args, chapters: int) -> Dict[str, Any]:
+    # Los libros generados (más de 1 GB con 500 capítulos) se borran al terminar
+    with tempfile.TemporaryDirectory(prefix="books_gen_pipeline_") as books_dir:
+        env = {
+            **os.environ,
+            "LLM_BACKEND": "fake",
+            "BOOKS_DIR": books_dir,
+            "FAKE_LLM_INDEX_CHAPTERS": str(chapters),
+            "FAKE_LLM_LATENCY_SECONDS": str(args.latency),
+            "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+            "FAKE_LLM_ERROR_RATE": "0",
+            "FAKE_LLM_DEGENERATE_RATE": "0",
+            "LLM_CACHE_ENABLED": "false",
+            "PROFILING_ENABLED": "false",
+        }
+        command = [
+            sys.executable,
+            str(Path(__file__).absolute()),
+            "--run",
+            str(chapters),
+            "--mode",
+            args.mode,
+            "--pages-per-chapter",
+            str(args.pages_per_chapter),
+        ]
+        process = subprocess.run(
+            command,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=None if args.verbose else subprocess.PIPE,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"La ejecución con {chapters} capítulos falló:\n{process.stderr or ''}"
+            )
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def _compare(results: List[Dict[str, Any]], baseline_path: Path) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {run["chapters"]: run for run in json.load(f)["runs"]}
+
+    print(f"\nComparación con {baseline_path}:")
+    for run in results:
+        previous = baseline.get(run["chapters"])
+        if previous is None:
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            before, after = previous.get(metric), run.get(metric)
+            if before and after is not None:
+                changes.append(f"{metric} {100 * (after - before) / before:+.1f}%")
+        print(f"  {run['chapters']} capítulos: " + ", ".join(changes))
+
+
+def main(args) -> None:
+    results = []
+    for chapters in args.chapters:
+        print(f"Generando un libro de {chapters} capítulos ({args.mode})...", flush=True)
+        result = _run_in_subprocess(args, chapters)
+        results.append(result)
+        print(
+            f"  {result['wall_seconds']:.2f} s, "
+            f"{1000 * result['overhead_per_chapter_seconds']:.2f} ms de overhead por capítulo, "
+            f"{result['bytes_written'] / 1024:.0f} KiB escritos, "
+            f"pico RSS {(result['peak_rss_bytes'] or 0) / 2**20:.0f} MiB, "
+            f"checkpoints {result['checkpoint_bytes_total'] / 1024:.0f} KiB "
+            f"en {result['checkpoint_steps']} pasos"
+        )
+
+    report = {
+        "benchmark": "pipeline",
+        "created_at": datetime.now().isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "mode": args.mode,
+            "pages_per_chapter": args.pages_per_chapter,
+            "latency_seconds": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+        },
+        "runs": results,
+    }
+    output = args.output or (
+        ROOT_DIR
+        / "benchmarks"
+        / "results"
+        / f"pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {output}")
+
+    if args.baseline:
+        _compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    arguments = _parse_args()
+    if arguments.run is not None:
+        print(json.dumps(asyncio.run(_run(arguments))))
+    else:
+        main(arguments)
@@ -0,0 +1,125 @@
+"""
+Microbenchmark del coste de formateo de prompts por llamada.
+
+Compara la construcción de un ChatPromptTemplate jinja2 en cada llamada (lo
+que hacían las funciones get_*_chain) con las plantillas precompiladas de
+books_gen.graphs.chains.
+
+Uso:
+    python benchmarks/prompt_formatting.py [--number 2000]
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+from langchain_core.prompts import ChatPromptTemplate  # noqa: E402
+
+from books_gen.domain.prompts import (  # noqa: E402
+    EDITOR_INDEX_CARD,
+    INDEX_PROMPT,
+    EDITOR_CHAPTER_CARD,
+    CHAPTER_PROMPT,
+    EDITOR_CHAPTER_EXTEND_CARD,
+    CHAPTER_EXTEND_PROMPT,
+    SUMMARY_PROMPT,
+    EXTEND_SUMMARY_PROMPT,
+)
+from books_gen.graphs.chains import (  # noqa: E402
+    INDEX_PROMPT_TEMPLATE,
+    CHAPTER_PROMPT_TEMPLATE,
+    CHAPTER_EXTEND_PROMPT_TEMPLATE,
+    SUMMARY_PROMPT_TEMPLATE,
+    EXTEND_SUMMARY_PROMPT_TEMPLATE,
+)
+
+BOOK = {
+    "title": "El misterio de la casa abandonada",
+    "synopsis": "Una historia de misterio y aventura en una casa antigua.",
+    "book_style": "misterio",
+    "pages": 300,
+}
+CHAPTER_TEXT = "La puerta crujió al abrirse. " * 200
+
+CASES = {
+    "index": (
+        [("system", EDITOR_INDEX_CARD), ("human", INDEX_PROMPT)],
+        INDEX_PROMPT_TEMPLATE,
+        BOOK,
+    ),
+    "chapter": (
+        [("system", EDITOR_CHAPTER_CARD), ("human", CHAPTER_PROMPT)],
+        CHAPTER_PROMPT_TEMPLATE,
+        {
+            **BOOK,
+            "chapter_title": "La llegada",
+            "chapter_description": "Los protagonistas llegan a la casa.",
+            "summary_book": CHAPTER_TEXT[:2000],
+            "index_format": "Capitulo1, Título: La llegada",
+            "chapter_context": "",
+            "current_chapter_num": 1,
+            "TARGET_CHAPTER_WORDS": 300,
+        },
+    ),
+    "chapter_extend": (
+        [("system", EDITOR_CHAPTER_EXTEND_CARD), ("human", CHAPTER_EXTEND_PROMPT)],
+        CHAPTER_EXTEND_PROMPT_TEMPLATE,
+        {
+            **BOOK,
+            "chapter_title": "La llegada",
+            "chapter_description": "Los protagonistas llegan a la casa.",
+            "index": {"chapters": []},
+            "current_chapter_content": CHAPTER_TEXT,
+            "chapter_context": "",
+        },
+    ),
+    "summary": (
+        [("human", SUMMARY_PROMPT)],
+        SUMMARY_PROMPT_TEMPLATE,
+        {**BOOK, "chapter_content": CHAPTER_TEXT},
+    ),
+    "extend_summary": (
+        [("human", EXTEND_SUMMARY_PROMPT)],
+        EXTEND_SUMMARY_PROMPT_TEMPLATE,
+        {**BOOK, "chapter_content": CHAPTER_TEXT, "summary_book": CHAPTER_TEXT[:2000]},
+    ),
+}
+
+
+def _format_rebuilding(messages, inputs):
+    prompt = ChatPromptTemplate.from_messages(
+        [(role, message.prompt) for role, message in messages],
+        template_format="jinja2",
+    )
+    return prompt.invoke(inputs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'prompt':<16}{'antes (µs)':>14}{'después (µs)':>16}{'mejora':>10}")
+    for name, (messages, compiled, inputs) in CASES.items():
+        # Ambas variantes deben producir exactamente los mismos mensajes
+        assert (
+            _format_rebuilding(messages, inputs).to_messages()
+            == compiled.invoke(inputs).to_messages()
+        ), name
+
+        before = timeit.timeit(
+            lambda: _format_rebuilding(messages, inputs), number=args.number
+        )
+        after = timeit.timeit(lambda: compiled.invoke(inputs), number=args.number)
+
+        before_us = before / args.number * 1e6
+        after_us = after / args.number * 1e6
+        print(
+            f"{name:<16}{before_us:>14.1f}{after_us:>16.1f}{before_us / after_us:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Tamaño de los prompts de capítulo por capítulo, antes y después del presupuesto de contexto.
+
+Simula un libro en el que el resumen crece con cada capítulo (como ocurre con
+EXTEND_SUMMARY_PROMPT) y compara los tokens del prompt completo de capítulo y
+de continuación con el índice y el resumen completos frente al contexto que
+construye books_gen.graphs.context.
+
+Uso:
+    python benchmarks/prompt_sizes.py [--chapters 60] [--summary-words 120]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+from books_gen.graphs.chains import (  # noqa: E402
+    CHAPTER_PROMPT_TEMPLATE,
+    CHAPTER_EXTEND_PROMPT_TEMPLATE,
+)
+from books_gen.graphs.context import (  # noqa: E402
+    build_chapter_context,
+    build_extend_context,
+    count_tokens,
+)
+from books_gen.infrastructure.llm.fake import FakeBookChatModel  # noqa: E402
+from books_gen.models.book_models import BookChapter  # noqa: E402
+
+BOOK = {
+    "title": "El misterio de la casa abandonada",
+    "synopsis": "Una historia de misterio y aventura en una casa antigua.",
+    "book_style": "misterio",
+}
+
+
+def _prompt_tokens(template, inputs) -> int:
+    return sum(
+        count_tokens(str(message.content))
+        for message in template.invoke(inputs).to_messages()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chapters", type=int, default=60)
+    parser.add_argument("--summary-words", type=int, default=120)
+    parser.add_argument("--chapter-words", type=int, default=3000)
+    args = parser.parse_args()
+
+    fake = FakeBookChatModel()
+    rng = fake._rng_for("prompt_sizes")
+    chapters = [
+        BookChapter(
+            id=str(i + 1),
+            title=fake._prose(rng, 4).rstrip("."),
+            description=fake._prose(rng, 25),
+        )
+        for i in range(args.chapters)
+    ]
+    chapter_content = fake._prose(rng, args.chapter_words)
+
+    print(
+        f"{'cap.':>5}{'capítulo antes':>16}{'capítulo después':>18}"
+        f"{'continuación antes':>20}{'continuación después':>22}"
+    )
+    summary_book = ""
+    step = max(1, args.chapters // 12)
+    for position, chapter in enumerate(chapters):
+        common = {
+            **BOOK,
+            "chapter_title": chapter.title,
+            "chapter_description": chapter.description,
+            "chapter_context": "",
+        }
+
+        before = _prompt_tokens(
+            CHAPTER_PROMPT_TEMPLATE,
+            {
+                **common,
+                "summary_book": summary_book,
+                "index_format": [
+                    f"Capitulo{i+1}, Título: {c.title}/n"
+                    for i, c in enumerate(chapters)
+                ],
+                "current_chapter_num": position + 1,
+                "TARGET_CHAPTER_WORDS": 300,
+            },
+        )
+        after = _prompt_tokens(
+            CHAPTER_PROMPT_TEMPLATE,
+            {
+                **common,
+                **build_chapter_context(chapters, position, summary_book),
+                "current_chapter_num": position + 1,
+                "TARGET_CHAPTER_WORDS": 300,
+            },
+        )
+        extend_before = _prompt_tokens(
+            CHAPTER_EXTEND_PROMPT_TEMPLATE,
+            {
+                **common,
+                "index": {"chapters": chapters},
+                "current_chapter_content": chapter_content,
+            },
+        )
+        extend_after = _prompt_tokens(
+            CHAPTER_EXTEND_PROMPT_TEMPLATE,
+            {**common, **build_extend_context(chapters, position, chapter_content)},
+        )
+
+        if position % step == 0 or position == len(chapters) - 1:
+            print(
+                f"{position + 1:>5}{before:>16}{after:>18}"
+                f"{extend_before:>20}{extend_after:>22}"
+            )
+
+        summary_book = "\n\n".join(
+            filter(None, [summary_book, fake._prose(rng, args.summary_words)])
+        )
+
+
+if __name__ == "__main__":
+    main()
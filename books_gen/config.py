@@ -2,6 +2,7 @@
 Módulo de configuración para cargar variables de entorno.
 """
 from pathlib import Path
+from typing import Literal
 
 from pydantic import Field, SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -17,17 +18,129 @@ class Settings(BaseSettings):
     )
 
     # --- GROQ Configuration ---
-    GROQ_API_KEY: str
+    # Solo es obligatoria con LLM_BACKEND="groq"
+    GROQ_API_KEY: str = ""
     GROQ_LLM_MODEL: str = "llama-3.3-70b-versatile"
     GROQ_LLM_MODEL_CONTEXT_SUMMARY: str = "llama-3.1-8b-instant"
 
+    # --- Model routing por nodo ("default" -> GROQ_LLM_MODEL, "fast" -> GROQ_LLM_MODEL_CONTEXT_SUMMARY) ---
+    LLM_TIER_INDEX: Literal["default", "fast"] = "default"
+    LLM_TIER_CHAPTER: Literal["default", "fast"] = "default"
+    LLM_TIER_EXTEND: Literal["default", "fast"] = "default"
+    LLM_TIER_SUMMARY: Literal["default", "fast"] = "fast"
+    LLM_TIER_REPAIR: Literal["default", "fast"] = "fast"
+    LLM_TIER_REVIEW: Literal["default", "fast"] = "default"
+
+    # --- Generation mode ---
+    GENERATION_MODE: Literal["sequential", "parallel", "pipelined"] = "sequential"
+    PARALLEL_CHAPTER_WIDTH: int = 4
+
+    # --- Longitud de los capítulos y generación por escenas ---
+    # Palabras objetivo de cada capítulo: pages * WORDS_PER_PAGE / número de capítulos.
+    # Los capítulos más largos que SCENE_TARGET_WORDS se dividen en escenas que se
+    # generan en paralelo (como máximo SCENE_PARALLEL_WIDTH a la vez) y se enlazan
+    # con párrafos de transición de hasta SCENE_TRANSITION_WORDS palabras.
+    WORDS_PER_PAGE: int = 250
+    CHAPTER_MIN_WORDS: int = 300
+    SCENE_TARGET_WORDS: int = 1000
+    SCENE_MAX_PER_CHAPTER: int = 12
+    SCENE_PARALLEL_WIDTH: int = 4
+    SCENE_TRANSITION_WORDS: int = 60
+    # Capítulos supuestos al empezar el primer capítulo mientras el índice aún llega en streaming
+    STREAM_INDEX_ESTIMATED_CHAPTERS: int = 10
+    # Diferencia relativa máxima entre la longitud objetivo supuesta y la real para conservarlo
+    STREAM_INDEX_TARGET_TOLERANCE: float = 0.2
+
+    # --- Vigilancia de la salida de capítulos, escenas y continuaciones ---
+    # Máximo de tokens = palabras objetivo * GUARD_TOKENS_PER_WORD * GUARD_LENGTH_FACTOR.
+    # Un bucle es una secuencia de GUARD_NGRAM_SIZE palabras repetida GUARD_NGRAM_MAX_REPEATS veces.
+    # Las llamadas vigiladas se hacen en streaming y no usan la caché de respuestas.
+    GUARD_ENABLED: bool = True
+    GUARD_TOKENS_PER_WORD: float = 1.6
+    GUARD_LENGTH_FACTOR: float = 1.5
+    GUARD_NGRAM_SIZE: int = 8
+    GUARD_NGRAM_MAX_REPEATS: int = 3
+
+    # --- Texto parcial de los capítulos en generación (para retomarlos tras una interrupción) ---
+    PARTIAL_FLUSH_SECONDS: float = 2.0
+    PARTIAL_FLUSH_CHARS: int = 2000
+
+    # --- Almacenamiento de los libros ---
+    # Tamaño mínimo del registro de cambios de un libro a partir del que se
+    # incorpora al archivo principal (también debe superar el de este)
+    BOOK_LOG_COMPACT_BYTES: int = 1_000_000
+
+    # --- LLM call policy (plazos, reintentos, circuit breaker y hedging) ---
+    LLM_TIMEOUT_SECONDS: float = 120.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 1.0
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 30.0
+    LLM_CIRCUIT_BREAKER_FAILURES: int = 5
+    LLM_CIRCUIT_BREAKER_RESET_SECONDS: float = 60.0
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 0.95
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+
+    # --- Context budget (tokens aproximados para el contexto variable de cada prompt) ---
+    CONTEXT_TOKEN_BUDGET_CHAPTER: int = 2500
+    CONTEXT_TOKEN_BUDGET_EXTEND: int = 2500
+    CONTEXT_INDEX_SHARE: float = 0.3
+    CONTEXT_INDEX_WINDOW: int = 2
+
+    # --- Recuperación de pasajes anteriores (índice BM25 local sobre fragmentos de capítulos) ---
+    RETRIEVAL_ENABLED: bool = True
+    RETRIEVAL_TOP_K: int = 4
+    RETRIEVAL_CHUNK_TOKENS: int = 150
+    RETRIEVAL_TOKEN_BUDGET: int = 600
+
+    # --- Resumen jerárquico (capítulos por arco y tokens máximos de cada nivel) ---
+    SUMMARY_ARC_CHAPTERS: int = 5
+    SUMMARY_CHAPTER_TOKENS: int = 200
+    SUMMARY_ARC_TOKENS: int = 300
+    SUMMARY_SYNOPSIS_TOKENS: int = 500
+
+    # --- LLM backend ("groq" o "fake" para pruebas locales sin red) ---
+    LLM_BACKEND: Literal["groq", "fake"] = "groq"
+
+    # --- Fake LLM Configuration ---
+    FAKE_LLM_LATENCY_SECONDS: float = 0.0
+    FAKE_LLM_LATENCY_JITTER_SECONDS: float = 0.0
+    FAKE_LLM_TOKENS_PER_SECOND: float = 0.0
+    FAKE_LLM_ERROR_RATE: float = 0.0
+    FAKE_LLM_DEGENERATE_RATE: float = 0.0
+    FAKE_LLM_INDEX_CHAPTERS: int = 10
+    FAKE_LLM_CHAPTER_WORDS: int = 300
+    FAKE_LLM_SUMMARY_WORDS: int = 80
+    FAKE_LLM_SEED: int = 42
+
     # --- Agents Configuration ---
     TOTAL_MESSAGES_SUMMARY_TRIGGER: int = 30
     TOTAL_MESSAGES_AFTER_SUMMARY: int = 5
 
+    # --- Línea temporal de los trabajos (máximo de nodos por trabajo y de trabajos conservados) ---
+    JOB_TIMELINE_MAX_EVENTS: int = 5000
+    JOB_TIMELINE_MAX_JOBS: int = 50
+
+    # --- Perfilado bajo demanda de los trabajos (muestreo de pila y tracemalloc) ---
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_INTERVAL_SECONDS: float = 0.005
+    PROFILING_TRACEMALLOC: bool = True
+    PROFILING_TOP_ALLOCATIONS: int = 50
+
+    # --- Endpoints de administración (desactivados mientras no haya token) ---
+    ADMIN_TOKEN: str = ""
+
+    # --- LLM response cache ---
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_MAX_ENTRIES: int = 10_000
+    LLM_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 60 * 60
+
     # --- Rutas importantes ---
     ROOT_DIR: Path = Path(os.path.dirname(os.path.dirname(__file__)))
     BOOKS_DIR: Path = ROOT_DIR / "generated_books"
+    LLM_CACHE_PATH: Path = ROOT_DIR / ".cache" / "llm_cache.sqlite"
+    PROFILING_DIR: Path = ROOT_DIR / "profiles"
 
 
 settings = Settings()
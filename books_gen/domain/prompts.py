@@ -62,16 +62,18 @@ El índice debe seguir este formato JSON:
     {
       "id": "1",
       "title": "Título del Capítulo 1",
-      "description": "Descripción del Capítulo 1",
+      "description": "Descripción del Capítulo 1"
     },
     {
       "id": "2",
       "title": "Título del Capítulo 2",
-      "description": "Descripción del Capítulo 1",
+      "description": "Descripción del Capítulo 2"
     }
   ]
 }
 
+Responde únicamente con el objeto JSON, sin texto adicional.
+
 """
 
 INDEX_PROMPT = Prompt(
@@ -79,6 +81,27 @@ INDEX_PROMPT = Prompt(
     prompt=__INDEX_PROMPT,
 )
 
+__INDEX_REPAIR_PROMPT = """
+La siguiente respuesta debía ser un índice de libro en JSON válido, pero no cumple el esquema.
+
+Error de validación:
+{{error}}
+
+Esquema JSON esperado:
+{{schema}}
+
+Respuesta a corregir:
+{{invalid_output}}
+
+Corrige únicamente el formato para que cumpla el esquema, conservando los títulos y descripciones.
+Responde solo con el objeto JSON corregido, con la forma {"chapters": [...]}.
+"""
+
+INDEX_REPAIR_PROMPT = Prompt(
+    name="index_repair_prompt",
+    prompt=__INDEX_REPAIR_PROMPT,
+)
+
 
 # --- Chapter generation ---
 
@@ -160,6 +183,89 @@ CHAPTER_EXTEND_PROMPT = Prompt(
 )
 
 
+# --- Scenes ---
+
+__SCENE_PLAN_PROMPT = """
+Vas a planificar el Capítulo {{current_chapter_num}}: "{{chapter_title}}" del libro "{{title}}".
+
+Sinopsis: {{synopsis}}
+Estilo: {{book_style}}
+
+Resumen del libro: {{summary_book}}
+
+ÍNDICE DEL LIBRO:
+{{index_format}}
+
+Descripción del capítulo: {{chapter_description}}
+Contexto adicional del capítulo: {{chapter_context}}
+
+Divide el capítulo en exactamente {{scene_count}} escenas consecutivas. Para cada escena escribe
+un breve guion (dos o tres frases) con lo que ocurre, quién participa y cómo termina, de forma que
+las escenas encadenadas cuenten el capítulo completo.
+
+Responde únicamente con un objeto JSON con la forma:
+{"scenes": ["guion de la escena 1", "guion de la escena 2"]}
+"""
+
+SCENE_PLAN_PROMPT = Prompt(
+    name="scene_plan_prompt",
+    prompt=__SCENE_PLAN_PROMPT,
+)
+
+__SCENE_PROMPT = """
+Eres un experto escritor de libros en el estilo {{book_style}}.
+
+CONTEXTO DEL LIBRO:
+
+Título: {{title}}
+Sinopsis: {{synopsis}}
+
+Resumen del libro: {{summary_book}}
+
+Capítulo {{current_chapter_num}}: "{{chapter_title}}"
+Descripción del capítulo: {{chapter_description}}
+Contexto adicional del capítulo: {{chapter_context}}
+
+GUION DEL CAPÍTULO:
+{{scene_plan}}
+
+ESCENA A ESCRIBIR: escena {{scene_num}} de {{scene_count}}
+{{scene_beat}}
+
+INSTRUCCIONES:
+1. Escribe solo esta escena, de aproximadamente {{TARGET_SCENE_WORDS}} palabras.
+2. No narres lo que ocurre en otras escenas del guion, otras partes del capítulo se escriben por separado.
+3. Sigue el estilo literario especificado: {{book_style}}.
+4. No incluyas "Capítulo X", "Escena X" ni títulos, solo el contenido narrativo.
+
+Responde con el texto completo de la escena.
+"""
+
+SCENE_PROMPT = Prompt(
+    name="scene_prompt",
+    prompt=__SCENE_PROMPT,
+)
+
+__SCENE_TRANSITION_PROMPT = """Estas son dos escenas consecutivas del capítulo "{{chapter_title}}" del libro "{{title}}", escritas por separado.
+
+Final de la escena anterior:
+{{previous_scene_end}}
+
+Comienzo de la escena siguiente:
+{{next_scene_start}}
+
+---
+Escribe un párrafo breve de transición, de como máximo {{TRANSITION_WORDS}} palabras, que enlace el final
+de la escena anterior con el comienzo de la siguiente en el estilo {{book_style}}, sin repetir lo ya narrado.
+Responde solo con el párrafo.
+"""
+
+SCENE_TRANSITION_PROMPT = Prompt(
+    name="scene_transition_prompt",
+    prompt=__SCENE_TRANSITION_PROMPT,
+)
+
+
 # --- Summary ---
 
 __SUMMARY_PROMPT = """
@@ -207,3 +313,80 @@ EXTEND_SUMMARY_PROMPT = Prompt(
     name="extend_summary_prompt",
     prompt=__EXTEND_SUMMARY_PROMPT,
 )
+
+__CHAPTER_SUMMARY_PROMPT = """Este es un capítulo del libro con el siguiente título y sinopsis:
+Título: {{title}}
+Sinopsis: {{synopsis}}
+Estilo literario: {{book_style}}
+
+---
+
+Resume el capítulo "{{chapter_title}}":
+{{chapter_content}}
+
+---
+El resumen debe ser breve y conciso, e incluir los personajes, lugares y eventos importantes del capítulo,
+así como cualquier detalle que los capítulos siguientes deban respetar para mantener la coherencia.
+"""
+
+CHAPTER_SUMMARY_PROMPT = Prompt(
+    name="chapter_summary_prompt",
+    prompt=__CHAPTER_SUMMARY_PROMPT,
+)
+
+__ARC_SUMMARY_PROMPT = """Estos son los resúmenes de un arco de capítulos consecutivos del libro:
+Título: {{title}}
+Sinopsis: {{synopsis}}
+
+{{chapter_summaries}}
+
+---
+Resume el arco en un único texto breve que recoja la evolución de la trama y de los personajes,
+así como los hechos que los capítulos siguientes deben respetar.
+"""
+
+ARC_SUMMARY_PROMPT = Prompt(
+    name="arc_summary_prompt",
+    prompt=__ARC_SUMMARY_PROMPT,
+)
+
+__SYNOPSIS_UPDATE_PROMPT = """Este es el resumen global del libro hasta ahora:
+Título: {{title}}
+Sinopsis: {{synopsis}}
+Resumen: {{summary_book}}
+
+---
+
+Actualiza el resumen global con el resumen del siguiente arco de capítulos:
+{{arc_summary}}
+
+---
+El resumen global debe mantener una extensión similar: condensa lo más antiguo para dar cabida a lo nuevo,
+conservando los personajes, hechos y tramas abiertas que sigan siendo relevantes.
+"""
+
+SYNOPSIS_UPDATE_PROMPT = Prompt(
+    name="synopsis_update_prompt",
+    prompt=__SYNOPSIS_UPDATE_PROMPT,
+)
+
+
+# --- Consistency review ---
+
+__CONSISTENCY_PROMPT = """Estos son los resúmenes de los capítulos del libro "{{title}}", escritos de forma independiente:
+Sinopsis: {{synopsis}}
+
+{{chapter_summaries}}
+
+---
+
+Revisa la coherencia entre capítulos: personajes, nombres, lugares, cronología y hechos de la trama.
+Responde únicamente con un objeto JSON con la forma:
+{"issues": [{"chapter_id": "id del capítulo afectado", "description": "descripción de la incoherencia"}]}
+Si no hay incoherencias, responde {"issues": []}.
+"""
+
+CONSISTENCY_PROMPT = Prompt(
+    name="consistency_prompt",
+    prompt=__CONSISTENCY_PROMPT,
+)
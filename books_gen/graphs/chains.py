@@ -1,82 +1,385 @@
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from jinja2 import meta
+from jinja2.sandbox import SandboxedEnvironment
 from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    HumanMessage,
+    SystemMessage,
+)
+from langchain_core.outputs import ChatGeneration
+from langchain_core.prompt_values import ChatPromptValue
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
 
 from books_gen.config import settings
+from books_gen.infrastructure.llm.cache import get_llm_response_cache, llm_cache_key
+from books_gen.infrastructure.llm.fake import get_fake_chat_model
+from books_gen.infrastructure.llm.policy import with_call_policy
 
 from books_gen.domain.prompts import (
+    Prompt,
     EDITOR_INDEX_CARD,
     INDEX_PROMPT,
+    INDEX_REPAIR_PROMPT,
     EDITOR_CHAPTER_CARD,
     CHAPTER_PROMPT,
     EDITOR_CHAPTER_EXTEND_CARD,
     CHAPTER_EXTEND_PROMPT,
+    SCENE_PLAN_PROMPT,
+    SCENE_PROMPT,
+    SCENE_TRANSITION_PROMPT,
     SUMMARY_PROMPT,
     EXTEND_SUMMARY_PROMPT,
+    CHAPTER_SUMMARY_PROMPT,
+    ARC_SUMMARY_PROMPT,
+    SYNOPSIS_UPDATE_PROMPT,
+    CONSISTENCY_PROMPT,
+)
+
+
+# Entorno Jinja compartido. Es el mismo tipo de entorno aislado que usa
+# ChatPromptTemplate con template_format="jinja2".
+_JINJA_ENV = SandboxedEnvironment()
+
+_MESSAGE_TYPES = {
+    "system": SystemMessage,
+    "human": HumanMessage,
+}
+
+
+def _compile_chat_prompt(
+    name: str, messages: Sequence[tuple[str, Prompt]]
+) -> RunnableLambda:
+    """
+    Compila una sola vez las plantillas Jinja de un prompt de chat.
+
+    ChatPromptTemplate vuelve a parsear la plantilla Jinja en cada llamada a
+    invoke. Aquí cada mensaje se compila al importar el módulo y el runnable
+    resultante solo renderiza, devolviendo el mismo ChatPromptValue.
+    """
+    compiled = []
+    input_variables = set()
+    for role, prompt in messages:
+        template = _JINJA_ENV.from_string(prompt.prompt)
+        compiled.append((_MESSAGE_TYPES[role], template))
+        input_variables |= meta.find_undeclared_variables(
+            _JINJA_ENV.parse(prompt.prompt)
+        )
+
+    def format_prompt(inputs: dict[str, Any]) -> ChatPromptValue:
+        missing = input_variables.difference(inputs)
+        if missing:
+            raise KeyError(
+                f"Faltan variables para el prompt '{name}': {sorted(missing)}"
+            )
+        return ChatPromptValue(
+            messages=[
+                message_type(content=template.render(**inputs))
+                for message_type, template in compiled
+            ]
+        )
+
+    return RunnableLambda(format_prompt, name=name)
+
+
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+
+# ===== PLANTILLAS PRECOMPILADAS =====
+
+INDEX_PROMPT_TEMPLATE = _compile_chat_prompt(
+    INDEX_PROMPT.name,
+    [("system", EDITOR_INDEX_CARD), ("human", INDEX_PROMPT)],
+)
+
+INDEX_REPAIR_PROMPT_TEMPLATE = _compile_chat_prompt(
+    INDEX_REPAIR_PROMPT.name,
+    [("system", EDITOR_INDEX_CARD), ("human", INDEX_REPAIR_PROMPT)],
+)
+
+CHAPTER_PROMPT_TEMPLATE = _compile_chat_prompt(
+    CHAPTER_PROMPT.name,
+    [("system", EDITOR_CHAPTER_CARD), ("human", CHAPTER_PROMPT)],
+)
+
+SUMMARY_PROMPT_TEMPLATE = _compile_chat_prompt(
+    SUMMARY_PROMPT.name,
+    [("human", SUMMARY_PROMPT)],
+)
+
+EXTEND_SUMMARY_PROMPT_TEMPLATE = _compile_chat_prompt(
+    EXTEND_SUMMARY_PROMPT.name,
+    [("human", EXTEND_SUMMARY_PROMPT)],
+)
+
+CHAPTER_EXTEND_PROMPT_TEMPLATE = _compile_chat_prompt(
+    CHAPTER_EXTEND_PROMPT.name,
+    [("system", EDITOR_CHAPTER_EXTEND_CARD), ("human", CHAPTER_EXTEND_PROMPT)],
+)
+
+SCENE_PLAN_PROMPT_TEMPLATE = _compile_chat_prompt(
+    SCENE_PLAN_PROMPT.name,
+    [("system", EDITOR_CHAPTER_CARD), ("human", SCENE_PLAN_PROMPT)],
+)
+
+SCENE_PROMPT_TEMPLATE = _compile_chat_prompt(
+    SCENE_PROMPT.name,
+    [("system", EDITOR_CHAPTER_CARD), ("human", SCENE_PROMPT)],
+)
+
+SCENE_TRANSITION_PROMPT_TEMPLATE = _compile_chat_prompt(
+    SCENE_TRANSITION_PROMPT.name,
+    [("system", EDITOR_CHAPTER_EXTEND_CARD), ("human", SCENE_TRANSITION_PROMPT)],
+)
+
+CHAPTER_SUMMARY_PROMPT_TEMPLATE = _compile_chat_prompt(
+    CHAPTER_SUMMARY_PROMPT.name,
+    [("human", CHAPTER_SUMMARY_PROMPT)],
+)
+
+ARC_SUMMARY_PROMPT_TEMPLATE = _compile_chat_prompt(
+    ARC_SUMMARY_PROMPT.name,
+    [("human", ARC_SUMMARY_PROMPT)],
+)
+
+SYNOPSIS_UPDATE_PROMPT_TEMPLATE = _compile_chat_prompt(
+    SYNOPSIS_UPDATE_PROMPT.name,
+    [("human", SYNOPSIS_UPDATE_PROMPT)],
+)
+
+CONSISTENCY_PROMPT_TEMPLATE = _compile_chat_prompt(
+    CONSISTENCY_PROMPT.name,
+    [("system", EDITOR_INDEX_CARD), ("human", CONSISTENCY_PROMPT)],
 )
 
 
 def get_chat_model(
     temperature: float = 0.7, model_name: str = settings.GROQ_LLM_MODEL
-) -> ChatGroq:
+) -> BaseChatModel:
+    if settings.LLM_BACKEND == "fake":
+        return get_fake_chat_model(
+            temperature=temperature,
+            model_name=model_name,
+            cache=get_llm_response_cache(),
+        )
+
+    if not settings.GROQ_API_KEY:
+        raise RuntimeError(
+            'Falta GROQ_API_KEY: defínela en el .env o usa LLM_BACKEND="fake"'
+        )
+
     return ChatGroq(
         model=model_name,
         temperature=temperature,
         api_key=settings.GROQ_API_KEY,
+        cache=get_llm_response_cache(),
+        # Los reintentos los gestiona la política de chains (with_call_policy)
+        max_retries=0,
     )
 
 
-def get_book_index_chain():
-    model = get_chat_model()
+def _streamed(prompt: RunnableLambda, model: Runnable, streaming: bool) -> Runnable:
+    """
+    Cadena `prompt | model` cuya versión en streaming también usa la caché.
+
+    BaseChatModel solo consulta la caché de respuestas en las llamadas sin
+    streaming. Aquí, si la respuesta ya está en la caché se devuelve de una
+    vez con `ainvoke` (que la lee de la caché y la notifica a los callbacks
+    como acierto); si no, se recibe en streaming y, cuando termina, se guarda
+    con la misma clave que usaría `ainvoke`. Una generación que el consumidor
+    corta antes del final (por ejemplo, la vigilancia de salidas degeneradas)
+    no se guarda, para que su reintento vuelva a pedirse al modelo.
+    """
+    cache = get_llm_response_cache()
+    if not streaming or cache is None:
+        return prompt | model
+
+    async def stream(inputs: dict, config: RunnableConfig) -> AsyncIterator[Any]:
+        messages = (await prompt.ainvoke(inputs, config=config)).to_messages()
+        key = llm_cache_key(model, messages)
+        if cache.contains(*key):
+            message = await model.ainvoke(messages, config=config)
+            yield AIMessageChunk(
+                content=message.content, response_metadata=message.response_metadata
+            )
+            return
+
+        chunks = []
+        async for chunk in model.astream(messages, config=config):
+            chunks.append(chunk.content)
+            yield chunk
+        cache.update(
+            *key, [ChatGeneration(message=AIMessage(content="".join(chunks)))]
+        )
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", EDITOR_INDEX_CARD.prompt),
-            ("human", INDEX_PROMPT.prompt),
-        ],
-        template_format="jinja2",
+    return RunnableLambda(stream, name=prompt.name)
+
+
+def get_model_name_for_node(node: str) -> str:
+    """
+    Devuelve el modelo configurado para un nodo ("index", "chapter", "extend",
+    "summary", "repair" o "review") según su nivel en `settings`.
+    """
+    tiers = {
+        "index": settings.LLM_TIER_INDEX,
+        "repair": settings.LLM_TIER_REPAIR,
+        "review": settings.LLM_TIER_REVIEW,
+        "chapter": settings.LLM_TIER_CHAPTER,
+        "extend": settings.LLM_TIER_EXTEND,
+        "summary": settings.LLM_TIER_SUMMARY,
+    }
+    models = {
+        "default": settings.GROQ_LLM_MODEL,
+        "fast": settings.GROQ_LLM_MODEL_CONTEXT_SUMMARY,
+    }
+    return models[tiers[node]]
+
+
+def get_book_index_chain(streaming: bool = False):
+    model_name = get_model_name_for_node("index")
+    model = get_chat_model(model_name=model_name)
+
+    # Modo JSON: el proveedor garantiza un objeto JSON sintácticamente válido
+    chain = _streamed(
+        INDEX_PROMPT_TEMPLATE,
+        model.bind(response_format=JSON_RESPONSE_FORMAT),
+        streaming,
+    )
+
+    return with_call_policy(
+        chain, name="index", model=model_name, streaming=streaming
+    )
+
+
+def get_index_repair_chain():
+    model_name = get_model_name_for_node("repair")
+    model = get_chat_model(temperature=0, model_name=model_name)
+
+    chain = INDEX_REPAIR_PROMPT_TEMPLATE | model.bind(
+        response_format=JSON_RESPONSE_FORMAT
+    )
+
+    return with_call_policy(chain, name="index_repair", model=model_name)
+
+
+def _limit_output(model: BaseChatModel, max_tokens: Optional[int]):
+    """Limita los tokens de salida del modelo, si se indica un máximo."""
+    return model.bind(max_tokens=max_tokens) if max_tokens else model
+
+
+def get_chapter_chain(streaming: bool = False, max_tokens: Optional[int] = None):
+    model_name = get_model_name_for_node("chapter")
+    model = get_chat_model(model_name=model_name)
+
+    return with_call_policy(
+        _streamed(
+            CHAPTER_PROMPT_TEMPLATE, _limit_output(model, max_tokens), streaming
+        ),
+        name="chapter",
+        model=model_name,
+        streaming=streaming,
+    )
+
+
+def get_scene_plan_chain():
+    model_name = get_model_name_for_node("chapter")
+    model = get_chat_model(temperature=0.3, model_name=model_name)
+
+    chain = SCENE_PLAN_PROMPT_TEMPLATE | model.bind(
+        response_format=JSON_RESPONSE_FORMAT
     )
 
-    return prompt | model
+    return with_call_policy(chain, name="scene_plan", model=model_name)
 
 
-def get_chapter_chain():
-    model = get_chat_model()
+def get_scene_chain(streaming: bool = False, max_tokens: Optional[int] = None):
+    model_name = get_model_name_for_node("chapter")
+    model = get_chat_model(model_name=model_name)
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", EDITOR_CHAPTER_CARD.prompt),
-            ("human", CHAPTER_PROMPT.prompt),
-        ],
-        template_format="jinja2",
+    return with_call_policy(
+        _streamed(
+            SCENE_PROMPT_TEMPLATE, _limit_output(model, max_tokens), streaming
+        ),
+        name="scene",
+        model=model_name,
+        streaming=streaming,
     )
 
-    return prompt | model
+
+def get_scene_transition_chain():
+    model_name = get_model_name_for_node("extend")
+    model = get_chat_model(model_name=model_name)
+
+    return with_call_policy(
+        SCENE_TRANSITION_PROMPT_TEMPLATE | model,
+        name="scene_transition",
+        model=model_name,
+    )
 
 
 def get_summary_chapter_chain_chain(summary_book: str = ""):
-    model = get_chat_model()
+    model_name = get_model_name_for_node("summary")
+    model = get_chat_model(model_name=model_name)
+
+    prompt = (
+        EXTEND_SUMMARY_PROMPT_TEMPLATE if summary_book else SUMMARY_PROMPT_TEMPLATE
+    )
+
+    return with_call_policy(prompt | model, name="summary", model=model_name)
+
+
+def get_chapter_extend_chain(
+    streaming: bool = False, max_tokens: Optional[int] = None
+):
+    model_name = get_model_name_for_node("extend")
+    model = get_chat_model(model_name=model_name)
+
+    return with_call_policy(
+        _streamed(
+            CHAPTER_EXTEND_PROMPT_TEMPLATE, _limit_output(model, max_tokens), streaming
+        ),
+        name="extend",
+        model=model_name,
+        streaming=streaming,
+    )
 
-    summary_message = EXTEND_SUMMARY_PROMPT if summary_book else SUMMARY_PROMPT
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("human", summary_message.prompt),
-        ],
-        template_format="jinja2",
+def get_chapter_summary_chain():
+    model_name = get_model_name_for_node("summary")
+    model = get_chat_model(model_name=model_name)
+
+    return with_call_policy(
+        CHAPTER_SUMMARY_PROMPT_TEMPLATE | model, name="chapter_summary", model=model_name
     )
 
-    return prompt | model
+
+def get_arc_summary_chain():
+    model_name = get_model_name_for_node("summary")
+    model = get_chat_model(model_name=model_name)
+
+    return with_call_policy(
+        ARC_SUMMARY_PROMPT_TEMPLATE | model, name="arc_summary", model=model_name
+    )
+
+
+def get_synopsis_update_chain():
+    model_name = get_model_name_for_node("summary")
+    model = get_chat_model(model_name=model_name)
+
+    return with_call_policy(
+        SYNOPSIS_UPDATE_PROMPT_TEMPLATE | model, name="synopsis_update", model=model_name
+    )
 
 
-def get_chapter_extend_chain():
-    model = get_chat_model()
+def get_consistency_review_chain():
+    model_name = get_model_name_for_node("review")
+    model = get_chat_model(temperature=0, model_name=model_name)
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", EDITOR_CHAPTER_EXTEND_CARD.prompt),
-            ("human", CHAPTER_EXTEND_PROMPT.prompt),
-        ],
-        template_format="jinja2",
+    chain = CONSISTENCY_PROMPT_TEMPLATE | model.bind(
+        response_format=JSON_RESPONSE_FORMAT
     )
 
-    return prompt | model
+    return with_call_policy(chain, name="consistency_review", model=model_name)
@@ -0,0 +1,170 @@
+"""
+Construcción del contexto de los prompts de capítulo dentro de un presupuesto de tokens.
+
+El índice, el resumen del libro y el texto ya escrito crecen con la longitud
+del libro. Estas funciones los recortan para que cada prompt ocupe un número
+de tokens acotado: ventana de texto reciente, índice compactado alrededor
+del capítulo actual y resumen recortado.
+"""
+import re
+from typing import Dict, List
+
+from books_gen.config import settings
+from books_gen.models.book_models import BookChapter
+
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_ELLIPSIS = "[...]"
+
+
+def count_tokens(text: str) -> int:
+    """
+    Aproximación del número de tokens de un texto.
+
+    Cuenta palabras y signos de puntuación, sumando un token extra por cada
+    cinco caracteres de las palabras largas, que el tokenizador divide en
+    varias piezas.
+    """
+    if not text:
+        return 0
+    return sum(1 + len(piece) // 5 for piece in _TOKEN_PATTERN.findall(str(text)))
+
+
+def trim_to_tokens(text: str, budget: int, keep: str = "end") -> str:
+    """
+    Recorta un texto para que no supere `budget` tokens.
+
+    Args:
+        text: Texto a recortar.
+        budget: Número máximo de tokens.
+        keep: "end" conserva el final (texto más reciente), "start" el principio.
+
+    Returns:
+        El texto recortado por párrafos completos cuando es posible, marcado con [...].
+    """
+    if count_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+
+    paragraphs = text.split("\n\n")
+    if keep == "end":
+        paragraphs.reverse()
+
+    kept: List[str] = []
+    used = count_tokens(_ELLIPSIS)
+    for paragraph in paragraphs:
+        tokens = count_tokens(paragraph)
+        if used + tokens > budget:
+            if not kept:
+                # Un único párrafo demasiado largo: recortar por palabras
+                words = paragraph.split(" ")
+                if keep == "end":
+                    words.reverse()
+                for word in words:
+                    used += count_tokens(word)
+                    if used > budget:
+                        break
+                    kept.append(word)
+                if keep == "end":
+                    kept.reverse()
+                return _join_trimmed([" ".join(kept)], keep)
+            break
+        kept.append(paragraph)
+        used += tokens
+
+    if keep == "end":
+        kept.reverse()
+    return _join_trimmed(kept, keep)
+
+
+def _join_trimmed(parts: List[str], keep: str) -> str:
+    body = "\n\n".join(parts)
+    return f"{_ELLIPSIS} {body}" if keep == "end" else f"{body} {_ELLIPSIS}"
+
+
+def compact_index(chapters: List[BookChapter], position: int, budget: int) -> str:
+    """
+    Representación compacta del índice centrada en el capítulo `position`.
+
+    Los capítulos cercanos incluyen su descripción; el resto solo el título.
+    Si aun así no cabe en el presupuesto, se omiten los capítulos más lejanos.
+    """
+    window = settings.CONTEXT_INDEX_WINDOW
+
+    lines = []
+    for i, chapter in enumerate(chapters):
+        line = f"Capítulo {i + 1}: {chapter.title}"
+        if abs(i - position) <= window and chapter.description:
+            line += f" - {chapter.description}"
+        lines.append(line)
+
+    if count_tokens("\n".join(lines)) <= budget:
+        return "\n".join(lines)
+
+    # Ampliar una ventana alrededor del capítulo actual mientras quepa
+    first = last = position
+    used = count_tokens(lines[position])
+    while True:
+        grown = False
+        for candidate in (last + 1, first - 1):
+            if 0 <= candidate < len(lines) and not first <= candidate <= last:
+                tokens = count_tokens(lines[candidate])
+                if used + tokens <= budget:
+                    used += tokens
+                    first, last = min(first, candidate), max(last, candidate)
+                    grown = True
+        if not grown:
+            break
+
+    selected = lines[first : last + 1]
+    if first > 0:
+        selected.insert(0, f"{_ELLIPSIS} ({first} capítulos anteriores)")
+    if last < len(lines) - 1:
+        selected.append(f"{_ELLIPSIS} ({len(lines) - 1 - last} capítulos posteriores)")
+    return "\n".join(selected)
+
+
+def build_chapter_context(
+    chapters: List[BookChapter], position: int, summary_book: str, passages: str = ""
+) -> Dict[str, str]:
+    """
+    Contexto variable del prompt de capítulo (índice y resumen) dentro del presupuesto.
+
+    Los tokens de los pasajes recuperados de capítulos anteriores se
+    descuentan del presupuesto del resumen.
+    """
+    budget = settings.CONTEXT_TOKEN_BUDGET_CHAPTER
+    index_format = compact_index(
+        chapters, position, int(budget * settings.CONTEXT_INDEX_SHARE)
+    )
+    summary_budget = budget - count_tokens(index_format) - count_tokens(passages)
+
+    return {
+        "index_format": index_format,
+        "summary_book": trim_to_tokens(summary_book or "", summary_budget, keep="end"),
+    }
+
+
+def build_extend_context(
+    chapters: List[BookChapter],
+    position: int,
+    current_chapter_content: str,
+    passages: str = "",
+) -> Dict[str, str]:
+    """
+    Contexto variable del prompt de continuación (índice y texto actual) dentro del presupuesto.
+
+    Del texto actual del capítulo solo se envía la parte más reciente, tras
+    descontar los tokens de los pasajes recuperados de capítulos anteriores.
+    """
+    budget = settings.CONTEXT_TOKEN_BUDGET_EXTEND
+    index = compact_index(chapters, position, int(budget * settings.CONTEXT_INDEX_SHARE))
+    content_budget = budget - count_tokens(index) - count_tokens(passages)
+
+    return {
+        "index": index,
+        "current_chapter_content": trim_to_tokens(
+            current_chapter_content, content_budget, keep="end"
+        ),
+    }
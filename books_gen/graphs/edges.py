@@ -1,7 +1,9 @@
-from books_gen.tools.book_tools import _get_book_path
+from books_gen.tools.book_tools import (
+    _get_book_index_without_content,
+    _read_partial_chapter,
+)
 from books_gen.graphs.state import BookGenerationState
-import json
-from books_gen.models.book_models import BookIndex
+from books_gen.config import settings
 
 
 def should_end(state: BookGenerationState) -> str:
@@ -20,18 +22,35 @@ def check_index_exists(state: BookGenerationState) -> str:
     Returns:
         str: "exists" si el índice ya existe, "not_exists" si no existe.
     """
-    # Verificar si el índice está vacío
+    # initialize_book indica si el libro guardado ya tiene capítulos
+    if state.get("has_index"):
+        return "exists"
+    return "not_exists"
 
-    book = state.get("book")
 
-    if not book:
-        return "not_exists"
-    else:
-        index = book.index
+def select_generation_mode(state: BookGenerationState) -> str:
+    """
+    Determina cómo se generan los capítulos del libro.
 
-    if index and isinstance(index, dict) and index.get("chapters"):
-        return "exists"
-    return "not_exists"
+    Returns:
+        str: "parallel" para generar los capítulos en paralelo, "pipelined" para
+        generarlos en orden solapando cada resumen con el capítulo siguiente,
+        "sequential" para generarlos uno a uno, "regenerate_stale" para
+        regenerar solo los capítulos desactualizados.
+    """
+    return state.get("generation_mode") or settings.GENERATION_MODE
+
+
+def should_generate_chapters(state: BookGenerationState) -> str:
+    """
+    Tras generar el índice, decide si se generan los capítulos en la misma ejecución.
+
+    Returns:
+        str: "generate" si el estado lo pide y no hay error, "finish" en caso contrario.
+    """
+    if state.get("error") or not state.get("generate_chapters"):
+        return "finish"
+    return "generate"
 
 
 def check_chapter_content(state: BookGenerationState) -> str:
@@ -39,29 +58,27 @@ def check_chapter_content(state: BookGenerationState) -> str:
     Verifica si el capítulo seleccionado ya tiene contenido.
 
     Returns:
-        str: "has_content" si el capítulo ya tiene contenido, "no_content" si está vacío.
+        str: "has_content" si el capítulo ya tiene contenido o texto parcial de una
+            generación interrumpida, "no_content" si está vacío.
     """
     # Si no hay capítulo seleccionado, no podemos verificar contenido
     if not state.get("current_chapter"):
         return "no_content"
 
-    # Verificar si ya hay contenido generado para este capítulo
-    generated_content = state["book"].processed_chapters
-    if not generated_content:
-        return "no_content"
-    # Verificar si el capítulo actual ya tiene contenido generado
-    if state["current_chapter"] in generated_content:
-        return "has_content"
-
-    # Si no hay en el estado, verificar en el archivo
+    # Verificar en el archivo si ya hay contenido generado para este capítulo
     try:
-        book_path = _get_book_path(state["book_id"])
-        with open(book_path, "r", encoding="utf-8") as f:
-            book_data = json.load(f)
-
-        for chapter in book_data["index"].get("chapters", []):
-            if chapter["id"] == state["current_chapter"] and chapter.get("content"):
-                return "has_content"
+        book = _get_book_index_without_content(state["book_id"])
+        # Verificar si el capítulo actual ya tiene contenido generado
+        if book.is_processed(state["current_chapter"]):
+            return "has_content"
+
+        chapter = book.index.get_chapter(state["current_chapter"])
+        if chapter and chapter.content_hash:
+            return "has_content"
+
+        # Generación interrumpida: se retoma desde el texto parcial
+        if _read_partial_chapter(state["book_id"], state["current_chapter"]).strip():
+            return "has_content"
     except Exception:
         pass
 
@@ -80,40 +97,3 @@ def should_summarize_conversation(state: BookGenerationState) -> str:
     if len(state["messages"][-1].content) > 1000:
         return "summarize"
     return "no_summarize"
-
-
-def should_process_next_chapter(state: BookGenerationState) -> str:
-    """
-    Determina si hay más capítulos por procesar en el libro.
-
-    Returns:
-        str: "next_chapter" si hay más capítulos por procesar, "finish" si se han procesado todos.
-    """
-
-    # Si hay un error, terminamos
-    if state.get("error"):
-        return "finish"
-
-    book = state.get("book")
-    if not book:
-        return "finish"
-    # Verificar que hay un índice
-    if (not book.index) or (not book.index.get("chapters")):
-        return "finish"
-
-    # Obtener la lista de capítulos
-    chapters = book.index.get("chapters")
-
-    # Si no hay capítulos, terminar
-    if not chapters:
-        return "finish"
-
-    # Determinar el capítulo actual y el siguiente
-    processed_chapters = book.processed_chapters
-
-    if len(processed_chapters) == len(chapters):
-        # Si todos los capítulos han sido procesados, terminar
-        book.is_completed = True
-        return "finish"
-    else:
-        return "next_chapter"
@@ -9,7 +9,8 @@ from books_gen.graphs.edges import (
     should_end,
     check_index_exists,
     check_chapter_content,
-    should_process_next_chapter,
+    select_generation_mode,
+    should_generate_chapters,
 )
 
 from books_gen.graphs.nodes import (
@@ -17,12 +18,54 @@ from books_gen.graphs.nodes import (
     generate_index,
     generate_chapter,
     continue_chapter_generation,
-    connector_node,
+    make_generate_chapters_sequential,
     summarize_chapter_content,
-    
+    generate_chapters_parallel,
+    reduce_parallel_chapters,
+    generate_chapters_pipelined,
+    regenerate_stale_chapters,
 )
 
 
+def create_chapter_graph() -> StateGraph:
+    """
+    Crea el subgrafo que procesa un único capítulo (`current_chapter`).
+
+    Si el capítulo ya tiene contenido lo continúa; si no, lo genera y lo
+    resume. El modo secuencial lo ejecuta una vez por capítulo.
+    """
+    workflow = StateGraph(BookGenerationState)
+
+    workflow.add_node("generate_chapter", generate_chapter)
+    workflow.add_node("continue_chapter", continue_chapter_generation)
+    workflow.add_node("summarize_chapter_content", summarize_chapter_content)
+
+    # Antes de generar un capítulo, verificar si ya tiene contenido
+    workflow.add_conditional_edges(
+        START,
+        check_chapter_content,
+        {"has_content": "continue_chapter", "no_content": "generate_chapter"},
+    )
+
+    # Después de generar un capítulo, ir a resumir el contenido
+    workflow.add_conditional_edges(
+        "generate_chapter",
+        should_end,
+        {"error": END, "continue": "summarize_chapter_content"},
+    )
+    workflow.add_edge("summarize_chapter_content", END)
+
+    # Tras continuar un capítulo (o retomarlo desde su texto parcial), su
+    # contenido ha cambiado y se vuelve a resumir
+    workflow.add_conditional_edges(
+        "continue_chapter",
+        should_end,
+        {"error": END, "continue": "summarize_chapter_content"},
+    )
+
+    return workflow
+
+
 def create_book_generation_graph() -> StateGraph:
     """
     Crea un grafo de estado para la generación de libros.
@@ -33,10 +76,14 @@ def create_book_generation_graph() -> StateGraph:
     # Definir los nodos
     workflow.add_node("initialize", initialize_book)
     workflow.add_node("generate_index", generate_index)
-    workflow.add_node("connector_node", connector_node)
-    workflow.add_node("generate_chapter", generate_chapter)
-    workflow.add_node("continue_chapter", continue_chapter_generation)
-    workflow.add_node("summarize_chapter_content", summarize_chapter_content)
+    workflow.add_node(
+        "generate_chapters_sequential",
+        make_generate_chapters_sequential(create_chapter_graph().compile()),
+    )
+    workflow.add_node("generate_chapters_parallel", generate_chapters_parallel)
+    workflow.add_node("reduce_parallel_chapters", reduce_parallel_chapters)
+    workflow.add_node("generate_chapters_pipelined", generate_chapters_pipelined)
+    workflow.add_node("regenerate_stale_chapters", regenerate_stale_chapters)
 
     # Definir las transiciones
     #workflow.set_entry_point("initialize")
@@ -46,63 +93,48 @@ def create_book_generation_graph() -> StateGraph:
     workflow.add_conditional_edges(
         "initialize",
         check_index_exists,
-        {"exists": "connector_node", "not_exists": "generate_index"},
+        {"exists": "generation_mode_check", "not_exists": "generate_index"},
     )
 
-    # Después de generar el índice, ir al nodo conector para empezar a procesar capítulos
-    # TODO: Cambiar a un nodo de creacion de capitulo
-    workflow.add_edge("generate_index", END)
-
-    # Antes de generar un capítulo, verificar si ya tiene contenido
-    workflow.add_conditional_edges(
-        "connector_node",
-        check_chapter_content,
-        {"has_content": "continue_chapter", "no_content": "generate_chapter"},
-    )
-    # Después de generar un capítulo, ir a resumir el contenido
-    workflow.add_edge("generate_chapter", "summarize_chapter_content")
+    # Nodo virtual para elegir entre generación secuencial o en paralelo
+    workflow.add_node("generation_mode_check", lambda state: state)
 
-    # Después de generar un capítulo, verificar si hay error
     workflow.add_conditional_edges(
-        "summarize_chapter_content", 
-        should_end, 
+        "generation_mode_check",
+        select_generation_mode,
         {
-            "error": END, 
-            "continue": "next_chapter_check"
-        }
+            "sequential": "generate_chapters_sequential",
+            "parallel": "generate_chapters_parallel",
+            "pipelined": "generate_chapters_pipelined",
+            "regenerate_stale": "regenerate_stale_chapters",
+        },
     )
 
-    # Después de continuar un capítulo, verificar si hay error
+    # En modo secuencial cada capítulo se procesa en su propia ejecución del
+    # subgrafo de capítulo, así que el grafo principal tiene los mismos pasos
+    # sea cual sea la longitud del libro
+    workflow.add_edge("generate_chapters_sequential", END)
+
+    # En modo paralelo, tras generar todos los capítulos se revisa la coherencia
     workflow.add_conditional_edges(
-        "continue_chapter", 
-        should_end, 
+        "generate_chapters_parallel",
+        should_end,
         {
-            "error": END, 
-            "continue": "next_chapter_check"
-        }
+            "error": END,
+            "continue": "reduce_parallel_chapters",
+        },
     )
-    
-    
-      # Nodo virtual para verificar si hay más capítulos por procesar
-    workflow.add_node("next_chapter_check", lambda state: state)
-    
+    workflow.add_edge("reduce_parallel_chapters", END)
+    workflow.add_edge("generate_chapters_pipelined", END)
+    workflow.add_edge("regenerate_stale_chapters", END)
+
+    # Después de generar el índice, seguir con los capítulos si se ha pedido
     workflow.add_conditional_edges(
-        "next_chapter_check",
-        should_process_next_chapter,
-        {
-            "next_chapter": "connector_node",
-            "finish": END
-        }
+        "generate_index",
+        should_generate_chapters,
+        {"generate": "generation_mode_check", "finish": END},
     )
-    
-
-    #workflow.add_conditional_edges(
-    #   "connector_node",
-    #   should_summarize_chapter_content,
-    #   {"summarize": "summarize_chapter_content", "no_summarize": END},
-    #)
 
     return workflow
 
 graph = create_book_generation_graph().compile()
-
@@ -0,0 +1,162 @@
+"""
+Validación del índice generado por el LLM contra el esquema BookIndex.
+"""
+import json
+import re
+from typing import List, Optional
+
+from pydantic import ValidationError
+
+from books_gen.models.book_models import BookChapter, BookIndex
+
+
+class IndexParseError(ValueError):
+    """La respuesta del LLM no contiene un índice válido."""
+
+
+_FENCED_JSON = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_CHAPTERS_ARRAY = re.compile(r'"chapters"\s*:\s*\[')
+
+
+def _extract_json_text(text: str) -> str:
+    """Aísla el objeto JSON de la respuesta (bloques ``` o texto alrededor)."""
+    fenced = _FENCED_JSON.search(text)
+    if fenced:
+        text = fenced.group(1)
+
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        raise IndexParseError("La respuesta no contiene ningún objeto JSON")
+
+    return text[start : end + 1]
+
+
+def parse_book_index(text: str) -> BookIndex:
+    """
+    Convierte la respuesta del LLM en un BookIndex validado.
+
+    Aplica reparaciones locales baratas (bloques de código, texto alrededor,
+    comas finales, ids numéricos) antes de validar contra el esquema.
+
+    Raises:
+        IndexParseError: Si la respuesta no se puede convertir en un índice válido.
+    """
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        json_text = _TRAILING_COMMA.sub(r"\1", _extract_json_text(text))
+        try:
+            data = json.loads(json_text)
+        except json.JSONDecodeError as e:
+            raise IndexParseError(f"JSON inválido: {e}") from e
+
+    if isinstance(data, list):
+        data = {"chapters": data}
+
+    if not isinstance(data, dict):
+        raise IndexParseError("El índice debe ser un objeto JSON con la clave 'chapters'")
+
+    for chapter in data.get("chapters") or []:
+        if isinstance(chapter, dict) and isinstance(chapter.get("id"), int):
+            chapter["id"] = str(chapter["id"])
+
+    try:
+        index = BookIndex.model_validate(data)
+    except ValidationError as e:
+        raise IndexParseError(str(e)) from e
+
+    if not index.chapters:
+        raise IndexParseError("El índice no contiene capítulos")
+
+    ids = [chapter.id for chapter in index.chapters]
+    if len(set(ids)) != len(ids):
+        raise IndexParseError("El índice contiene ids de capítulo duplicados")
+
+    return index
+
+
+class IncrementalIndexParser:
+    """
+    Extrae los capítulos del índice a medida que llega la respuesta en streaming.
+
+    Recorre el texto recibido con un pequeño autómata (cadenas, escapes y
+    profundidad de llaves) y devuelve cada objeto de la lista "chapters" en
+    cuanto se cierra, sin esperar al resto del JSON. El índice completo se
+    valida después con `parse_book_index`.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.chapters: List[BookChapter] = []
+        self._position: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start: Optional[int] = None
+        self._closed = False
+
+    def feed(self, chunk: str) -> List[BookChapter]:
+        """
+        Añade un fragmento de la respuesta.
+
+        Returns:
+            Los capítulos que se han completado con este fragmento.
+        """
+        self.text += chunk
+        if self._closed:
+            return []
+
+        if self._position is None:
+            match = _CHAPTERS_ARRAY.search(self.text)
+            if not match:
+                return []
+            self._position = match.end()
+
+        completed = []
+        text = self.text
+        for position in range(self._position, len(text)):
+            char = text[position]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = position
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    chapter = self._parse_chapter(text[self._object_start : position + 1])
+                    self._object_start = None
+                    if chapter is not None:
+                        completed.append(chapter)
+            elif char == "]" and self._depth == 0:
+                self._closed = True
+                break
+        self._position = len(text)
+
+        self.chapters.extend(completed)
+        return completed
+
+    @staticmethod
+    def _parse_chapter(text: str) -> Optional[BookChapter]:
+        try:
+            data = json.loads(_TRAILING_COMMA.sub(r"\1", text))
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        if isinstance(data.get("id"), int):
+            data["id"] = str(data["id"])
+        try:
+            return BookChapter.model_validate(data)
+        except ValidationError:
+            return None
@@ -1,31 +1,83 @@
+import asyncio
 import uuid
-import os
 import json
+import time
 from datetime import datetime
+from typing import List, Optional
 
+from langchain_core.runnables import RunnableConfig
+from loguru import logger
 
 from books_gen.graphs.state import BookGenerationState
 from books_gen.config import settings
 
-from books_gen.models.book_models import Book, BookChapter, BookStyle
-from books_gen.tools.book_tools import _get_book_path, _get_book_index_without_content
+from books_gen.models.book_models import Book, BookChapter, BookIndex, BookStyle
+from books_gen.tools.book_tools import (
+    _create_book_file,
+    _get_book_index_without_content,
+    _update_book_chapters,
+    _update_book_index,
+    _get_chapter_content,
+    _read_partial_chapter,
+    _clear_partial_chapter,
+    PartialChapterWriter,
+)
 
 # from books_gen.tools.llm_client import (
 #    generate_book_index_with_llm,
 #    generate_chapter_content_with_llm,
 #    generate_summarize_resume_with_llm,
 # )
+from books_gen.graphs.context import (
+    build_chapter_context,
+    build_extend_context,
+    count_tokens,
+    trim_to_tokens,
+)
+from books_gen.graphs.retrieval import retrieve_passages
+from books_gen.graphs.staleness import (
+    chapter_input_hashes,
+    find_review_chapters,
+    stale_dependencies,
+)
+from books_gen.graphs.index_parser import (
+    IncrementalIndexParser,
+    IndexParseError,
+    parse_book_index,
+)
+from books_gen.graphs.output_guard import (
+    guarded_generate,
+    max_output_tokens,
+    trim_to_sentence,
+)
+from books_gen.graphs.scenes import (
+    chapter_word_target,
+    scene_count,
+    write_chapter_by_scenes,
+)
+from books_gen.graphs.summary import (
+    content_hash,
+    is_summary_fresh,
+    render_summary_context,
+    summarize_chapter,
+    update_summary_hierarchy,
+)
 from books_gen.graphs.chains import (
     get_book_index_chain,
+    get_index_repair_chain,
     get_chapter_chain,
     get_chapter_extend_chain,
-    get_summary_chapter_chain_chain,
+    get_consistency_review_chain,
 )
 
 
 async def initialize_book(state: BookGenerationState):
     """
     Inicializa un nuevo libro con título y sinopsis.
+
+    El libro recibido en el estado solo se usa para crear el archivo: a partir
+    de aquí el estado lleva únicamente su ID y los nodos leen el índice y el
+    contenido del archivo del libro.
     """
 
     try:
@@ -37,95 +89,208 @@ async def initialize_book(state: BookGenerationState):
             book_id = str(uuid.uuid4())
             book.id = book_id
 
-            state["book_id"] = book_id
-
             # Guardar el libro inicial
-            os.makedirs(settings.BOOKS_DIR, exist_ok=True)
-            with open(_get_book_path(book_id), "w", encoding="utf-8") as f:
-                f.write(book.model_dump_json(indent=2))
-
-            state["book"] = book
-            state["book_id"] = book_id
-            state["title"] = book.title
-            state["synopsis"] = book.synopsis
-            state["book_style"] = book.book_style
-            state["pages"] = book.pages
-
-            return state
+            _create_book_file(book)
         else:
-            # Si el libro ya tiene ID, simplemente lo retornamos
-
+            # Si el libro ya tiene ID, lo cargamos del archivo
             book_id = state.get("book_id", None)
 
             book = _get_book_index_without_content(book_id)
 
-            state["book"] = book
-            state["book_id"] = book_id
-            state["title"] = book.title
-            state["synopsis"] = book.synopsis
-            state["book_style"] = book.book_style
-            state["pages"] = book.pages
-
-            return state
+        return {
+            "book": None,
+            "book_id": book_id,
+            "title": book.title,
+            "synopsis": book.synopsis,
+            "book_style": book.book_style,
+            "pages": book.pages,
+            "has_index": bool(book.index.chapters),
+        }
 
     except Exception as e:
-        return {**state, "error": f"Error al inicializar el libro: {str(e)}"}
+        return {"error": f"Error al inicializar el libro: {str(e)}"}
 
 
 async def generate_index(state: BookGenerationState) -> BookGenerationState:
     """
     Genera el índice del libro utilizando el LLM.
+
+    Si el estado pide generar también los capítulos (`generate_chapters`), el
+    índice se recibe en streaming y el primer capítulo empieza a escribirse
+    en cuanto su entrada está completa, mientras llega el resto del índice.
     """
+    first_chapter = None
     try:
-        index_chain = get_book_index_chain()
-        # Generar índice con LLM
-        response = await index_chain.ainvoke(
-            {
-                "title": state["title"],
-                "synopsis": state["synopsis"],
-                "book_style": state["book_style"],
-                "pages": state["pages"],
-            }
-        )
+        index_inputs = {
+            "title": state["title"],
+            "synopsis": state["synopsis"],
+            "book_style": state["book_style"],
+            "pages": state["pages"],
+        }
+        if state.get("generate_chapters"):
+            response_text, first_chapter = await _stream_index_with_first_chapter(
+                state["book_id"], index_inputs
+            )
+        else:
+            index_chain = get_book_index_chain()
+            # Generar índice con LLM
+            response = await index_chain.ainvoke(index_inputs)
 
-        if hasattr(response, "content"):
-            response_text = response.content
+            if hasattr(response, "content"):
+                response_text = response.content
 
-        else:
-            response_text = response
+            else:
+                response_text = response
 
-        # Intentar parsear el JSON del índice
+        # Validar el índice contra el esquema BookIndex
         try:
-            index_dict = json.loads(response_text)
-        except json.JSONDecodeError:
-            # Si no es JSON válido, intentar extraer solo la parte JSON
-            import re
-
-            json_match = re.search(r"```json\n(.*?)\n```", response_text, re.DOTALL)
-            if json_match:
-                response = json_match.group(1)
-                index_dict = json.loads(response)
-            else:
-                raise ValueError(
-                    "No se pudo extraer un JSON válido de la respuesta del LLM"
+            book_index = parse_book_index(response_text)
+        except IndexParseError as e:
+            # Reparación dirigida con el modelo rápido en lugar de regenerar el índice
+            repair_chain = get_index_repair_chain()
+            repaired = await repair_chain.ainvoke(
+                {
+                    "error": str(e),
+                    "schema": json.dumps(
+                        BookIndex.model_json_schema(), ensure_ascii=False
+                    ),
+                    "invalid_output": response_text,
+                }
+            )
+            book_index = parse_book_index(
+                repaired.content if hasattr(repaired, "content") else repaired
+            )
+
+        # Guardar el índice en el libro existente
+        _update_book_index(state["book_id"], book_index.model_dump(exclude_none=True))
+
+        if first_chapter is not None:
+            streamed_entry, task = first_chapter
+            first_chapter = None
+            await _store_first_chapter(
+                state["book_id"], book_index, streamed_entry, task
+            )
+
+        return {"has_index": True, "error": ""}
+    except Exception as e:
+        if first_chapter is not None:
+            await _discard_first_chapter(state["book_id"], *first_chapter)
+        return {"error": f"Error al generar el índice: {str(e)}"}
+
+
+async def _stream_index_with_first_chapter(book_id: str, index_inputs: dict):
+    """
+    Recibe el índice en streaming y empieza el primer capítulo en cuanto su
+    entrada está completa.
+
+    El número total de capítulos aún no se conoce, así que la longitud
+    objetivo del primer capítulo se calcula con
+    `STREAM_INDEX_ESTIMATED_CHAPTERS`.
+
+    Returns:
+        El texto completo del índice y, si se ha empezado, la tupla
+        (entrada del primer capítulo, tarea que lo escribe).
+    """
+    book = _get_book_index_without_content(book_id)
+    parser = IncrementalIndexParser()
+    first_chapter = None
+    started = time.perf_counter()
+
+    try:
+        async for chunk in get_book_index_chain(streaming=True).astream(index_inputs):
+            completed = parser.feed(chunk.content if hasattr(chunk, "content") else chunk)
+            if completed and first_chapter is None:
+                entry = completed[0]
+                logger.info(
+                    f"Entrada del capítulo {entry.id} recibida a los "
+                    f"{time.perf_counter() - started:.2f}s; empieza su generación"
+                )
+                task = asyncio.create_task(
+                    _write_chapter_content(
+                        book,
+                        [entry],
+                        0,
+                        "",
+                        "",
+                        get_chapter_chain(),
+                        target_words=chapter_word_target(
+                            book, settings.STREAM_INDEX_ESTIMATED_CHAPTERS
+                        ),
+                        is_last=False,
+                    )
                 )
+                first_chapter = (entry, task)
+    except BaseException:
+        if first_chapter is not None:
+            await _discard_first_chapter(book_id, *first_chapter)
+        raise
 
-        # Cargar el libro existente
-        book_path = _get_book_path(state["book_id"])
-        with open(book_path, "r", encoding="utf-8") as f:
-            book_data = json.load(f)
+    return parser.text, first_chapter
 
-        # Actualizar el índice
-        book_data["index"] = index_dict
-        book_data["updated_at"] = datetime.now().isoformat()
 
-        # Guardar el libro actualizado
-        with open(book_path, "w", encoding="utf-8") as f:
-            json.dump(book_data, f, indent=2)
+async def _discard_first_chapter(
+    book_id: str, streamed_entry: BookChapter, task
+) -> None:
+    """
+    Descarta el primer capítulo anticipado: cancela su tarea y borra su texto
+    parcial, para que el flujo normal no lo retome.
+    """
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    _clear_partial_chapter(book_id, streamed_entry.id)
 
-        return {**state, "index": index_dict, "error": ""}
+
+async def _store_first_chapter(
+    book_id: str, book_index: BookIndex, streamed_entry: BookChapter, task
+) -> None:
+    """
+    Guarda el primer capítulo escrito durante el streaming del índice.
+
+    Se descarta, sin esperar a que termine, si su entrada no coincide con la
+    del índice validado (por ejemplo, tras una reparación), si el libro tiene
+    un único capítulo, que debía escribirse como final, o si su longitud
+    objetivo, calculada con `STREAM_INDEX_ESTIMATED_CHAPTERS`, se aleja de la
+    real más de `STREAM_INDEX_TARGET_TOLERANCE`; el flujo normal lo generará
+    de nuevo.
+    """
+    book = _get_book_index_without_content(book_id)
+    chapters = book_index.chapters
+    first = chapters[0]
+    estimated_words = chapter_word_target(
+        book, settings.STREAM_INDEX_ESTIMATED_CHAPTERS
+    )
+    target_words = chapter_word_target(book, len(chapters))
+    tolerance = target_words * settings.STREAM_INDEX_TARGET_TOLERANCE
+    if len(chapters) < 2 or (first.id, first.title, first.description) != (
+        streamed_entry.id,
+        streamed_entry.title,
+        streamed_entry.description,
+    ):
+        logger.info(f"Capítulo {streamed_entry.id} anticipado descartado")
+        await _discard_first_chapter(book_id, streamed_entry, task)
+        return
+    if abs(estimated_words - target_words) > tolerance:
+        logger.info(
+            f"Capítulo {streamed_entry.id} anticipado descartado: objetivo de "
+            f"{estimated_words} palabras frente a {target_words} con {len(chapters)} capítulos"
+        )
+        await _discard_first_chapter(book_id, streamed_entry, task)
+        return
+
+    try:
+        content = await task
     except Exception as e:
-        return {**state, "error": f"Error al generar el índice: {str(e)}"}
+        logger.warning(f"Falló la generación anticipada del primer capítulo: {e}")
+        await _discard_first_chapter(book_id, streamed_entry, task)
+        return
+
+    book.mark_processed(first.id)
+    _update_book_chapters(
+        book_id,
+        {first.id: content},
+        chapter_fields={first.id: {"input_hashes": chapter_input_hashes(chapters, 0)}},
+        processed_chapters=book.processed_chapters,
+    )
 
 
 async def generate_chapter(state: BookGenerationState) -> BookGenerationState:
@@ -134,178 +299,80 @@ async def generate_chapter(state: BookGenerationState) -> BookGenerationState:
     """
     try:
         # Verificar que se haya seleccionado un capítulo
-        book = state.get("book")
-        summary_book = state.get("summary_book", "")
+        book = _get_book_index_without_content(state["book_id"])
 
         if not book:
-            return {
-                **state,
-                "error": "No se ha inicializado el libro correctamente",
-            }
+            return {"error": "No se ha inicializado el libro correctamente"}
 
         current_chapter = state.get("current_chapter")
 
-        # Cargar el libro
-        book_path = _get_book_path(state["book_id"])
-        with open(book_path, "r", encoding="utf-8") as f:
-            book_data = json.load(f)
-
-        # Buscar el capítulo
-        chapter_found = False
-        chapter_title = ""
-        chapter_description = ""
-        is_last_chapter = False
+        # Buscar el capítulo y extraer su título y descripción
+        chapters = book.index.chapters
+        position = book.index.position(current_chapter)
 
-        # Extraemos el título y la descripción del capítulo
+        if position is None:
+            return {"error": f"No se encontró el capítulo con ID: {current_chapter}"}
+        book_chapter = chapters[position]
+        chapter_title = book_chapter.title
+        chapter_description = book_chapter.description
 
-        index = book.index
-        chapters = index["chapters"]
-        index_format = [
-            f"Capitulo{i+1}, Título: {chapter['title']}/n"
-            for i, chapter in enumerate(chapters)
-        ]
-
-        # Determinar si este es el último capítulo para darle un cierre adecuado
-        for i, chapter in enumerate(chapters):
-            if chapter["id"] == current_chapter:
-                chapter_found = True
-                chapter_title = chapter["title"]
-                chapter_description = chapter["description"]
-                current_chapter_num = i + 1
-                is_last_chapter = i == len(chapters) - 1
-                break
-
-        if not chapter_found:
-            return {
-                **state,
-                "error": f"No se encontró el capítulo con ID: {current_chapter}",
-            }
         if not chapter_title:
-            return {
-                **state,
-                "error": "El capítulo seleccionado no tiene título",
-            }
+            return {"error": "El capítulo seleccionado no tiene título"}
         if not chapter_description:
-            return {
-                **state,
-                "error": "El capítulo seleccionado no tiene descripción",
-            }
-
-        # Obtener el contenido del capítulo anterior para contexto
-
-        previous_chapters_summary = ""
-
-        completed_chapters = state.get("completed_chapters", [])
+            return {"error": "El capítulo seleccionado no tiene descripción"}
 
-        if len(completed_chapters) > 0:
-            # Si hay capítulos completados, extraer el contenido del último
-            previous_chapters_summary = "RESUMEN DE CAPÍTULOS ANTERIORES:\n"
-            for chapter in completed_chapters:
-                previous_chapters_summary += (
-                    f"Capítulo {chapter['id']}: {chapter['title']}\n"
-                )
-                previous_chapters_summary += f"{chapter['description']}\n\n"
+        # Resumen jerárquico previo al capítulo, de tamaño acotado
+        await _refresh_chapter_summaries(state["book_id"], book, until=position)
+        summary_book = render_summary_context(book, position)
 
-        # Añadir instrucciones especiales si es el último capítulo
-        chapter_context = ""
-        if is_last_chapter:
-            state["is_last_chapter"] = True
-            chapter_context += "\n\nEste es el último capítulo del libro, asegúrate de crear un final satisfactorio que cierre todas las tramas."
-
-        # Generar contenido con LLM
-        chapter_chain = get_chapter_chain()
-
-        response = await chapter_chain.ainvoke(
-            {
-                "title": book.title,
-                "synopsis": book.synopsis,
-                "book_style": book.book_style,
-                "chapter_title": chapter_title,
-                "chapter_description": chapter_description,
-                "summary_book": summary_book,
-                "index_format": index_format,
-                "chapter_context": chapter_context,
-                "current_chapter_num": current_chapter_num,
-                "TARGET_CHAPTER_WORDS": 300,
-            }
+        response_text = await _write_chapter_content(
+            book, chapters, position, summary_book, "", get_chapter_chain()
         )
 
-        if hasattr(response, "content"):
-            response_text = response.content
-        else:
-            response_text = response
-
         # Actualizar el capítulo en el libro
-        for chapter in index["chapters"]:
-            if chapter["id"] == current_chapter:
-                chapter["content"] = response_text
-                break
-        # Actualizar fecha
-        book.index = index
+        book_chapter.content = response_text
+        book_chapter.input_hashes = chapter_input_hashes(chapters, position)
         book.updated_at = datetime.now().isoformat()
-        book.processed_chapters.append(current_chapter)
-
-        # Guardar el libro actualizado
-        with open(book_path, "w", encoding="utf-8") as f:
-            f.write(book.model_dump_json(indent=2))
+        book.mark_processed(current_chapter)
+
+        # Guardar solo este capítulo, sin tocar el contenido del resto
+        _update_book_chapters(
+            state["book_id"],
+            {current_chapter: response_text},
+            chapter_fields={current_chapter: {"input_hashes": book_chapter.input_hashes}},
+            processed_chapters=book.processed_chapters,
+        )
 
-        return {
-            **state,
-            "error": "",
-        }
+        return {"error": ""}
 
     except Exception as e:
-        return {**state, "error": f"Error al generar el capítulo: {str(e)}"}
+        return {"error": f"Error al generar el capítulo: {str(e)}"}
 
 
 async def summarize_chapter_content(state: BookGenerationState) -> BookGenerationState:
     """
-    Resume el contenido de un capítulo utilizando el LLM.
+    Resume el contenido de un capítulo y actualiza el resumen jerárquico del libro.
     """
     try:
-        book = state.get("book")
+        book = _get_book_index_without_content(state["book_id"])
         current_chapter = state.get("current_chapter")
-        summary_book = state.get("summary_book", "")
 
         if not book:
-            return {
-                **state,
-                "error": "No se ha inicializado el libro correctamente",
-            }
-
-        # Extraemos el título y la descripción del capítulo
-        index = book.index
-        chapters = index["chapters"]
-
-        chapter_content = ""
-
-        for i, chapter in enumerate(chapters):
-            if chapter["id"] == current_chapter:
-                chapter_content = chapter.get("content", "")
-
-        summay_chapter_chain = get_summary_chapter_chain_chain(summary_book)
+            return {"error": "No se ha inicializado el libro correctamente"}
 
-        response = await summay_chapter_chain.ainvoke(
-            {
-                "title": book.title,
-                "synopsis": book.synopsis,
-                "book_style": book.book_style,
-                "chapter_content": chapter_content,
-                "summary_book": summary_book,
-            }
-        )
-
-        if hasattr(response, "content"):
-            response_text = response.content
-        else:
-            response_text = response
+        position = book.index.position(current_chapter)
+        if position is None:
+            return {"error": f"No se encontró el capítulo con ID: {current_chapter}"}
 
-        state["summary_book"] = response_text
+        # El índice se carga sin contenido: se resume el texto guardado del capítulo
+        chapter = book.index.chapters[position]
+        chapter.content = _get_chapter_content(state["book_id"], chapter.id)
+        await _summarize_into_book(state["book_id"], book, chapter)
 
-        return state
+        return {"error": ""}
 
     except Exception as e:
-        return {**state, "error": f"Error al continuar el capítulo: {str(e)}"}
+        return {"error": f"Error al continuar el capítulo: {str(e)}"}
 
 
 async def continue_chapter_generation(
@@ -313,54 +380,75 @@ async def continue_chapter_generation(
 ) -> BookGenerationState:
     """
     Continúa la generación de un capítulo existente utilizando el texto final como contexto.
+
+    Si el capítulo no tiene contenido pero sí texto parcial de una generación
+    interrumpida, se retoma desde ese texto hasta completar el objetivo de
+    palabras y el capítulo se marca como procesado.
     """
     try:
         # Verificar que se haya seleccionado un capítulo
         if not state["current_chapter"]:
             return {
-                **state,
                 "error": "No se ha seleccionado ningún capítulo para continuar generando",
             }
 
-        # Cargar el libro
-        book_path = _get_book_path(state["book_id"])
-        with open(book_path, "r", encoding="utf-8") as f:
-            book_data = json.load(f)
+        book = _get_book_index_without_content(state["book_id"])
+        if not book:
+            return {"error": "No se ha inicializado el libro correctamente"}
+        book_index = book.index
 
         # Buscar el capítulo y extraer contenido existente
-        current_content = ""
-        chapter_title = ""
-        chapter_description = ""
-        is_last_chapter = False
-
-        chapters = book_data["index"]["chapters"]
-        for i, chapter in enumerate(chapters):
-            if chapter["id"] == state["current_chapter"]:
-                chapter_title = chapter["title"]
-                chapter_description = chapter.get("description", "")
-                is_last_chapter = i == len(chapters) - 1
-                if "content" in chapter and chapter["content"]:
-                    current_content = chapter["content"]
-                break
+        chapters = book_index.chapters
+        position = book_index.position(state["current_chapter"])
 
-        if not chapter_title:
+        if position is None:
             return {
-                **state,
                 "error": f"No se encontró el capítulo con ID: {state['current_chapter']}",
             }
 
+        chapter = chapters[position]
+        chapter_title = chapter.title
+        chapter_description = chapter.description
+        is_last_chapter = position == len(chapters) - 1
+        current_content = _get_chapter_content(state["book_id"], chapter.id)
+        target_words = chapter_word_target(book)
+
+        resumed = False
+        if not current_content:
+            current_content = trim_to_sentence(
+                _read_partial_chapter(state["book_id"], chapter.id)
+            )
+            resumed = bool(current_content)
+            if resumed:
+                logger.info(
+                    f"Retomando el capítulo {chapter.id} desde el texto parcial "
+                    f"({len(current_content.split())}/{target_words} palabras)"
+                )
+
         if not current_content:
             return {
-                **state,
                 "error": "El capítulo seleccionado no tiene contenido para continuar",
             }
 
-        # Obtener el contenido del capítulo anterior para contexto
-        previous_chapter_content = state.get("previous_chapter_content", "")
-        chapter_context = ""
+        # Pasajes de capítulos anteriores relacionados con el capítulo y con
+        # el final del texto ya escrito
+        passages = retrieve_passages(
+            state["book_id"],
+            chapters,
+            position,
+            extra_query=trim_to_tokens(
+                current_content, settings.RETRIEVAL_CHUNK_TOKENS, keep="end"
+            ),
+        )
+        chapter_context = _PASSAGES_CONTEXT + passages if passages else ""
 
-        # Preparar el contexto usando el capítulo anterior
-        if previous_chapter_content and previous_chapter_content != current_content:
+        # Sin índice de pasajes, el contexto es el comienzo del capítulo anterior
+        previous_chapter_content = state.get("previous_chapter_content", "")
+        if (
+            not settings.RETRIEVAL_ENABLED
+            and previous_chapter_content
+            and previous_chapter_content != current_content
+        ):
             chapter_context = (
                 "Contenido del capítulo anterior (para mantener continuidad):\n"
                 + previous_chapter_content[:1500]
@@ -371,21 +459,50 @@ async def continue_chapter_generation(
         if is_last_chapter:
             chapter_context += "\n\nEste es el último capítulo del libro, asegúrate de crear un final satisfactorio que cierre todas las tramas."
 
-        # Generar continuación con LLM
-        chapter_extend_chain = get_chapter_extend_chain()
-
-        response = await chapter_extend_chain.ainvoke(
-            {
-                "title": state["title"],
-                "synopsis": state["synopsis"],
-                "chapter_title": chapter_title,
-                "chapter_description": chapter_description,
-                "index": state["index"],
-                "current_chapter_content": current_content,
-                "chapter_context": chapter_context,
-            }
+        # Enviar solo el índice compactado y la parte más reciente del capítulo
+        context = build_extend_context(chapters, position, current_content, passages)
+        logger.info(
+            f"Prompt de continuación del capítulo {state['current_chapter']}: "
+            f"índice {count_tokens(context['index'])} tokens, "
+            f"texto {count_tokens(context['current_chapter_content'])}/{count_tokens(current_content)} tokens, "
+            f"pasajes {count_tokens(passages)} tokens"
         )
 
+        if resumed:
+            # Solo falta lo que no llegó a generarse
+            target_words -= len(current_content.split())
+            if target_words < settings.CHAPTER_MIN_WORDS // 2:
+                _finish_resumed_chapter(state["book_id"], book, position, current_content)
+                return {"error": ""}
+
+        # Generar continuación con LLM
+        extend_inputs = {
+            "title": state["title"],
+            "synopsis": state["synopsis"],
+            "chapter_title": chapter_title,
+            "chapter_description": chapter_description,
+            "index": context["index"],
+            "current_chapter_content": context["current_chapter_content"],
+            "chapter_context": chapter_context,
+        }
+        if settings.GUARD_ENABLED:
+            partial = None
+            if resumed:
+                # La continuación se sigue guardando tras el texto ya recuperado
+                partial = PartialChapterWriter(state["book_id"], chapter.id)
+                partial.append(current_content + "\n\n")
+            response = await guarded_generate(
+                get_chapter_extend_chain(
+                    streaming=True, max_tokens=max_output_tokens(target_words)
+                ),
+                extend_inputs,
+                target_words,
+                f"continuación del capítulo {state['current_chapter']}",
+                partial=partial,
+            )
+        else:
+            response = await get_chapter_extend_chain().ainvoke(extend_inputs)
+
         if hasattr(response, "content"):
             continuation = response.content
         else:
@@ -394,78 +511,518 @@ async def continue_chapter_generation(
         # Actualizar el contenido del capítulo añadiendo la continuación
         new_content = current_content + "\n\n" + continuation
 
-        # Actualizar el capítulo en el libro
-        for chapter in book_data["index"]["chapters"]:
-            if chapter["id"] == state["current_chapter"]:
-                chapter["content"] = new_content
-                break
+        if resumed:
+            _finish_resumed_chapter(state["book_id"], book, position, new_content)
+            return {"error": ""}
 
-        # Actualizar fecha
-        book_data["updated_at"] = datetime.now().isoformat()
+        # Actualizar el capítulo en el libro y guardarlo
+        chapter.content = new_content
+        _update_book_chapters(state["book_id"], {chapter.id: new_content})
 
-        # Guardar el libro actualizado
-        with open(book_path, "w", encoding="utf-8") as f:
-            json.dump(book_data, f, indent=2)
+        return {"error": ""}
+    except Exception as e:
+        return {"error": f"Error al continuar el capítulo: {str(e)}"}
+
+
+def _finish_resumed_chapter(
+    book_id: str, book: Book, position: int, content: str
+) -> None:
+    """Guarda un capítulo retomado desde su texto parcial y lo marca como procesado."""
+    chapters = book.index.chapters
+    chapter = chapters[position]
+    chapter.content = content
+    chapter.input_hashes = chapter_input_hashes(chapters, position)
+    book.mark_processed(chapter.id)
+    _update_book_chapters(
+        book_id,
+        {chapter.id: content},
+        chapter_fields={chapter.id: {"input_hashes": chapter.input_hashes}},
+        processed_chapters=book.processed_chapters,
+    )
+
+
+def make_generate_chapters_sequential(chapter_graph):
+    """
+    Crea el nodo que genera los capítulos de uno en uno con `chapter_graph`.
 
-        return {
-            **state,
-            "index": book_data["index"],
-            "error": "",
+    Cada capítulo se procesa en una ejecución propia del subgrafo de capítulo,
+    de modo que el número de pasos del grafo principal no crece con la
+    longitud del libro y no se alcanza el límite de recursión.
+
+    Args:
+        chapter_graph: Subgrafo compilado que escribe (o continúa) y resume
+            el capítulo indicado en `current_chapter`.
+    """
+
+    async def generate_chapters_sequential(
+        state: BookGenerationState, config: RunnableConfig
+    ) -> BookGenerationState:
+        """
+        Genera en orden los capítulos pendientes del libro o, si el estado
+        indica `current_chapter`, solo ese capítulo.
+        """
+        try:
+            book = _get_book_index_without_content(state["book_id"])
+            if not book:
+                return {"error": "No se ha inicializado el libro correctamente"}
+
+            # Si no hay un índice, no podemos hacer nada
+            if not book.index.chapters:
+                return {"error": "No hay índice o capítulos para procesar"}
+
+            if state.get("current_chapter"):
+                chapter_ids = [state["current_chapter"]]
+            else:
+                chapter_ids = [
+                    chapter.id
+                    for chapter in book.index.chapters
+                    if not book.is_processed(chapter.id)
+                ]
+
+            for chapter_id in chapter_ids:
+                result = await chapter_graph.ainvoke(
+                    {
+                        "book_id": state["book_id"],
+                        "title": state.get("title", book.title),
+                        "synopsis": state.get("synopsis", book.synopsis),
+                        "book_style": state.get("book_style", book.book_style),
+                        "pages": state.get("pages", book.pages),
+                        "current_chapter": chapter_id,
+                        "error": "",
+                    },
+                    config,
+                )
+                if result.get("error"):
+                    return {"current_chapter": chapter_id, "error": result["error"]}
+
+            book = _get_book_index_without_content(state["book_id"])
+            book.is_completed = len(book.processed_chapters) == len(
+                book.index.chapters
+            )
+            _update_book_chapters(state["book_id"], {}, is_completed=book.is_completed)
+
+            return {
+                "current_chapter": chapter_ids[-1] if chapter_ids else "",
+                "error": "",
+            }
+        except Exception as e:
+            return {"error": f"Error al generar los capítulos: {str(e)}"}
+
+    return generate_chapters_sequential
+
+
+_PASSAGES_CONTEXT = "Pasajes anteriores relacionados con este capítulo (para mantener la continuidad):\n"
+_LAST_CHAPTER_CONTEXT = "\n\nEste es el último capítulo del libro, asegúrate de crear un final satisfactorio que cierre todas las tramas."
+
+
+async def _write_chapter_content(
+    book: Book,
+    chapters: List[BookChapter],
+    position: int,
+    summary_book: str,
+    chapter_context: str,
+    chapter_chain,
+    target_words: Optional[int] = None,
+    is_last: Optional[bool] = None,
+) -> str:
+    """
+    Genera el texto de un capítulo con el contexto ajustado al presupuesto.
+
+    La longitud objetivo se deriva de las páginas del libro; si supera
+    `SCENE_TARGET_WORDS`, el capítulo se escribe por escenas en paralelo.
+    `target_words` e `is_last` solo se indican cuando `chapters` no es aún
+    el índice completo.
+    """
+    chapter = chapters[position]
+    passages = retrieve_passages(book.id, chapters, position)
+    context = build_chapter_context(chapters, position, summary_book, passages)
+    logger.info(
+        f"Prompt del capítulo {chapter.id}: "
+        f"índice {count_tokens(context['index_format'])} tokens, "
+        f"resumen {count_tokens(context['summary_book'])}/{count_tokens(summary_book)} tokens, "
+        f"pasajes {count_tokens(passages)} tokens"
+    )
+    if passages:
+        chapter_context = _PASSAGES_CONTEXT + passages + chapter_context
+    if is_last is None:
+        is_last = position == len(chapters) - 1
+    if is_last:
+        chapter_context += _LAST_CHAPTER_CONTEXT
+
+    inputs = {
+        "title": book.title,
+        "synopsis": book.synopsis,
+        "book_style": book.book_style,
+        "chapter_title": chapter.title,
+        "chapter_description": chapter.description,
+        "summary_book": context["summary_book"],
+        "index_format": context["index_format"],
+        "chapter_context": chapter_context,
+        "current_chapter_num": position + 1,
+    }
+    target_words = target_words or chapter_word_target(book)
+    # Texto parcial para retomar el capítulo si el proceso se interrumpe
+    partial = PartialChapterWriter(book.id, chapter.id)
+    if scene_count(target_words) > 1:
+        return await write_chapter_by_scenes(
+            book, chapter, inputs, target_words, partial=partial
+        )
+
+    inputs["TARGET_CHAPTER_WORDS"] = target_words
+    if settings.GUARD_ENABLED:
+        return await guarded_generate(
+            get_chapter_chain(
+                streaming=True, max_tokens=max_output_tokens(target_words)
+            ),
+            inputs,
+            target_words,
+            f"capítulo {chapter.id}",
+            partial=partial,
+        )
+
+    response = await chapter_chain.ainvoke(inputs)
+    return response.content if hasattr(response, "content") else response
+
+
+async def _summarize_into_book(
+    book_id: str, book: Book, chapter: BookChapter, save_content: bool = False
+) -> None:
+    """
+    Resume un capítulo, actualiza el resumen jerárquico y guarda ambos en el libro.
+
+    Si el resumen guardado corresponde al contenido actual del capítulo, se
+    reutiliza sin llamar al LLM. El resumen jerárquico solo se guarda si ha
+    cambiado. Con `save_content`, el contenido del capítulo y los hashes de
+    sus entradas se guardan en la misma actualización que el resumen.
+    """
+    content = (chapter.content or "")
+    if is_summary_fresh(chapter, content):
+        logger.info(f"Resumen del capítulo {chapter.id} reutilizado")
+    else:
+        chapter.summary = await summarize_chapter(book, chapter)
+        chapter.summary_hash = content_hash(content)
+
+    fields = {"summary": chapter.summary, "summary_hash": chapter.summary_hash}
+    if save_content:
+        fields["input_hashes"] = chapter.input_hashes
+    book_fields = {}
+    if await update_summary_hierarchy(book):
+        book_fields["summary"] = book.summary.model_dump()
+    _update_book_chapters(
+        book_id,
+        {chapter.id: content} if save_content else {},
+        chapter_fields={chapter.id: fields},
+        **book_fields,
+    )
+
+
+async def _refresh_chapter_summaries(
+    book_id: str, book: Book, until: Optional[int] = None
+) -> None:
+    """
+    Resume los capítulos escritos cuyo resumen falta o no corresponde a su
+    contenido guardado, y actualiza el resumen jerárquico.
+
+    Se usa al reanudar un libro: los resúmenes guardados se reutilizan y solo
+    se recalculan los de capítulos nuevos o modificados. Solo se lee del
+    disco el contenido de esos capítulos.
+
+    Args:
+        book_id: ID del libro.
+        book: Libro cargado, cuyos capítulos se actualizan en memoria.
+        until: Posición del índice hasta la que se revisan los capítulos.
+    """
+    stale = [
+        chapter.model_copy(
+            update={"content": _get_chapter_content(book_id, chapter.id)}
+        )
+        for chapter in book.index.chapters[:until]
+        if chapter.content_hash
+        and not (chapter.summary and chapter.summary_hash == chapter.content_hash)
+    ]
+    semaphore = asyncio.Semaphore(settings.PARALLEL_CHAPTER_WIDTH)
+
+    async def summarize(chapter: BookChapter) -> str:
+        async with semaphore:
+            return await summarize_chapter(book, chapter)
+
+    summaries = await asyncio.gather(*(summarize(chapter) for chapter in stale))
+    chapter_fields = {
+        chapter.id: {
+            "summary": summary,
+            "summary_hash": content_hash(chapter.content),
         }
+        for chapter, summary in zip(stale, summaries)
+    }
+    for chapter_id, fields in chapter_fields.items():
+        chapter = book.index.get_chapter(chapter_id)
+        chapter.summary = fields["summary"]
+        chapter.summary_hash = fields["summary_hash"]
+
+    book_fields = {}
+    if await update_summary_hierarchy(book):
+        book_fields["summary"] = book.summary.model_dump()
+    if chapter_fields or book_fields:
+        if chapter_fields:
+            logger.info(f"Resúmenes recalculados: {list(chapter_fields)}")
+        _update_book_chapters(
+            book_id, {}, chapter_fields=chapter_fields, **book_fields
+        )
+
+
+async def generate_chapters_parallel(state: BookGenerationState) -> BookGenerationState:
+    """
+    Genera en paralelo todos los capítulos pendientes del libro.
+
+    Cada capítulo se escribe de forma independiente a partir del índice, que
+    actúa como contexto compartido; el número de capítulos simultáneos se
+    limita con PARALLEL_CHAPTER_WIDTH.
+    """
+    try:
+        book = _get_book_index_without_content(state["book_id"])
+        if not book:
+            return {"error": "No se ha inicializado el libro correctamente"}
+
+        chapters = book.index.chapters
+        pending = [
+            (position, chapter)
+            for position, chapter in enumerate(chapters)
+            if not book.is_processed(chapter.id)
+        ]
+
+        chapter_chain = get_chapter_chain()
+        semaphore = asyncio.Semaphore(settings.PARALLEL_CHAPTER_WIDTH)
+
+        async def write_chapter(position: int, chapter: BookChapter) -> None:
+            # El esquema del libro sustituye al resumen, que aún no existe
+            async with semaphore:
+                chapter.content = await _write_chapter_content(
+                    book,
+                    chapters,
+                    position,
+                    "",
+                    "Los capítulos de este libro se escriben en paralelo: respeta el "
+                    "índice para enlazar con lo que ocurre antes y después de este capítulo.",
+                    chapter_chain,
+                )
+            chapter.input_hashes = chapter_input_hashes(
+                chapters, position, with_previous_summary=False
+            )
+
+            book.mark_processed(chapter.id)
+            _update_book_chapters(
+                state["book_id"],
+                {chapter.id: chapter.content},
+                chapter_fields={chapter.id: {"input_hashes": chapter.input_hashes}},
+                processed_chapters=book.processed_chapters,
+            )
+
+        results = await asyncio.gather(
+            *(write_chapter(position, chapter) for position, chapter in pending),
+            return_exceptions=True,
+        )
+
+        failed = [
+            f"{chapter.id} ({result})"
+            for (_, chapter), result in zip(pending, results)
+            if isinstance(result, Exception)
+        ]
+        if failed:
+            return {"error": f"Error al generar los capítulos: {', '.join(failed)}"}
+
+        return {"error": ""}
+
     except Exception as e:
-        return {**state, "error": f"Error al continuar el capítulo: {str(e)}"}
+        return {"error": f"Error al generar los capítulos: {str(e)}"}
 
 
-async def connector_node(state: BookGenerationState):
+async def reduce_parallel_chapters(state: BookGenerationState) -> BookGenerationState:
     """
-    Nodo conector que selecciona el siguiente capítulo a procesar.
-    Si no hay capítulo actual, selecciona el primero.
-    Si ya hay un capítulo actual, selecciona el siguiente.
+    Paso de reducción tras la generación en paralelo.
+
+    Resume de forma concurrente los capítulos sin resumen vigente, construye
+    el resumen jerárquico del libro a partir de esos resúmenes y revisa la
+    coherencia entre capítulos, guardando las incidencias detectadas en el
+    libro.
     """
     try:
-        # Inicializar la lista de capítulos procesados si no existe
-        book = state.get("book")
+        book = _get_book_index_without_content(state["book_id"])
         if not book:
-            return {
-                **state,
-                "error": "No se ha inicializado el libro correctamente",
-            }
+            return {"error": "No se ha inicializado el libro correctamente"}
 
-        processed_chapters = book.processed_chapters
+        chapters = book.index.chapters
+        await _refresh_chapter_summaries(state["book_id"], book)
+        written = [chapter for chapter in chapters if chapter.summary]
 
-        # Si no hay un índice, no podemos hacer nada
-        if not book.index.get("chapters"):
-            return {
-                **state,
-                "error": "No hay índice o capítulos para procesar",
+        summary_book = "\n\n".join(
+            f"Capítulo {chapter.id} ({chapter.title}): {chapter.summary}"
+            for chapter in written
+        )
+
+        review_chain = get_consistency_review_chain()
+        response = await review_chain.ainvoke(
+            {
+                "title": book.title,
+                "synopsis": book.synopsis,
+                "chapter_summaries": summary_book,
             }
+        )
+        review_text = response.content if hasattr(response, "content") else response
+        try:
+            issues = json.loads(review_text).get("issues", [])
+        except (json.JSONDecodeError, AttributeError):
+            logger.warning("La revisión de coherencia no devolvió un JSON válido")
+            issues = []
+
+        if issues:
+            logger.warning(
+                f"Se detectaron {len(issues)} incoherencias entre capítulos: {issues}"
+            )
 
-        chapters = book.index["chapters"]
-        current_chapter = state.get("current_chapter")
+        book.consistency_issues = issues
+        book.is_completed = len(book.processed_chapters) == len(chapters)
+        _update_book_chapters(
+            state["book_id"],
+            {},
+            consistency_issues=issues,
+            is_completed=book.is_completed,
+        )
 
-        if not current_chapter and len(processed_chapters) == 0:
-            # Si no hay capítulo actual, seleccionamos el primero
-            current_chapter = chapters[0]["id"]
-            return {
-                **state,
-                "current_chapter": current_chapter,
-            }
+        return {"error": ""}
+
+    except Exception as e:
+        return {"error": f"Error en la revisión de coherencia: {str(e)}"}
+
+
+async def generate_chapters_pipelined(state: BookGenerationState) -> BookGenerationState:
+    """
+    Genera los capítulos en orden solapando cada resumen con el capítulo siguiente.
+
+    El capítulo N+1 empieza en cuanto el capítulo N está escrito, usando el
+    resumen disponible hasta N-1 más la descripción de N, mientras el resumen
+    de N se calcula en paralelo y se incorpora al resumen jerárquico antes
+    del capítulo N+2.
+    """
+    summary_task = None
+    try:
+        book = _get_book_index_without_content(state["book_id"])
+        if not book:
+            return {"error": "No se ha inicializado el libro correctamente"}
+
+        chapters = book.index.chapters
+        await _refresh_chapter_summaries(state["book_id"], book)
+        chapter_chain = get_chapter_chain()
+        previous_chapter = None
+
+        for position, chapter in enumerate(chapters):
+            if book.is_processed(chapter.id):
+                continue
+
+            # Resumen disponible: hasta N-1, más la descripción de N si su resumen sigue en curso
+            if summary_task is not None and summary_task.done():
+                summary_task.result()
+                summary_task = None
+
+            chapter_summary = render_summary_context(book, position)
+            if summary_task is not None and previous_chapter is not None:
+                chapter_summary += (
+                    f"\n\nCapítulo anterior ({previous_chapter.title}): "
+                    f"{previous_chapter.description}"
+                )
+
+            chapter.content = await _write_chapter_content(
+                book, chapters, position, chapter_summary, "", chapter_chain
+            )
+            chapter.input_hashes = chapter_input_hashes(
+                chapters, position, with_previous_summary=summary_task is None
+            )
+            book.mark_processed(chapter.id)
+            _update_book_chapters(
+                state["book_id"],
+                {chapter.id: chapter.content},
+                chapter_fields={chapter.id: {"input_hashes": chapter.input_hashes}},
+                processed_chapters=book.processed_chapters,
+            )
+
+            # Los arcos se cierran en orden: el resumen de N espera al de N-1
+            if summary_task is not None:
+                await summary_task
+            summary_task = asyncio.create_task(
+                _summarize_into_book(state["book_id"], book, chapter)
+            )
+            previous_chapter = chapter
 
-        # Seleccionar el siguiente capítulo no procesado
-        next_chapter = None
-        for chapter in chapters:
-            if chapter["id"] not in processed_chapters:
-                next_chapter = chapter["id"]
-                break
+        if summary_task is not None:
+            await summary_task
+            summary_task = None
 
-        # Si no hay siguiente capítulo, mantener el actual (por si era el último)
-        if next_chapter is None and len(chapters) > 0:
-            next_chapter = chapters[-1]["id"]
+        book.is_completed = len(book.processed_chapters) == len(chapters)
+        _update_book_chapters(state["book_id"], {}, is_completed=book.is_completed)
+
+        return {"error": ""}
+
+    except Exception as e:
+        if summary_task is not None:
+            summary_task.cancel()
+        return {"error": f"Error al generar los capítulos: {str(e)}"}
+
+
+async def regenerate_stale_chapters(state: BookGenerationState) -> BookGenerationState:
+    """
+    Regenera solo los capítulos escritos cuya entrada del índice ha cambiado.
+
+    Los capítulos cuyo único cambio es el resumen del capítulo anterior se
+    devuelven en `review_chapters` sin regenerarse, salvo que el estado
+    indique `include_review`: en ese caso se recorre el índice en orden y, al
+    regenerar un capítulo, se actualiza su resumen antes de revisar el
+    siguiente.
+    """
+    try:
+        book = _get_book_index_without_content(state["book_id"])
+        if not book:
+            return {"error": "No se ha inicializado el libro correctamente"}
+
+        chapters = book.index.chapters
+        await _refresh_chapter_summaries(state["book_id"], book)
+        chapter_chain = get_chapter_chain()
+        regenerated = []
+
+        for position, chapter in enumerate(chapters):
+            if not chapter.content_hash:
+                continue
+
+            dependencies = stale_dependencies(chapters, position)
+            if "index_entry" not in dependencies and not (
+                dependencies and state.get("include_review")
+            ):
+                continue
+
+            logger.info(
+                f"Capítulo {chapter.id} desactualizado ({', '.join(dependencies)}), regenerando"
+            )
+            chapter.content = await _write_chapter_content(
+                book,
+                chapters,
+                position,
+                render_summary_context(book, position),
+                "",
+                chapter_chain,
+            )
+            chapter.input_hashes = chapter_input_hashes(chapters, position)
+            # Contenido, hashes y resumen en una sola actualización
+            await _summarize_into_book(
+                state["book_id"], book, chapter, save_content=True
+            )
+            regenerated.append(chapter.id)
+
+        review = list(find_review_chapters(chapters))
+        logger.info(f"Capítulos regenerados: {regenerated}; a revisar: {review}")
 
         return {
-            **state,
-            "current_chapter": next_chapter,
-            "processed_chapters": processed_chapters,
+            "regenerated_chapters": regenerated,
+            "review_chapters": review,
+            "error": "",
         }
+
     except Exception as e:
-        return {**state, "error": f"Error en el nodo conector: {str(e)}"}
+        return {"error": f"Error al regenerar los capítulos: {str(e)}"}
@@ -0,0 +1,232 @@
+"""
+Vigilancia de la salida en streaming de las cadenas de capítulos.
+
+Los capítulos, escenas y continuaciones se reciben en streaming para poder
+cortarlos a tiempo cuando degeneran: si el texto supera el máximo de tokens
+derivado de su objetivo de palabras (`max_output_tokens`) o si el modelo
+entra en un bucle que repite la misma secuencia de palabras. Un bucle se
+reintenta una vez; si el reintento también degenera, o si el texto solo se
+ha alargado de más, se acepta el texto recortado hasta la última frase
+completa antes del problema.
+"""
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from books_gen.config import settings
+from books_gen.graphs.context import count_tokens
+from books_gen.tools.book_tools import PartialChapterWriter
+
+
+_WORD = re.compile(r"\S+")
+_NORMALIZE = re.compile(r"[^\w]+")
+_SENTENCE_END = re.compile(r"[.!?…][\"'»”)]*(?=\s|$)")
+
+
+def max_output_tokens(target_words: int) -> int:
+    """Máximo de tokens de salida para un texto de `target_words` palabras."""
+    return int(
+        target_words * settings.GUARD_TOKENS_PER_WORD * settings.GUARD_LENGTH_FACTOR
+    )
+
+
+class RepetitionDetector:
+    """
+    Detecta bucles de repetición en un texto que llega por fragmentos.
+
+    Cuenta las secuencias de `ngram_size` palabras (sin mayúsculas ni
+    puntuación); cuando una aparece `max_repeats` veces, el texto se considera
+    en bucle y `loop_start` indica el carácter donde empezó la primera
+    repetición.
+    """
+
+    def __init__(self, ngram_size: int, max_repeats: int) -> None:
+        self.ngram_size = ngram_size
+        self.max_repeats = max_repeats
+        self.text = ""
+        self.loop_start: Optional[int] = None
+        self._scanned = 0
+        self._words: List[Tuple[str, int]] = []
+        self._ngrams: Dict[Tuple[str, ...], List[int]] = {}
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Añade un fragmento de texto.
+
+        Returns:
+            bool: True si se ha detectado un bucle.
+        """
+        self.text += chunk
+        if self.loop_start is not None:
+            return True
+
+        for match in _WORD.finditer(self.text, self._scanned):
+            # La última palabra puede estar incompleta hasta el siguiente fragmento
+            if match.end() == len(self.text):
+                break
+            self._scanned = match.end()
+            word = _NORMALIZE.sub("", match.group().lower())
+            if not word:
+                continue
+            self._words.append((word, match.start()))
+            if len(self._words) < self.ngram_size:
+                continue
+
+            ngram = tuple(word for word, _ in self._words[-self.ngram_size :])
+            starts = self._ngrams.setdefault(ngram, [])
+            starts.append(len(self._words) - self.ngram_size)
+            if len(starts) >= self.max_repeats:
+                self.loop_start = self._words[starts[1]][1]
+                return True
+
+        return False
+
+
+def trim_to_sentence(text: str) -> str:
+    """Recorta el texto hasta el final de su última frase completa."""
+    ends = list(_SENTENCE_END.finditer(text))
+    if not ends:
+        return text.rstrip()
+    return text[: ends[-1].end()].rstrip()
+
+
+class OutputGuardStats:
+    """Contadores de las generaciones vigiladas, para `/stats`."""
+
+    def __init__(self) -> None:
+        self.generations = 0
+        self.degenerate = 0
+        self.runaway = 0
+        self.repetition = 0
+        self.retries = 0
+        self.accepted_trimmed = 0
+        self.tokens_discarded = 0
+        self.tokens_avoided = 0
+        self.seconds_saved = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        generations = self.generations or 1
+        return {
+            "generations": self.generations,
+            "degenerate": self.degenerate,
+            "degenerate_rate": self.degenerate / generations,
+            "runaway": self.runaway,
+            "repetition": self.repetition,
+            "retries": self.retries,
+            "accepted_trimmed": self.accepted_trimmed,
+            "tokens_discarded": self.tokens_discarded,
+            "tokens_avoided": self.tokens_avoided,
+            "seconds_saved": round(self.seconds_saved, 3),
+        }
+
+
+_stats = OutputGuardStats()
+
+
+def get_output_guard_stats() -> Dict[str, float]:
+    """Métricas acumuladas de la vigilancia de salida."""
+    return _stats.stats()
+
+
+async def _stream_once(
+    chain, inputs: Dict, max_tokens: int, partial: Optional[PartialChapterWriter]
+) -> Tuple[str, Optional[str]]:
+    """
+    Recibe una generación y la corta si degenera. Si se indica `partial`, el
+    texto recibido se va guardando en el archivo parcial del capítulo.
+
+    Returns:
+        El texto (recortado si se ha cortado) y el motivo del corte
+        ("runaway", "repetition") o None si terminó con normalidad.
+    """
+    detector = RepetitionDetector(
+        settings.GUARD_NGRAM_SIZE, settings.GUARD_NGRAM_MAX_REPEATS
+    )
+    started = time.perf_counter()
+    reason = None
+    tokens = 0
+    stream = chain.astream(inputs)
+    try:
+        async for chunk in stream:
+            piece = chunk.content if hasattr(chunk, "content") else chunk
+            tokens += count_tokens(piece)
+            if partial is not None:
+                partial.append(piece)
+            if detector.feed(piece):
+                reason = "repetition"
+                break
+            if tokens > max_tokens:
+                reason = "runaway"
+                break
+    finally:
+        await stream.aclose()
+        if partial is not None:
+            partial.flush()
+
+    if reason is None:
+        return detector.text, None
+
+    # El resto de la generación, hasta el máximo de tokens, no se espera
+    elapsed = time.perf_counter() - started
+    avoided = max(0, max_tokens - tokens)
+    _stats.tokens_avoided += avoided
+    if tokens and elapsed:
+        _stats.seconds_saved += avoided * elapsed / tokens
+
+    if reason == "repetition":
+        _stats.repetition += 1
+        text = trim_to_sentence(detector.text[: detector.loop_start])
+    else:
+        _stats.runaway += 1
+        text = trim_to_sentence(detector.text)
+    _stats.tokens_discarded += tokens - count_tokens(text)
+    return text, reason
+
+
+async def guarded_generate(
+    chain,
+    inputs: Dict,
+    target_words: int,
+    name: str,
+    partial: Optional[PartialChapterWriter] = None,
+) -> str:
+    """
+    Genera un texto en streaming cortándolo si se alarga de más o entra en bucle.
+
+    Args:
+        chain: Cadena en streaming (`streaming=True`) que devuelve el texto.
+        inputs: Variables del prompt.
+        target_words: Palabras objetivo del texto; fija el máximo de tokens.
+        name: Nombre del texto para los logs (por ejemplo "capítulo 3").
+        partial: Archivo parcial donde guardar el texto a medida que llega.
+
+    Returns:
+        El texto generado, recortado si ha degenerado.
+    """
+    max_tokens = max_output_tokens(target_words)
+    _stats.generations += 1
+
+    text, reason = await _stream_once(chain, inputs, max_tokens, partial)
+    if reason is None:
+        return text
+
+    _stats.degenerate += 1
+    logger.warning(
+        f"Generación de {name} cortada ({reason}) tras {count_tokens(text)} tokens útiles"
+    )
+    if reason == "repetition":
+        _stats.retries += 1
+        if partial is not None:
+            partial.reset()
+        retry_text, retry_reason = await _stream_once(
+            chain, inputs, max_tokens, partial
+        )
+        if retry_reason is None:
+            return retry_text
+        logger.warning(f"El reintento de {name} también se ha cortado ({retry_reason})")
+        text = max(text, retry_text, key=len)
+
+    _stats.accepted_trimmed += 1
+    return text
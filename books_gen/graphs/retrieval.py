@@ -0,0 +1,262 @@
+"""
+Recuperación de pasajes anteriores del libro para mantener la continuidad.
+
+Cada libro tiene un índice léxico local (BM25) sobre fragmentos de
+`RETRIEVAL_CHUNK_TOKENS` tokens de sus capítulos escritos. Antes de escribir
+o continuar un capítulo se buscan los pasajes de los capítulos anteriores
+más relacionados con su título y descripción, y se añaden al prompt. El
+índice se mantiene en memoria y se actualiza cada vez que se guarda el
+contenido de un capítulo.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from books_gen.config import settings
+from books_gen.graphs.context import count_tokens, trim_to_tokens
+from books_gen.graphs.summary import content_hash
+from books_gen.models.book_models import BookChapter
+from books_gen.tools.book_tools import (
+    _get_chapter_content,
+    _get_chapter_contents,
+    _get_content_hashes,
+    add_chapter_content_listener,
+)
+
+
+_TERM = re.compile(r"\w+")
+
+# Palabras vacías frecuentes en castellano, que no ayudan a distinguir pasajes
+_STOPWORDS = frozenset(
+    """
+    al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo
+    cada casi como con contra cual cuando del desde donde dos durante ella
+    ellas ello ellos entre era eran eres esa esas ese eso esos esta estaba
+    estaban estas este esto estos fue fueron habia han has hasta hay les los
+    mas mientras mis mucho muy nada ni nos nosotros otra otras otro otros para
+    pero poco por porque que quien sea ser sin sobre sus tambien tan tanto
+    todo todos tras una uno unos usted vez
+    """.split()
+)
+
+# Parámetros habituales de BM25
+_K1 = 1.5
+_B = 0.75
+
+# Libros cuyo índice se conserva en memoria
+_MAX_INDEXED_BOOKS = 32
+
+
+def _terms(text: str) -> List[str]:
+    """Términos de un texto: palabras sin tildes ni mayúsculas, sin palabras vacías."""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(char for char in normalized if not unicodedata.combining(char))
+    return [
+        term
+        for term in _TERM.findall(normalized)
+        if len(term) > 2 and term not in _STOPWORDS
+    ]
+
+
+def chunk_chapter(content: str, chunk_tokens: int) -> List[str]:
+    """Divide el texto de un capítulo en fragmentos de párrafos completos."""
+    chunks: List[str] = []
+    current: List[str] = []
+    used = 0
+    for paragraph in (part.strip() for part in content.split("\n\n")):
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if current and used + tokens > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, used = [], 0
+        current.append(paragraph)
+        used += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class PassageIndex:
+    """
+    Índice BM25 de los fragmentos de los capítulos de un libro.
+
+    Los capítulos se añaden o sustituyen de uno en uno; las frecuencias de
+    documento y la longitud media se actualizan de forma incremental.
+    """
+
+    def __init__(self, chunk_tokens: int) -> None:
+        self.chunk_tokens = chunk_tokens
+        self._hashes: Dict[str, str] = {}
+        self._chunks: Dict[str, List[Tuple[str, Counter, int]]] = {}
+        self._postings: Dict[str, Dict[Tuple[str, int], int]] = {}
+        self._total_length = 0
+        self._count = 0
+
+    def __contains__(self, chapter_id: str) -> bool:
+        return chapter_id in self._chunks
+
+    def chapter_ids(self) -> List[str]:
+        return list(self._chunks)
+
+    def indexed_hash(self, chapter_id: str) -> Optional[str]:
+        """Hash del contenido indexado del capítulo, o None si no está indexado."""
+        return self._hashes.get(chapter_id)
+
+    def update_chapter(self, chapter_id: str, content: str) -> bool:
+        """
+        Indexa el contenido de un capítulo si ha cambiado.
+
+        Returns:
+            bool: True si el capítulo se ha (re)indexado.
+        """
+        digest = content_hash(content)
+        if self._hashes.get(chapter_id) == digest:
+            return False
+
+        self.remove_chapter(chapter_id)
+        chunks = []
+        for number, text in enumerate(chunk_chapter(content, self.chunk_tokens)):
+            frequencies = Counter(_terms(text))
+            length = sum(frequencies.values())
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[(chapter_id, number)] = frequency
+            self._total_length += length
+            self._count += 1
+            chunks.append((text, frequencies, length))
+
+        self._chunks[chapter_id] = chunks
+        self._hashes[chapter_id] = digest
+        return True
+
+    def remove_chapter(self, chapter_id: str) -> None:
+        """Quita un capítulo del índice."""
+        for number, (_, frequencies, length) in enumerate(
+            self._chunks.pop(chapter_id, [])
+        ):
+            for term in frequencies:
+                postings = self._postings[term]
+                del postings[(chapter_id, number)]
+                if not postings:
+                    del self._postings[term]
+            self._total_length -= length
+            self._count -= 1
+        self._hashes.pop(chapter_id, None)
+
+    def search(
+        self, query: str, k: int, chapter_ids: Optional[List[str]] = None
+    ) -> List[Tuple[str, int, str]]:
+        """
+        Fragmentos más relevantes para `query`.
+
+        Args:
+            query: Texto de la consulta.
+            k: Número máximo de fragmentos.
+            chapter_ids: Capítulos en los que buscar; por defecto, todos.
+
+        Returns:
+            Lista de (ID del capítulo, número de fragmento, texto), de mayor a
+            menor puntuación.
+        """
+        if not self._count or k <= 0:
+            return []
+
+        allowed = set(chapter_ids) if chapter_ids is not None else None
+        average_length = self._total_length / self._count
+        scores: Dict[Tuple[str, int], float] = {}
+        for term in set(_terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (self._count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, frequency in postings.items():
+                if allowed is not None and key[0] not in allowed:
+                    continue
+                length = self._chunks[key[0]][key[1]][2]
+                scores[key] = scores.get(key, 0.0) + idf * frequency * (_K1 + 1) / (
+                    frequency + _K1 * (1 - _B + _B * length / average_length)
+                )
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            (chapter_id, number, self._chunks[chapter_id][number][0])
+            for (chapter_id, number), _ in best
+        ]
+
+
+_indexes: "OrderedDict[str, PassageIndex]" = OrderedDict()
+
+
+def _index_saved_chapter(book_id: str, chapter_id: str, content: str) -> None:
+    """Actualiza el índice en memoria del libro, si existe, con un capítulo recién guardado."""
+    index = _indexes.get(book_id)
+    if index is not None:
+        index.update_chapter(chapter_id, content)
+
+
+add_chapter_content_listener(_index_saved_chapter)
+
+
+def get_passage_index(book_id: str) -> PassageIndex:
+    """
+    Índice de pasajes del libro, actualizado con el contenido guardado.
+
+    El índice se construye leyendo del disco los capítulos escritos la
+    primera vez que se usa; después se actualiza al guardar cada capítulo.
+    Solo se vuelve a leer un capítulo si el hash de su contenido guardado no
+    coincide con el indexado, por ejemplo porque lo ha guardado otro proceso.
+    """
+    index = _indexes.pop(book_id, None)
+    if index is None or index.chunk_tokens != settings.RETRIEVAL_CHUNK_TOKENS:
+        index = PassageIndex(settings.RETRIEVAL_CHUNK_TOKENS)
+        for chapter_id, content in _get_chapter_contents(book_id).items():
+            index.update_chapter(chapter_id, content)
+    _indexes[book_id] = index
+    while len(_indexes) > _MAX_INDEXED_BOOKS:
+        _indexes.popitem(last=False)
+
+    written = _get_content_hashes(book_id)
+    for chapter_id in index.chapter_ids():
+        if chapter_id not in written:
+            index.remove_chapter(chapter_id)
+    for chapter_id, digest in written.items():
+        if index.indexed_hash(chapter_id) != digest:
+            index.update_chapter(chapter_id, _get_chapter_content(book_id, chapter_id))
+    return index
+
+
+def retrieve_passages(
+    book_id: str, chapters: List[BookChapter], position: int, extra_query: str = ""
+) -> str:
+    """
+    Pasajes de los capítulos anteriores relevantes para el capítulo en `position`.
+
+    La consulta es el título y la descripción del capítulo, más `extra_query`
+    (por ejemplo, el final del texto ya escrito al continuar un capítulo).
+
+    Returns:
+        Los pasajes, en el orden del libro y dentro de `RETRIEVAL_TOKEN_BUDGET`,
+        o "" si no hay ninguno.
+    """
+    if not settings.RETRIEVAL_ENABLED or position <= 0:
+        return ""
+
+    chapter = chapters[position]
+    previous = {
+        earlier.id: number for number, earlier in enumerate(chapters[:position])
+    }
+    results = get_passage_index(book_id).search(
+        f"{chapter.title} {chapter.description} {extra_query}",
+        settings.RETRIEVAL_TOP_K,
+        chapter_ids=list(previous),
+    )
+    if not results:
+        return ""
+
+    results.sort(key=lambda result: (previous[result[0]], result[1]))
+    passages = "\n\n".join(
+        f"[Capítulo {chapter_id}] {text}" for chapter_id, _, text in results
+    )
+    return trim_to_tokens(passages, settings.RETRIEVAL_TOKEN_BUDGET, keep="start")
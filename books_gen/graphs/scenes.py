@@ -0,0 +1,210 @@
+"""
+Generación de capítulos largos por escenas.
+
+La longitud objetivo de cada capítulo sale de `Book.pages`. Un capítulo que
+no cabe en una sola respuesta se planifica como una lista de escenas, que se
+escriben en paralelo con el mismo contexto del libro. Después, un paso de
+costura escribe un párrafo de transición entre cada par de escenas a partir
+solo de sus extremos, sin reenviar el capítulo completo.
+"""
+import asyncio
+import json
+import math
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from books_gen.config import settings
+from books_gen.graphs.chains import (
+    get_scene_chain,
+    get_scene_plan_chain,
+    get_scene_transition_chain,
+)
+from books_gen.graphs.context import trim_to_tokens
+from books_gen.graphs.output_guard import guarded_generate, max_output_tokens
+from books_gen.models.book_models import Book, BookChapter
+from books_gen.tools.book_tools import PartialChapterWriter
+
+
+# Tokens de cada escena que se muestran al escribir la transición
+_TRANSITION_EXCERPT_TOKENS = 150
+
+
+def _response_text(response) -> str:
+    return response.content if hasattr(response, "content") else response
+
+
+def chapter_word_target(book: Book, chapters: Optional[int] = None) -> int:
+    """
+    Palabras objetivo de cada capítulo según las páginas del libro.
+
+    Args:
+        book: Libro.
+        chapters: Número de capítulos, si el índice del libro aún no está completo.
+    """
+    chapters = chapters or len(book.index.chapters) or 1
+    return max(
+        settings.CHAPTER_MIN_WORDS, book.pages * settings.WORDS_PER_PAGE // chapters
+    )
+
+
+def scene_count(target_words: int) -> int:
+    """Número de escenas en que se divide un capítulo de `target_words` palabras."""
+    scenes = math.ceil(target_words / settings.SCENE_TARGET_WORDS)
+    return max(1, min(scenes, settings.SCENE_MAX_PER_CHAPTER))
+
+
+def _parse_scene_plan(text: str, chapter: BookChapter, count: int) -> List[str]:
+    """
+    Extrae los guiones de escena de la respuesta del planificador.
+
+    Si la respuesta no es válida o no tiene `count` escenas, se completa con
+    partes de la descripción del capítulo para no bloquear la generación.
+    """
+    try:
+        scenes = json.loads(text).get("scenes", [])
+        beats = [str(scene).strip() for scene in scenes if str(scene).strip()]
+    except (json.JSONDecodeError, AttributeError):
+        logger.warning(
+            f"El plan de escenas del capítulo {chapter.id} no es un JSON válido"
+        )
+        beats = []
+
+    beats = beats[:count]
+    for number in range(len(beats) + 1, count + 1):
+        beats.append(f"{chapter.description} (parte {number} de {count})")
+    return beats
+
+
+async def plan_scenes(
+    book: Book, chapter: BookChapter, inputs: Dict, count: int
+) -> List[str]:
+    """
+    Divide el capítulo en `count` escenas consecutivas.
+
+    Args:
+        book: Libro al que pertenece el capítulo.
+        chapter: Capítulo a planificar.
+        inputs: Variables comunes del prompt del capítulo (contexto del libro).
+        count: Número de escenas.
+    """
+    response = await get_scene_plan_chain().ainvoke({**inputs, "scene_count": count})
+    return _parse_scene_plan(_response_text(response), chapter, count)
+
+
+async def stitch_scenes(book: Book, chapter: BookChapter, scenes: List[str]) -> str:
+    """
+    Une las escenas con un párrafo de transición entre cada par consecutivo.
+
+    Cada transición solo recibe el final de una escena y el comienzo de la
+    siguiente, así que las transiciones se piden todas a la vez y su coste no
+    depende de la longitud del capítulo.
+    """
+    if len(scenes) < 2:
+        return "\n\n".join(scenes)
+
+    transition_chain = get_scene_transition_chain()
+    responses = await asyncio.gather(
+        *(
+            transition_chain.ainvoke(
+                {
+                    "title": book.title,
+                    "book_style": book.book_style,
+                    "chapter_title": chapter.title,
+                    "previous_scene_end": trim_to_tokens(
+                        previous, _TRANSITION_EXCERPT_TOKENS, keep="end"
+                    ),
+                    "next_scene_start": trim_to_tokens(
+                        following, _TRANSITION_EXCERPT_TOKENS, keep="start"
+                    ),
+                    "TRANSITION_WORDS": settings.SCENE_TRANSITION_WORDS,
+                }
+            )
+            for previous, following in zip(scenes, scenes[1:])
+        )
+    )
+
+    parts = [scenes[0]]
+    for response, scene in zip(responses, scenes[1:]):
+        transition = _response_text(response).strip()
+        if transition:
+            parts.append(transition)
+        parts.append(scene)
+    return "\n\n".join(part.strip() for part in parts)
+
+
+async def write_chapter_by_scenes(
+    book: Book,
+    chapter: BookChapter,
+    inputs: Dict,
+    target_words: int,
+    partial: Optional[PartialChapterWriter] = None,
+) -> str:
+    """
+    Escribe un capítulo largo por escenas: plan, escenas en paralelo y costura.
+
+    Args:
+        book: Libro al que pertenece el capítulo.
+        chapter: Capítulo a escribir.
+        inputs: Variables comunes del prompt del capítulo (contexto del libro).
+        target_words: Palabras objetivo del capítulo.
+        partial: Archivo parcial del capítulo; se guardan en orden las
+            escenas terminadas a partir de la primera.
+
+    Returns:
+        El texto del capítulo.
+    """
+    count = scene_count(target_words)
+    beats = await plan_scenes(book, chapter, inputs, count)
+    scene_plan = "\n".join(f"{number}. {beat}" for number, beat in enumerate(beats, 1))
+    scene_words = math.ceil(target_words / count)
+
+    if settings.GUARD_ENABLED:
+        scene_chain = get_scene_chain(
+            streaming=True, max_tokens=max_output_tokens(scene_words)
+        )
+    else:
+        scene_chain = get_scene_chain()
+    semaphore = asyncio.Semaphore(settings.SCENE_PARALLEL_WIDTH)
+    finished: Dict[int, str] = {}
+    next_to_save = 1
+
+    def save_finished_prefix() -> None:
+        nonlocal next_to_save
+        while next_to_save in finished:
+            partial.append(finished[next_to_save] + "\n\n")
+            next_to_save += 1
+        partial.flush()
+
+    async def write_scene(number: int, beat: str) -> str:
+        scene_inputs = {
+            **inputs,
+            "scene_plan": scene_plan,
+            "scene_num": number,
+            "scene_count": count,
+            "scene_beat": beat,
+            "TARGET_SCENE_WORDS": scene_words,
+        }
+        async with semaphore:
+            if settings.GUARD_ENABLED:
+                text = await guarded_generate(
+                    scene_chain,
+                    scene_inputs,
+                    scene_words,
+                    f"escena {number} del capítulo {chapter.id}",
+                )
+            else:
+                text = _response_text(await scene_chain.ainvoke(scene_inputs))
+
+        if partial is not None:
+            finished[number] = text
+            save_finished_prefix()
+        return text
+
+    scenes = await asyncio.gather(
+        *(write_scene(number, beat) for number, beat in enumerate(beats, 1))
+    )
+    logger.info(
+        f"Capítulo {chapter.id} escrito en {count} escenas de ~{scene_words} palabras"
+    )
+    return await stitch_scenes(book, chapter, scenes)
@@ -0,0 +1,76 @@
+"""
+Detección de capítulos desactualizados.
+
+Al escribir un capítulo se guardan los hashes de las entradas de las que
+depende (`input_hashes`): su entrada del índice (título y descripción) y, si
+formó parte del contexto, el resumen del capítulo anterior. Un capítulo está
+desactualizado cuando su entrada del índice ya no coincide con el libro; si
+solo ha cambiado el resumen anterior, queda pendiente de revisión.
+"""
+from typing import Dict, List
+
+from books_gen.graphs.summary import content_hash
+from books_gen.models.book_models import BookChapter
+
+
+def index_entry_hash(chapter: BookChapter) -> str:
+    """Hash de la entrada del índice de un capítulo."""
+    return content_hash(f"{chapter.title}\n{chapter.description}")
+
+
+def chapter_input_hashes(
+    chapters: List[BookChapter], position: int, with_previous_summary: bool = True
+) -> Dict[str, str]:
+    """
+    Hashes de las entradas usadas para escribir el capítulo en `position`.
+
+    Args:
+        chapters: Capítulos del índice.
+        position: Posición del capítulo en el índice.
+        with_previous_summary: False si el resumen del capítulo anterior no
+            formaba parte del contexto (generación en paralelo o resumen aún
+            en curso), en cuyo caso no se registra como dependencia.
+    """
+    hashes = {"index_entry": index_entry_hash(chapters[position])}
+    if with_previous_summary and position > 0 and chapters[position - 1].summary:
+        hashes["previous_summary"] = content_hash(chapters[position - 1].summary)
+    return hashes
+
+
+def stale_dependencies(chapters: List[BookChapter], position: int) -> List[str]:
+    """Entradas del capítulo en `position` que han cambiado desde que se escribió."""
+    recorded = chapters[position].input_hashes or {}
+    current = chapter_input_hashes(chapters, position)
+    return [name for name, value in recorded.items() if current.get(name) != value]
+
+
+def find_stale_chapters(chapters: List[BookChapter]) -> Dict[str, List[str]]:
+    """
+    Capítulos desactualizados: los que cambiaron su entrada del índice.
+
+    Solo se revisan los capítulos con hashes registrados. Son los que se
+    regeneran con `regenerate_stale_chapters`.
+    """
+    stale = {}
+    for position, chapter in enumerate(chapters):
+        dependencies = stale_dependencies(chapters, position)
+        if "index_entry" in dependencies:
+            stale[chapter.id] = dependencies
+    return stale
+
+
+def find_review_chapters(chapters: List[BookChapter]) -> Dict[str, List[str]]:
+    """
+    Capítulos a revisar: su entrada del índice no ha cambiado, pero sí el
+    resumen del capítulo anterior con el que se escribieron.
+
+    Al regenerar un capítulo cambia su resumen, así que el siguiente aparece
+    aquí. No se regeneran salvo que se pida expresamente, para que editar un
+    capítulo no obligue a reescribir el resto del libro.
+    """
+    review = {}
+    for position, chapter in enumerate(chapters):
+        dependencies = stale_dependencies(chapters, position)
+        if dependencies and "index_entry" not in dependencies:
+            review[chapter.id] = dependencies
+    return review
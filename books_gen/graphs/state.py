@@ -5,9 +5,16 @@ from books_gen.models.book_models import Book, BookStyle, BookChapter
 
 # Definimos los estados para nuestro grafo
 class BookGenerationState(MessagesState):
-    """Estado para el proceso de generación de libro."""
+    """
+    Estado para el proceso de generación de libro.
 
-    book: Book
+    Solo lleva identificadores y valores pequeños: el índice, los resúmenes y
+    el contenido de los capítulos se leen del archivo del libro cuando un
+    nodo los necesita, para que cada checkpoint ocupe lo mismo sea cual sea la
+    longitud del libro. `book` solo se usa como entrada al crear un libro.
+    """
+
+    book: Optional[Book]
     book_id: Optional[str]
     title: str
     synopsis: str
@@ -16,6 +23,10 @@ class BookGenerationState(MessagesState):
     current_chapter: str
     generated_content: dict
     previous_chapter_content: str
-    is_last_chapter: bool
+    has_index: bool
     error: str
-    summary_book: str
+    generation_mode: str
+    generate_chapters: bool
+    regenerated_chapters: List[str]
+    include_review: bool
+    review_chapters: List[str]
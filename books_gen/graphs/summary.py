@@ -0,0 +1,166 @@
+"""
+Resumen jerárquico del libro.
+
+En lugar de un único resumen que crece con cada capítulo, el libro guarda
+tres niveles acotados: el resumen de cada capítulo, el de cada arco
+(`SUMMARY_ARC_CHAPTERS` capítulos consecutivos) y una sinopsis global que
+incorpora los arcos cerrados de uno en uno. El contexto de un capítulo se
+compone con la sinopsis global, el último arco cerrado y los resúmenes de
+los capítulos anteriores del arco actual, de modo que su tamaño no depende
+del número de capítulos del libro.
+"""
+import hashlib
+from typing import List
+
+from books_gen.config import settings
+from books_gen.graphs.chains import (
+    get_chapter_summary_chain,
+    get_arc_summary_chain,
+    get_synopsis_update_chain,
+)
+from books_gen.graphs.context import trim_to_tokens
+from books_gen.models.book_models import ArcSummary, Book, BookChapter
+
+
+def _response_text(response) -> str:
+    return response.content if hasattr(response, "content") else response
+
+
+def content_hash(text: str) -> str:
+    """Hash estable de un texto, para detectar cambios en el contenido."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def is_summary_fresh(chapter: BookChapter, content: str) -> bool:
+    """Indica si el resumen guardado del capítulo corresponde a `content`."""
+    return bool(chapter.summary) and chapter.summary_hash == content_hash(
+        content
+    )
+
+
+def chapter_arcs(chapters: List[BookChapter]) -> List[List[BookChapter]]:
+    """Agrupa los capítulos del índice en arcos consecutivos."""
+    size = settings.SUMMARY_ARC_CHAPTERS
+    return [chapters[start : start + size] for start in range(0, len(chapters), size)]
+
+
+def render_summary_context(book: Book, position: int) -> str:
+    """
+    Resumen acotado del libro previo al capítulo en `position`.
+
+    Incluye la sinopsis global, el resumen del arco anterior y los resúmenes
+    de los capítulos ya resumidos del arco actual.
+    """
+    chapters = book.index.chapters
+    size = settings.SUMMARY_ARC_CHAPTERS
+    arc_start = position - position % size
+    parts = []
+
+    if book.summary.synopsis:
+        parts.append(f"Resumen del libro: {book.summary.synopsis}")
+
+    if arc_start > 0:
+        previous_ids = [chapter.id for chapter in chapters[arc_start - size : arc_start]]
+        for arc in book.summary.arcs:
+            if arc.chapter_ids == previous_ids:
+                parts.append(f"Arco anterior: {arc.summary}")
+                break
+
+    for chapter in chapters[arc_start:position]:
+        if chapter.summary:
+            parts.append(
+                f"Capítulo {chapter.id} ({chapter.title}): {chapter.summary}"
+            )
+
+    return "\n\n".join(parts)
+
+
+async def summarize_chapter(book: Book, chapter: BookChapter) -> str:
+    """Resume un capítulo, recortando el resultado a `SUMMARY_CHAPTER_TOKENS`."""
+    response = await get_chapter_summary_chain().ainvoke(
+        {
+            "title": book.title,
+            "synopsis": book.synopsis,
+            "book_style": book.book_style,
+            "chapter_title": chapter.title,
+            "chapter_content": chapter.content or "",
+        }
+    )
+    return trim_to_tokens(
+        _response_text(response), settings.SUMMARY_CHAPTER_TOKENS, keep="start"
+    )
+
+
+async def update_summary_hierarchy(book: Book) -> bool:
+    """
+    Cierra los arcos cuyos capítulos ya están resumidos e incorpora los
+    nuevos arcos a la sinopsis global.
+
+    Los arcos se recorren en orden y se detiene en el primero incompleto. Si
+    los capítulos de un arco ya cerrado o sus resúmenes han cambiado, se
+    descartan ese arco y los siguientes y la sinopsis global se reconstruye.
+
+    Returns:
+        bool: True si el resumen jerárquico ha cambiado.
+    """
+    summary = book.summary
+    size = settings.SUMMARY_ARC_CHAPTERS
+    changed = False
+
+    for number, chapters in enumerate(chapter_arcs(book.index.chapters)):
+        if len(chapters) < size or not all(chapter.summary for chapter in chapters):
+            break
+
+        chapter_summaries = "\n\n".join(
+            f"Capítulo {chapter.id} ({chapter.title}): {chapter.summary}"
+            for chapter in chapters
+        )
+        chapter_ids = [chapter.id for chapter in chapters]
+        source_hash = content_hash(chapter_summaries)
+        if (
+            number < len(summary.arcs)
+            and summary.arcs[number].chapter_ids == chapter_ids
+            and summary.arcs[number].source_hash == source_hash
+        ):
+            continue
+
+        del summary.arcs[number:]
+        if summary.synopsis_arcs > number:
+            summary.synopsis = ""
+            summary.synopsis_arcs = 0
+
+        response = await get_arc_summary_chain().ainvoke(
+            {
+                "title": book.title,
+                "synopsis": book.synopsis,
+                "chapter_summaries": chapter_summaries,
+            }
+        )
+        summary.arcs.append(
+            ArcSummary(
+                chapter_ids=chapter_ids,
+                source_hash=source_hash,
+                summary=trim_to_tokens(
+                    _response_text(response), settings.SUMMARY_ARC_TOKENS, keep="start"
+                ),
+            )
+        )
+        changed = True
+
+    synopsis_chain = get_synopsis_update_chain()
+    for arc in summary.arcs[summary.synopsis_arcs :]:
+        response = await synopsis_chain.ainvoke(
+            {
+                "title": book.title,
+                "synopsis": book.synopsis,
+                "summary_book": summary.synopsis,
+                "arc_summary": arc.summary,
+            }
+        )
+        summary.synopsis = trim_to_tokens(
+            _response_text(response), settings.SUMMARY_SYNOPSIS_TOKENS, keep="start"
+        )
+        summary.synopsis_arcs += 1
+        changed = True
+
+    return changed
@@ -1,26 +1,53 @@
 """
 API para la generación de libros.
 """
-import json
 import os
+import secrets
+import time
 import uuid
 from datetime import datetime
-from typing import Dict, List, Optional, Union, Any
+from typing import Dict, List, Literal, Optional, Union, Any
 from langchain.schema import HumanMessage, AIMessage
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.store.memory import InMemoryStore
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Header, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 
-from books_gen.models.book_models import BookInitRequest, Book, DownloadBookRequest, BookContentRequest
+from books_gen.models.book_models import BookInitRequest, Book, DownloadBookRequest, BookContentRequest, GenerationMode, ChapterIndexUpdate
 from books_gen.graphs.graph import create_book_generation_graph
-from books_gen.tools.book_tools import _get_book_path
+from books_gen.graphs.staleness import find_review_chapters, find_stale_chapters
+from books_gen.graphs.output_guard import get_output_guard_stats
+from books_gen.tools.book_tools import (
+    _add_book_usage,
+    _get_book_index_without_content,
+    _get_book_path,
+    _load_book,
+    _load_book_data,
+    _update_book_chapters,
+)
 from books_gen.config import settings
 from books_gen.graphs.state import BookGenerationState
 from books_gen.infrastructure.api.utils import convert_markdown_to_download_file
+from books_gen.infrastructure.llm.cache import get_llm_cache_stats
+from books_gen.infrastructure.llm.policy import get_llm_call_policy
+from books_gen.infrastructure.llm.timeline import TimelineTracker
+from books_gen.infrastructure.profiling import (
+    ARTIFACTS,
+    get_profile_dir,
+    list_profiles,
+    profile_job,
+)
+from books_gen.infrastructure.llm.usage import UsageTracker, merge_usage
+from books_gen.infrastructure.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    REGISTRY,
+    CollectedMetric,
+)
+from books_gen.tools.io_stats import get_io_stats, track_io
 
 # Crear la aplicación FastAPI
 app = FastAPI(
@@ -45,6 +72,167 @@ app.mount("/infrastructure/static", StaticFiles(directory=static_dir), name="sta
 # Almacén para los trabajos en segundo plano
 background_jobs = {}
 
+# Línea temporal de la ejecución de cada trabajo, por ID de trabajo
+job_timelines: Dict[str, TimelineTracker] = {}
+
+
+def _register_timeline(job_id: str) -> TimelineTracker:
+    """
+    Crea la línea temporal de un trabajo.
+
+    Se conservan las de los últimos JOB_TIMELINE_MAX_JOBS trabajos: al
+    superarse, se descartan las más antiguas de trabajos ya terminados.
+    """
+    timeline = TimelineTracker()
+    job_timelines[job_id] = timeline
+    excess = len(job_timelines) - settings.JOB_TIMELINE_MAX_JOBS
+    for old_job_id in list(job_timelines):
+        if excess <= 0:
+            break
+        if background_jobs.get(old_job_id, {}).get("status") not in (None, "running"):
+            del job_timelines[old_job_id]
+            excess -= 1
+    return timeline
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Registra la latencia y el estado de cada petición, por ruta."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # La plantilla de la ruta (/books/{book_id}), no la URL, para acotar las etiquetas
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start, method=request.method, route=route
+        )
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=str(status))
+
+
+def profiling_requested(
+    profile: bool = False,
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None),
+) -> bool:
+    """
+    Indica si el trabajo se perfila: siempre con PROFILING_ENABLED, o si la
+    petición incluye `?profile=true` o la cabecera `X-Profile: 1` junto con
+    un `X-Admin-Token` válido.
+    """
+    if settings.PROFILING_ENABLED:
+        return True
+    if not (profile or (x_profile or "").lower() in ("1", "true", "yes")):
+        return False
+    if not settings.ADMIN_TOKEN or not secrets.compare_digest(
+        x_admin_token or "", settings.ADMIN_TOKEN
+    ):
+        raise HTTPException(
+            status_code=403,
+            detail="El perfilado bajo demanda requiere un X-Admin-Token válido",
+        )
+    return True
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Exige la cabecera `X-Admin-Token`. Sin ADMIN_TOKEN configurado los
+    endpoints de administración no están disponibles.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_admin_token or "", settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Token de administración no válido")
+
+
+def _collect_metrics() -> List[CollectedMetric]:
+    """Métricas que se leen del estado de los trabajos, la caché, la política y el almacenamiento."""
+    jobs = CollectedMetric(
+        "books_gen_jobs",
+        "gauge",
+        "Trabajos en segundo plano por estado (queued: registrados y aún sin empezar).",
+    )
+    states = {"queued": 0, "running": 0, "completed": 0, "error": 0}
+    for job_id, job in list(background_jobs.items()):
+        state = job.get("status", "error")
+        if state == "running" and job_id not in job_timelines:
+            state = "queued"
+        states[state] = states.get(state, 0) + 1
+    for state, count in states.items():
+        jobs.add(count, state=state)
+
+    metrics = [jobs]
+
+    cache = get_llm_cache_stats()
+    if cache.get("enabled"):
+        metrics.append(
+            CollectedMetric(
+                "books_gen_llm_cache_lookups_total",
+                "counter",
+                "Consultas a la caché de respuestas del LLM por resultado.",
+            )
+            .add(cache["hits"], result="hit")
+            .add(cache["misses"], result="miss")
+        )
+        metrics.append(
+            CollectedMetric(
+                "books_gen_llm_cache_hit_ratio",
+                "gauge",
+                "Proporción de aciertos de la caché de respuestas del LLM.",
+            ).add(cache["hit_rate"])
+        )
+        metrics.append(
+            CollectedMetric(
+                "books_gen_llm_cache_size_bytes",
+                "gauge",
+                "Bytes ocupados por la caché de respuestas del LLM.",
+            ).add(cache["size_bytes"])
+        )
+
+    policy = get_llm_call_policy().stats()
+    policy_events = CollectedMetric(
+        "books_gen_llm_policy_events_total",
+        "counter",
+        "Eventos de la política de llamadas al LLM (reintentos, timeouts, rechazos...).",
+    )
+    for event in ("calls", "retries", "timeouts", "failures", "rejected", "hedges", "hedge_wins"):
+        policy_events.add(policy[event], event=event)
+    breakers = CollectedMetric(
+        "books_gen_llm_circuit_open",
+        "gauge",
+        "1 si el circuit breaker del modelo no está cerrado.",
+    )
+    for model, breaker in policy["circuit_breakers"].items():
+        breakers.add(int(breaker["state"] != "closed"), model=model)
+    metrics.extend([policy_events, breakers])
+
+    io = get_io_stats()
+    metrics.append(
+        CollectedMetric(
+            "books_gen_storage_bytes_total",
+            "counter",
+            "Bytes leídos y escritos en los archivos de los libros.",
+        )
+        .add(io["bytes_read"], direction="read")
+        .add(io["bytes_written"], direction="write")
+    )
+    metrics.append(
+        CollectedMetric(
+            "books_gen_storage_operations_total",
+            "counter",
+            "Lecturas y escrituras de los archivos de los libros.",
+        )
+        .add(io["reads"], direction="read")
+        .add(io["writes"], direction="write")
+    )
+    return metrics
+
+
+REGISTRY.register_collector(_collect_metrics)
+
 
 def __format_messages(
     messages: Union[str, list[dict[str, Any]]]
@@ -93,19 +281,16 @@ def list_books():
     books = []
     for filename in os.listdir(settings.BOOKS_DIR):
         if filename.endswith(".json"):
-            with open(
-                os.path.join(settings.BOOKS_DIR, filename), "r", encoding="utf-8"
-            ) as f:
-                book_data = json.load(f)
-                books.append(
-                    {
-                        "id": book_data["id"],
-                        "title": book_data["title"],
-                        "synopsis": book_data["synopsis"],
-                        "created_at": book_data["created_at"],
-                        "updated_at": book_data["updated_at"],
-                    }
-                )
+            book_data = _load_book_data(filename[: -len(".json")])
+            books.append(
+                {
+                    "id": book_data["id"],
+                    "title": book_data["title"],
+                    "synopsis": book_data["synopsis"],
+                    "created_at": book_data["created_at"],
+                    "updated_at": book_data["updated_at"],
+                }
+            )
 
     return books
 
@@ -115,18 +300,19 @@ def get_book(book_id: str):
     """
     Obtiene los detalles de un libro específico.
     """
-    book_path = _get_book_path(book_id)
-    if not os.path.exists(book_path):
+    book_data = _load_book_data(book_id, with_content=True)
+    if book_data is None:
         raise HTTPException(status_code=404, detail=f"Libro no encontrado: {book_id}")
 
-    with open(book_path, "r", encoding="utf-8") as f:
-        book_data = json.load(f)
-
     return book_data
 
 
 @app.post("/books/index")
-async def create_book_index(request: BookInitRequest, background_tasks: BackgroundTasks):
+async def create_book_index(
+    request: BookInitRequest,
+    background_tasks: BackgroundTasks,
+    profile: bool = Depends(profiling_requested),
+):
     """
     Crea un nuevo libro e inicia el proceso de generación de índice.
     """
@@ -174,6 +360,8 @@ async def create_book_index(request: BookInitRequest, background_tasks: Backgrou
         generated_content={},
         previous_chapter_content="",
         error="",
+        generate_chapters=request.generate_chapters,
+        generation_mode=request.generation_mode or settings.GENERATION_MODE,
     )
     thread_id = 1
     
@@ -183,21 +371,27 @@ async def create_book_index(request: BookInitRequest, background_tasks: Backgrou
 
     # Ejecutar el grafo en segundo plano hasta el punto de generación del índice
     async def run_graph_task():
+        usage_tracker = UsageTracker()
+        timeline = _register_timeline(job_id)
         try:
             # Inicializar y generar el índice
-            output_state = await book_app.ainvoke(
-                input={**initial_state_book},
-                config=config
-                )
+            with track_io(timeline.io), profile_job(job_id, profile):
+                output_state = await book_app.ainvoke(
+                    input={**initial_state_book},
+                    config={**config, "callbacks": [usage_tracker, timeline]}
+                    )
             
             print(f"Estado de salida: {output_state}")
 
+            usage = usage_tracker.summary()
             background_jobs[job_id] = {
                 "status": "completed" if not output_state.get("error") else "error",
                 "error": output_state.get("error", ""),
                 "book_id": output_state.get("book_id", ""),
                 "completed_at": datetime.now().isoformat(),
+                "usage": usage,
             }
+            _add_book_usage(output_state.get("book_id", ""), usage)
 
             return output_state
 
@@ -206,6 +400,7 @@ async def create_book_index(request: BookInitRequest, background_tasks: Backgrou
                 "status": "error",
                 "error": str(e),
                 "completed_at": datetime.now().isoformat(),
+                "usage": usage_tracker.summary(),
             }
 
     # Iniciar la tarea en segundo plano
@@ -225,7 +420,11 @@ async def create_book_index(request: BookInitRequest, background_tasks: Backgrou
 
 
 @app.post("/books/create")
-async def create_book(request: BookContentRequest, background_tasks: BackgroundTasks):
+async def create_book(
+    request: BookContentRequest,
+    background_tasks: BackgroundTasks,
+    profile: bool = Depends(profiling_requested),
+):
     
     """
     Crea un nuevo libro con el contenido proporcionado.
@@ -256,23 +455,30 @@ async def create_book(request: BookContentRequest, background_tasks: BackgroundT
 
     # Ejecutar el grafo en segundo plano hasta el punto de generación del índice
     async def run_graph_task():
+        usage_tracker = UsageTracker()
+        timeline = _register_timeline(job_id)
         try:
             # Inicializar y generar el índice
-            output_state = await book_app.ainvoke(
-                input={
-                    'book_id': request.id,
-                    },
-                config=config
-                )
+            with track_io(timeline.io), profile_job(job_id, profile):
+                output_state = await book_app.ainvoke(
+                    input={
+                        'book_id': request.id,
+                        'generation_mode': request.generation_mode,
+                        },
+                    config={**config, "callbacks": [usage_tracker, timeline]}
+                    )
             
             print(f"Estado de salida: {output_state}")
 
+            usage = usage_tracker.summary()
             background_jobs[job_id] = {
                 "status": "completed" if not output_state.get("error") else "error",
                 "error": output_state.get("error", ""),
                 "book_id": output_state.get("book_id", ""),
                 "completed_at": datetime.now().isoformat(),
+                "usage": usage,
             }
+            _add_book_usage(request.id, usage)
 
             return output_state
 
@@ -281,6 +487,7 @@ async def create_book(request: BookContentRequest, background_tasks: BackgroundT
                 "status": "error",
                 "error": str(e),
                 "completed_at": datetime.now().isoformat(),
+                "usage": usage_tracker.summary(),
             }
             
     
@@ -303,19 +510,109 @@ async def create_book(request: BookContentRequest, background_tasks: BackgroundT
 
 
 @app.get("/jobs/{job_id}")
-def get_job_status(job_id: str):
+def get_job_status(job_id: str, detail: Optional[Literal["timeline"]] = None):
     """
     Obtiene el estado de un trabajo en segundo plano.
+
+    Con `detail=timeline` incluye la línea temporal de la ejecución: cada
+    nodo del grafo con su inicio y fin (segundos desde el comienzo del
+    trabajo), llamadas al LLM, latencia, errores, reintentos y bytes leídos
+    y escritos.
     """
     if job_id not in background_jobs:
         raise HTTPException(status_code=404, detail=f"Trabajo no encontrado: {job_id}")
 
+    if detail == "timeline":
+        timeline = job_timelines.get(job_id)
+        return {
+            **background_jobs[job_id],
+            "timeline": timeline.summary() if timeline else None,
+        }
+
     return background_jobs[job_id]
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Métricas de la API y de la generación en el formato de texto de Prometheus.
+    """
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def get_profiles():
+    """
+    Lista los perfiles guardados de los trabajos perfilados.
+    """
+    return list_profiles()
+
+
+@app.get("/admin/profiles/{job_id}/{artifact}", dependencies=[Depends(require_admin)])
+def download_profile_artifact(job_id: str, artifact: str):
+    """
+    Descarga un artefacto del perfil de un trabajo: `stacks.folded` (pilas
+    para un flamegraph), `allocations.txt` o `summary.json`.
+    """
+    if artifact not in ARTIFACTS:
+        raise HTTPException(status_code=404, detail=f"Artefacto no encontrado: {artifact}")
+
+    directory = get_profile_dir(job_id).resolve()
+    path = directory / artifact
+    # El ID del trabajo no puede salir del directorio de perfiles
+    if directory.parent != settings.PROFILING_DIR.resolve() or not path.exists():
+        raise HTTPException(status_code=404, detail=f"Perfil no encontrado: {job_id}")
+
+    return FileResponse(path, media_type="text/plain", filename=f"{job_id}-{artifact}")
+
+
+@app.get("/stats")
+def get_usage_stats():
+    """
+    Obtiene el uso agregado de tokens y tiempos de todos los trabajos, por nodo y modelo.
+    """
+    usage = {}
+    for job in background_jobs.values():
+        usage = merge_usage(usage, job.get("usage", {}))
+
+    return {
+        "jobs": len(background_jobs),
+        "usage": usage,
+        "llm_policy": get_llm_call_policy().stats(),
+        "output_guard": get_output_guard_stats(),
+    }
+
+
+@app.get("/books/{book_id}/stats")
+def get_book_stats(book_id: str):
+    """
+    Obtiene el uso acumulado de tokens y tiempos de un libro, por nodo y modelo.
+    """
+    book_path = _get_book_path(book_id)
+    if not os.path.exists(book_path):
+        raise HTTPException(status_code=404, detail=f"Libro no encontrado: {book_id}")
+
+    book_data = _load_book_data(book_id)
+
+    return {"book_id": book_id, "usage": book_data.get("usage", {})}
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """
+    Obtiene las métricas de la caché de respuestas del LLM (aciertos, fallos y tamaño).
+    """
+    return get_llm_cache_stats()
+
+
 @app.post("/books/{book_id}/chapters/{chapter_id}")
 async def generate_chapter(
-    book_id: str, chapter_id: str, background_tasks: BackgroundTasks
+    book_id: str,
+    chapter_id: str,
+    background_tasks: BackgroundTasks,
+    profile: bool = Depends(profiling_requested),
 ):
     """
     Genera el contenido para un capítulo específico.
@@ -326,17 +623,10 @@ async def generate_chapter(
         raise HTTPException(status_code=404, detail=f"Libro no encontrado: {book_id}")
 
     # Cargar el libro para verificar el capítulo
-    with open(book_path, "r", encoding="utf-8") as f:
-        book_data = json.load(f)
+    book_data = _load_book_data(book_id)
 
     # Verificar que el capítulo existe
-    chapter_found = False
-    for chapter in book_data["index"]["chapters"]:
-        if chapter["id"] == chapter_id:
-            chapter_found = True
-            break
-
-    if not chapter_found:
+    if Book.model_validate(book_data).index.get_chapter(chapter_id) is None:
         raise HTTPException(
             status_code=404, detail=f"Capítulo no encontrado: {chapter_id}"
         )
@@ -371,27 +661,33 @@ async def generate_chapter(
 
     # Ejecutar el grafo en segundo plano solo para la generación del capítulo
     async def run_chapter_generation():
+        usage_tracker = UsageTracker()
+        timeline = _register_timeline(job_id)
         try:
             # Saltamos la inicialización y generación de índice, vamos directo a generar el capítulo
-            final_state = await book_app.ainvoke({
-                "book_id": initial_state_book["book_id"],
-                "title": initial_state_book["title"],
-                "synopsis": initial_state_book["synopsis"],
-                "estilo": initial_state_book["estilo"],
-                "paginas_totales": initial_state_book["paginas_totales"],
-                "resumen_general": initial_state_book["resumen_general"],
-                "index": initial_state_book["index"],
-                "current_chapter": initial_state_book["current_chapter"]
-            })
+            with track_io(timeline.io), profile_job(job_id, profile):
+                final_state = await book_app.ainvoke({
+                    "book_id": initial_state_book["book_id"],
+                    "title": initial_state_book["title"],
+                    "synopsis": initial_state_book["synopsis"],
+                    "estilo": initial_state_book["estilo"],
+                    "paginas_totales": initial_state_book["paginas_totales"],
+                    "resumen_general": initial_state_book["resumen_general"],
+                    "index": initial_state_book["index"],
+                    "current_chapter": initial_state_book["current_chapter"]
+                }, config={"callbacks": [usage_tracker, timeline]})
 
             # Obtener el estado final
+            usage = usage_tracker.summary()
             background_jobs[job_id] = {
                 "status": "completed" if not final_state.get("error") else "error",
                 "error": final_state.get("error", ""),
                 "book_id": book_id,
                 "chapter_id": chapter_id,
                 "completed_at": datetime.now().isoformat(),
+                "usage": usage,
             }
+            _add_book_usage(book_id, usage)
 
             print(f"Estado de salida: {final_state}")
 
@@ -400,6 +696,7 @@ async def generate_chapter(
                 "status": "error",
                 "error": str(e),
                 "completed_at": datetime.now().isoformat(),
+                "usage": usage_tracker.summary(),
             }
 
     # Iniciar la tarea en segundo plano
@@ -432,12 +729,8 @@ async def download_book(request: DownloadBookRequest):
     if not os.path.exists(book_path):
         raise HTTPException(status_code=404, detail=f"Libro no encontrado: {request.book_id}")
 
-    # Cargar el libro
-    with open(book_path, "r", encoding="utf-8") as f:
-        book_data = json.load(f)
-        
-    book = Book(
-        **book_data)
+    # Cargar el libro con el contenido de los capítulos
+    book = _load_book(request.book_id)
     
     
     file = convert_markdown_to_download_file(book, request.format)
@@ -456,10 +749,14 @@ async def download_book(request: DownloadBookRequest):
 
 @app.post("/books/{book_id}/generate-all")
 async def generate_all_chapters(
-    book_id: str, background_tasks: BackgroundTasks
+    book_id: str,
+    background_tasks: BackgroundTasks,
+    mode: Optional[GenerationMode] = None,
+    profile: bool = Depends(profiling_requested),
 ):
     """
-    Genera automáticamente todos los capítulos del libro en secuencia.
+    Genera automáticamente todos los capítulos del libro, en secuencia o en
+    paralelo según `mode` (por defecto GENERATION_MODE de la configuración).
     """
     # Verificar que el libro existe
     book_path = _get_book_path(book_id)
@@ -467,8 +764,7 @@ async def generate_all_chapters(
         raise HTTPException(status_code=404, detail=f"Libro no encontrado: {book_id}")
 
     # Cargar el libro
-    with open(book_path, "r", encoding="utf-8") as f:
-        book_data = json.load(f)
+    book_data = _load_book_data(book_id)
 
     # Crear el grafo para la generación de capítulos
     book_graph = create_book_generation_graph()
@@ -491,27 +787,36 @@ async def generate_all_chapters(
         "paginas_totales": paginas_totales,
         "resumen_general": resumen_general,
         "index": book_data["index"],
-        "current_chapter": "",  # Vacío para que el connector_node seleccione el primer capítulo
+        "current_chapter": "",  # Vacío para generar todos los capítulos pendientes
         "generated_content": {},
         "processed_chapters": [],
         "previous_chapter_content": "",
         "error": "",
+        "generation_mode": mode,
     }
 
     # Ejecutar el grafo en segundo plano para generar todos los capítulos
     async def run_all_chapters_generation():
+        usage_tracker = UsageTracker()
+        timeline = _register_timeline(job_id)
         try:
             # Ejecutar el grafo completo para generar todos los capítulos
-            final_state = await book_app.ainvoke(initial_state_book)
+            with track_io(timeline.io), profile_job(job_id, profile):
+                final_state = await book_app.ainvoke(
+                    initial_state_book, config={"callbacks": [usage_tracker, timeline]}
+                )
 
             # Actualizar el estado del trabajo
+            usage = usage_tracker.summary()
             background_jobs[job_id] = {
                 "status": "completed" if not final_state.get("error") else "error",
                 "error": final_state.get("error", ""),
                 "book_id": book_id,
                 "completed_at": datetime.now().isoformat(),
                 "processed_chapters": final_state.get("processed_chapters", []),
+                "usage": usage,
             }
+            _add_book_usage(book_id, usage)
 
             print(f"Generación completa finalizada. Estado: {final_state.get('error', 'OK')}")
 
@@ -520,6 +825,7 @@ async def generate_all_chapters(
                 "status": "error",
                 "error": str(e),
                 "completed_at": datetime.now().isoformat(),
+                "usage": usage_tracker.summary(),
             }
             print(f"Error en la generación completa: {str(e)}")
 
@@ -541,6 +847,134 @@ async def generate_all_chapters(
     }
 
 
+@app.patch("/books/{book_id}/chapters/{chapter_id}")
+def update_chapter_index(book_id: str, chapter_id: str, request: ChapterIndexUpdate):
+    """
+    Edita el título o la descripción de un capítulo en el índice.
+
+    El contenido ya escrito no se modifica: los capítulos afectados quedan
+    desactualizados hasta que se regeneren con /books/{book_id}/regenerate-stale.
+    """
+    book_path = _get_book_path(book_id)
+    if not os.path.exists(book_path):
+        raise HTTPException(status_code=404, detail=f"Libro no encontrado: {book_id}")
+
+    if _get_book_index_without_content(book_id).index.get_chapter(chapter_id) is None:
+        raise HTTPException(
+            status_code=404, detail=f"Capítulo no encontrado: {chapter_id}"
+        )
+
+    _update_book_chapters(
+        book_id, {}, chapter_fields={chapter_id: request.model_dump(exclude_none=True)}
+    )
+
+    book = _get_book_index_without_content(book_id)
+
+    return {
+        "book_id": book_id,
+        "chapter_id": chapter_id,
+        "stale_chapters": find_stale_chapters(book.index.chapters),
+        "review_chapters": find_review_chapters(book.index.chapters),
+    }
+
+
+@app.get("/books/{book_id}/stale")
+def get_stale_chapters(book_id: str):
+    """
+    Obtiene los capítulos desactualizados y las entradas que han cambiado de cada uno.
+    """
+    book_path = _get_book_path(book_id)
+    if not os.path.exists(book_path):
+        raise HTTPException(status_code=404, detail=f"Libro no encontrado: {book_id}")
+
+    book = _get_book_index_without_content(book_id)
+
+    return {
+        "book_id": book_id,
+        "stale_chapters": find_stale_chapters(book.index.chapters),
+        "review_chapters": find_review_chapters(book.index.chapters),
+    }
+
+
+@app.post("/books/{book_id}/regenerate-stale")
+async def regenerate_stale_chapters(
+    book_id: str,
+    background_tasks: BackgroundTasks,
+    include_review: bool = False,
+    profile: bool = Depends(profiling_requested),
+):
+    """
+    Regenera solo los capítulos cuya entrada del índice ha cambiado, en el
+    orden del índice.
+
+    Con `include_review` también regenera los capítulos a revisar (los que se
+    escribieron con un resumen anterior que ha cambiado), en cascada hasta
+    que los resúmenes dejen de cambiar.
+    """
+    book_path = _get_book_path(book_id)
+    if not os.path.exists(book_path):
+        raise HTTPException(status_code=404, detail=f"Libro no encontrado: {book_id}")
+
+    book_data = _load_book_data(book_id)
+
+    book_app = create_book_generation_graph().compile()
+    job_id = str(uuid.uuid4())
+
+    initial_state_book = {
+        "book_id": book_id,
+        "title": book_data["title"],
+        "synopsis": book_data["synopsis"],
+        "index": book_data["index"],
+        "current_chapter": "",
+        "error": "",
+        "generation_mode": "regenerate_stale",
+        "include_review": include_review,
+    }
+
+    async def run_stale_regeneration():
+        usage_tracker = UsageTracker()
+        timeline = _register_timeline(job_id)
+        try:
+            with track_io(timeline.io), profile_job(job_id, profile):
+                final_state = await book_app.ainvoke(
+                    initial_state_book, config={"callbacks": [usage_tracker, timeline]}
+                )
+
+            usage = usage_tracker.summary()
+            background_jobs[job_id] = {
+                "status": "completed" if not final_state.get("error") else "error",
+                "error": final_state.get("error", ""),
+                "book_id": book_id,
+                "completed_at": datetime.now().isoformat(),
+                "regenerated_chapters": final_state.get("regenerated_chapters", []),
+                "review_chapters": final_state.get("review_chapters", []),
+                "usage": usage,
+            }
+            _add_book_usage(book_id, usage)
+
+        except Exception as e:
+            background_jobs[job_id] = {
+                "status": "error",
+                "error": str(e),
+                "completed_at": datetime.now().isoformat(),
+                "usage": usage_tracker.summary(),
+            }
+
+    background_tasks.add_task(run_stale_regeneration)
+
+    background_jobs[job_id] = {
+        "status": "running",
+        "started_at": datetime.now().isoformat(),
+        "book_id": book_id,
+    }
+
+    return {
+        "job_id": job_id,
+        "book_id": book_id,
+        "message": "Regeneración de capítulos desactualizados iniciada",
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -17,10 +17,10 @@ import re
 def convert_json_to_markdown(book: Book) -> str:
     """Convierte el objeto Book a contenido markdown."""
     markdown_content = f"# {book.title}\n\n{book.synopsis}\n\n"
-    for chapter in book.index["chapters"]:
-        markdown_content += f"## {chapter['title']}\n\n{chapter['description']}\n\n"
-        if chapter.get("content"):
-            markdown_content += f"{chapter['content']}\n\n"
+    for chapter in book.index.chapters:
+        markdown_content += f"## {chapter.title}\n\n{chapter.description}\n\n"
+        if chapter.content:
+            markdown_content += f"{chapter.content}\n\n"
     
     # Guardar el contenido en un archivo temporal
     temp_file_path = os.path.join(settings.BOOKS_DIR, f"{book.id}.md")
@@ -0,0 +1,237 @@
+"""
+Caché en disco de respuestas del LLM.
+
+Caché de coincidencia exacta respaldada por SQLite que se conecta a los
+modelos de chat de LangChain a través de la interfaz BaseCache. La clave es
+el hash de la configuración del modelo (modelo, temperatura y demás
+parámetros) junto con el prompt ya renderizado.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from langchain_core._api import suppress_langchain_beta_warning
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableBinding
+from loguru import logger
+
+from books_gen.config import settings
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Caché LRU de respuestas del LLM persistida en SQLite.
+
+    Las entradas caducan tras `ttl_seconds` y, cuando se supera `max_entries`
+    o `max_bytes`, se expulsan primero las de acceso más antiguo.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_entries: int,
+        max_bytes: int,
+        ttl_seconds: int,
+    ) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access "
+            "ON llm_cache (last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _make_key(prompt: str, llm_string: str) -> str:
+        """Hash de la configuración del modelo y del prompt renderizado."""
+        return hashlib.sha256(
+            f"{llm_string}\x00{prompt}".encode("utf-8")
+        ).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._make_key(prompt, llm_string)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self._misses += 1
+                return None
+
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self._hits += 1
+
+        with suppress_langchain_beta_warning():
+            generations = loads(value)
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is not None:
+                message.response_metadata["cache_hit"] = True
+
+        logger.debug(f"Caché LLM: acierto para {key[:12]}")
+        return generations
+
+    def contains(self, prompt: str, llm_string: str) -> bool:
+        """Indica si hay una entrada vigente, sin contarla como acierto ni fallo."""
+        key = self._make_key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl_seconds
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._make_key(prompt, llm_string)
+        value = dumps(return_val)
+        size = len(value.encode("utf-8"))
+        now = time.time()
+
+        if size > self.max_bytes:
+            # Una respuesta mayor que la caché completa no se guarda
+            return
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache "
+                "(key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Elimina entradas caducadas y aplica los límites de tamaño (LRU)."""
+        expired = self._conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        self._expirations += max(expired, 0)
+
+        entries, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM llm_cache ORDER BY last_access ASC"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            entries -= 1
+            total_bytes -= size
+
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+        self._evictions += len(evicted)
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Métricas de uso de la caché desde el arranque del proceso."""
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+            lookups = self._hits + self._misses
+
+            return {
+                "enabled": True,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "entries": entries,
+                "size_bytes": total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_llm_response_cache() -> Optional[SQLiteLLMCache]:
+    """
+    Devuelve la caché de respuestas compartida, o None si está desactivada.
+    """
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+
+    return SQLiteLLMCache(
+        path=settings.LLM_CACHE_PATH,
+        max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+        max_bytes=settings.LLM_CACHE_MAX_BYTES,
+        ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    )
+
+
+def llm_cache_key(model: Runnable, messages: List[BaseMessage]) -> Tuple[str, str]:
+    """
+    Prompt y configuración con los que un modelo de chat consulta la caché.
+
+    Reproduce la clave de BaseChatModel (mensajes serializados y
+    `_get_llm_string` con los argumentos fijados con `bind`), de modo que las
+    llamadas en streaming comparten entradas con las llamadas normales.
+    """
+    kwargs = {}
+    if isinstance(model, RunnableBinding):
+        kwargs = model.kwargs
+        model = model.bound
+    return dumps(messages), model._get_llm_string(**kwargs)
+
+
+def get_llm_cache_stats() -> dict:
+    """Métricas de la caché de respuestas del LLM."""
+    cache = get_llm_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return cache.stats()
@@ -0,0 +1,326 @@
+"""
+Modelo de chat local y determinista para pruebas de carga y benchmarks.
+
+Imita las respuestas que el grafo espera de Groq sin hacer llamadas de red:
+un índice JSON válido para INDEX_PROMPT, prosa de longitud configurable para
+los capítulos y sus continuaciones, planes de escenas y escenas de la
+longitud pedida, resúmenes breves y una revisión de coherencia sin
+incidencias. Permite inyectar latencia, errores y salidas degeneradas
+(bucles y textos demasiado largos) para reproducir las condiciones de un
+proveedor real.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+from books_gen.config import settings
+
+
+_WORDS = (
+    "la casa el viento noche puerta sombra camino recuerdo silencio luz "
+    "misterio voz mirada bosque ciudad carta secreto promesa tormenta río "
+    "antiguo oscuro lejano tranquilo extraño frío cálido profundo breve "
+    "caminaba observaba susurraba esperaba descubría recordaba temía sabía "
+    "entre sobre hacia desde bajo sin con para mientras aunque"
+).split()
+
+_INDEX_MARKER = '"chapters"'
+_SCENE_PLAN_MARKER = '"scenes"'
+_SCENE_MARKER = "ESCENA A ESCRIBIR"
+_TRANSITION_MARKER = "Estas son dos escenas consecutivas"
+_REVIEW_MARKER = '"issues"'
+_SUMMARY_MARKERS = (
+    "Crea un resumen",
+    "Este es un resumen del libro",
+    "Este es un capítulo del libro",
+    "Estos son los resúmenes de un arco",
+    "Este es el resumen global del libro",
+)
+
+# Generadores de errores y jitter de latencia, uno por semilla y proceso: si
+# cada instancia tuviera el suyo, todas empezarían por el mismo valor y la
+# tasa de errores actuaría como un umbral (todas fallan o ninguna)
+_ERROR_RNGS: Dict[int, random.Random] = {}
+
+
+def _error_rng(seed: int) -> random.Random:
+    if seed not in _ERROR_RNGS:
+        _ERROR_RNGS[seed] = random.Random(seed)
+    return _ERROR_RNGS[seed]
+
+
+class FakeLLMError(Exception):
+    """Error inyectado por el modelo falso. Imita un 503 transitorio del proveedor."""
+
+    status_code = 503
+
+
+class FakeBookChatModel(BaseChatModel):
+    """
+    Modelo de chat falso que genera respuestas deterministas según el prompt.
+
+    La misma entrada produce siempre la misma salida; la latencia y los errores
+    inyectados se controlan con los parámetros del modelo.
+    """
+
+    model_name: str = Field(default="fake-book-model")
+    temperature: float = 0.7
+    latency_seconds: float = 0.0
+    latency_jitter_seconds: float = 0.0
+    tokens_per_second: float = 0.0
+    error_rate: float = 0.0
+    degenerate_rate: float = 0.0
+    index_chapters: int = 10
+    chapter_words: int = 300
+    summary_words: int = 80
+    seed: int = 42
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-book-chat-model"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "temperature": self.temperature}
+
+    # --- Contenido ---
+
+    def _rng_for(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def _prose(self, rng: random.Random, words: int) -> str:
+        sentences = []
+        remaining = words
+        while remaining > 0:
+            length = min(remaining, rng.randint(8, 18))
+            sentence = " ".join(rng.choice(_WORDS) for _ in range(length))
+            sentences.append(sentence.capitalize() + ".")
+            remaining -= length
+
+        paragraphs = [
+            " ".join(sentences[i : i + 5]) for i in range(0, len(sentences), 5)
+        ]
+        return "\n\n".join(paragraphs)
+
+    def _index(self, rng: random.Random) -> str:
+        chapters = [
+            {
+                "id": str(i),
+                "title": f"Capítulo {i}: {self._prose(rng, 3).rstrip('.')}",
+                "description": self._prose(rng, 20),
+            }
+            for i in range(1, self.index_chapters + 1)
+        ]
+        return json.dumps({"chapters": chapters}, ensure_ascii=False, indent=2)
+
+    def _long_text(self, rng: random.Random, words: int, prompt: str) -> str:
+        """
+        Prosa de `words` palabras que, con probabilidad `degenerate_rate`,
+        entra en un bucle que repite el mismo párrafo o se alarga de más.
+
+        La decisión sale de un generador propio derivado del prompt y de la
+        semilla: no depende del orden de las llamadas y no altera la prosa
+        cuando la salida es normal.
+        """
+        if not self.degenerate_rate:
+            return self._prose(rng, words)
+        degenerate_rng = self._rng_for(f"degenerate:{prompt}")
+        if degenerate_rng.random() >= self.degenerate_rate:
+            return self._prose(rng, words)
+        if degenerate_rng.random() < 0.5:
+            loop = self._prose(rng, 30)
+            return "\n\n".join(
+                [self._prose(rng, words // 3)] + [loop] * max(3, words // 10)
+            )
+        return self._prose(rng, words * 4)
+
+    def _scene_plan(self, rng: random.Random, prompt: str) -> str:
+        match = re.search(r"exactamente (\d+) escenas", prompt)
+        count = int(match.group(1)) if match else 3
+        return json.dumps(
+            {"scenes": [self._prose(rng, 25) for _ in range(count)]},
+            ensure_ascii=False,
+        )
+
+    def _scene(self, rng: random.Random, prompt: str) -> str:
+        match = re.search(r"aproximadamente (\d+) palabras", prompt)
+        return self._long_text(
+            rng, int(match.group(1)) if match else self.chapter_words, prompt
+        )
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        rng = self._rng_for(prompt)
+        last = str(messages[-1].content).lstrip() if messages else ""
+
+        if _REVIEW_MARKER in last:
+            return json.dumps({"issues": []})
+        if _SCENE_PLAN_MARKER in last:
+            return self._scene_plan(rng, last)
+        if _SCENE_MARKER in last:
+            return self._scene(rng, last)
+        if last.startswith(_TRANSITION_MARKER):
+            return self._prose(rng, min(self.summary_words, 40))
+        if _INDEX_MARKER in last:
+            return self._index(rng)
+        if last.startswith(_SUMMARY_MARKERS):
+            return self._prose(rng, self.summary_words)
+        return self._long_text(rng, self.chapter_words, prompt)
+
+    # --- Latencia, errores y metadatos ---
+
+    def _latency(self, output: str) -> float:
+        latency = self.latency_seconds
+        if self.latency_jitter_seconds:
+            latency += _error_rng(self.seed).uniform(0, self.latency_jitter_seconds)
+        if self.tokens_per_second:
+            latency += _count_tokens(output) / self.tokens_per_second
+        return latency
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and _error_rng(self.seed).random() < self.error_rate:
+            raise FakeLLMError("Error inyectado por el modelo falso")
+
+    def _usage(self, messages: List[BaseMessage], output: str) -> Dict[str, int]:
+        input_tokens = sum(_count_tokens(str(m.content)) for m in messages)
+        output_tokens = _count_tokens(output)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _message(self, messages: List[BaseMessage], output: str) -> AIMessage:
+        return AIMessage(
+            content=output,
+            response_metadata={"model_name": self.model_name},
+            usage_metadata=self._usage(messages, output),
+        )
+
+    def _chunk(
+        self, messages: List[BaseMessage], output: str, piece: str, last: bool
+    ) -> ChatGenerationChunk:
+        # Como los proveedores reales, el uso de tokens llega con el último fragmento
+        if not last:
+            return ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        return ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=piece,
+                response_metadata={"model_name": self.model_name},
+                usage_metadata=self._usage(messages, output),
+            )
+        )
+
+    # --- Interfaz BaseChatModel ---
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        output = self._respond(messages)
+        time.sleep(self._latency(output))
+        self._maybe_fail()
+        return ChatResult(
+            generations=[ChatGeneration(message=self._message(messages, output))],
+            llm_output={"model_name": self.model_name},
+        )
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        output = self._respond(messages)
+        await asyncio.sleep(self._latency(output))
+        self._maybe_fail()
+        return ChatResult(
+            generations=[ChatGeneration(message=self._message(messages, output))],
+            llm_output={"model_name": self.model_name},
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        output = self._respond(messages)
+        pieces = _split_stream(output)
+        delay = self._latency(output) / max(len(pieces), 1)
+        self._maybe_fail()
+        start = time.perf_counter()
+        for number, piece in enumerate(pieces, 1):
+            time.sleep(max(0.0, start + number * delay - time.perf_counter()))
+            chunk = self._chunk(messages, output, piece, number == len(pieces))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        output = self._respond(messages)
+        pieces = _split_stream(output)
+        delay = self._latency(output) / max(len(pieces), 1)
+        self._maybe_fail()
+        # Cada fragmento se entrega en su instante previsto: dormir `delay` por
+        # fragmento acumularía el retraso de cada sleep y alargaría el stream
+        start = time.perf_counter()
+        for number, piece in enumerate(pieces, 1):
+            await asyncio.sleep(max(0.0, start + number * delay - time.perf_counter()))
+            chunk = self._chunk(messages, output, piece, number == len(pieces))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+def _count_tokens(text: str) -> int:
+    """Aproximación del número de tokens: palabras y signos de puntuación."""
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _split_stream(text: str) -> List[str]:
+    """Divide el texto en fragmentos de una palabra conservando los espacios."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def get_fake_chat_model(temperature: float, model_name: str, **kwargs: Any) -> FakeBookChatModel:
+    """Crea el modelo falso con la configuración de `settings`."""
+    return FakeBookChatModel(
+        model_name=model_name,
+        temperature=temperature,
+        latency_seconds=settings.FAKE_LLM_LATENCY_SECONDS,
+        latency_jitter_seconds=settings.FAKE_LLM_LATENCY_JITTER_SECONDS,
+        tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+        error_rate=settings.FAKE_LLM_ERROR_RATE,
+        degenerate_rate=settings.FAKE_LLM_DEGENERATE_RATE,
+        index_chapters=settings.FAKE_LLM_INDEX_CHAPTERS,
+        chapter_words=settings.FAKE_LLM_CHAPTER_WORDS,
+        summary_words=settings.FAKE_LLM_SUMMARY_WORDS,
+        seed=settings.FAKE_LLM_SEED,
+        **kwargs,
+    )
@@ -0,0 +1,439 @@
+"""
+Política de ejecución para las llamadas al LLM.
+
+Envuelve las cadenas de chains.py con un plazo máximo por llamada,
+reintentos con espera exponencial y jitter para errores transitorios, un
+circuit breaker por modelo y, opcionalmente, peticiones duplicadas (hedging)
+cuando una llamada supera el percentil de latencia observado.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import aclosing
+from functools import lru_cache
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Optional,
+    TypeVar,
+)
+
+from langchain_core.callbacks.manager import adispatch_custom_event
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from loguru import logger
+
+from books_gen.config import settings
+
+
+T = TypeVar("T")
+
+# Evento personalizado que reciben los callbacks antes de cada reintento
+LLM_RETRY_EVENT = "llm_retry"
+
+_RETRYABLE_STATUS_CODES = {408, 409, 429}
+_RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "RateLimitError",
+    "InternalServerError",
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito del modelo está abierto y la llamada se rechaza sin intentarla."""
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Indica si un error del proveedor es transitorio y merece reintento."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+
+    if type(error).__name__ in _RETRYABLE_ERROR_NAMES:
+        return True
+
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in _RETRYABLE_STATUS_CODES or status_code >= 500
+
+    return False
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico: tras `failure_threshold` fallos seguidos se abre y
+    rechaza llamadas durante `reset_seconds`; después deja pasar una de prueba
+    y rechaza el resto hasta que esa llamada termina.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self, name: str) -> None:
+        state = self.state
+        if state == "open" or (state == "half_open" and self.probe_in_flight):
+            raise CircuitOpenError(
+                f"Circuito abierto para '{name}' tras {self.failures} fallos consecutivos"
+            )
+        if state == "half_open":
+            self.probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Libera la llamada de prueba si termina sin éxito ni fallo transitorio."""
+        self.probe_in_flight = False
+
+
+class LLMCallPolicy:
+    """Aplica plazos, reintentos, circuit breaker y hedging a llamadas asíncronas."""
+
+    def __init__(
+        self,
+        timeout_seconds: float,
+        max_retries: int,
+        retry_base_delay_seconds: float,
+        retry_max_delay_seconds: float,
+        circuit_breaker_failures: int,
+        circuit_breaker_reset_seconds: float,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+    ) -> None:
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.retry_base_delay_seconds = retry_base_delay_seconds
+        self.retry_max_delay_seconds = retry_max_delay_seconds
+        self.circuit_breaker_failures = circuit_breaker_failures
+        self.circuit_breaker_reset_seconds = circuit_breaker_reset_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._counters: Dict[str, int] = {
+            "calls": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "failures": 0,
+            "rejected": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+        }
+
+    def _breaker(self, key: str) -> CircuitBreaker:
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(
+                self.circuit_breaker_failures, self.circuit_breaker_reset_seconds
+            )
+        return self._breakers[key]
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        """Percentil de latencia observado para la cadena, si hay muestras suficientes."""
+        latencies = self._latencies.get(name)
+        if not self.hedge_enabled or not latencies:
+            return None
+        if len(latencies) < self.hedge_min_samples:
+            return None
+
+        ordered = sorted(latencies)
+        position = min(len(ordered) - 1, int(self.hedge_percentile * len(ordered)))
+        return ordered[position]
+
+    def _retry_delay(self, attempt: int) -> float:
+        """Espera exponencial con jitter completo."""
+        ceiling = min(
+            self.retry_max_delay_seconds,
+            self.retry_base_delay_seconds * (2**attempt),
+        )
+        return random.uniform(0, ceiling)
+
+    async def _attempt(self, name: str, call: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(call(), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self._counters["timeouts"] += 1
+            raise
+
+        # Solo se registra la latencia de intentos individuales completados
+        self._latencies.setdefault(name, deque(maxlen=200)).append(
+            time.perf_counter() - start
+        )
+        return result
+
+    async def _attempt_with_hedge(
+        self, name: str, call: Callable[[], Awaitable[T]]
+    ) -> T:
+        hedge_delay = self._hedge_delay(name)
+        if hedge_delay is None:
+            return await self._attempt(name, call)
+
+        primary = asyncio.ensure_future(self._attempt(name, call))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        # La llamada supera el percentil: lanzar una duplicada y quedarse con la primera
+        self._counters["hedges"] += 1
+        hedge = asyncio.ensure_future(self._attempt(name, call))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run(
+        self,
+        name: str,
+        model: str,
+        call: Callable[[], Awaitable[T]],
+        on_retry: Optional[Callable[[BaseException], Awaitable[None]]] = None,
+    ) -> T:
+        """
+        Ejecuta `call` aplicando la política.
+
+        Args:
+            name: Nombre de la cadena; agrupa las latencias para el hedging.
+            model: Modelo llamado; cada modelo tiene su propio circuit breaker.
+            call: Función sin argumentos que crea la corrutina de la llamada.
+            on_retry: Se llama con el error antes de cada reintento.
+        """
+        breaker = self._breaker(model)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                breaker.before_call(model)
+            except CircuitOpenError:
+                self._counters["rejected"] += 1
+                raise
+
+            self._counters["calls"] += 1
+            try:
+                result = await self._attempt_with_hedge(name, call)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                if not is_retryable_error(e):
+                    breaker.release()
+                    raise
+
+                breaker.record_failure()
+                self._counters["failures"] += 1
+                if attempt >= self.max_retries:
+                    raise
+
+                delay = self._retry_delay(attempt)
+                self._counters["retries"] += 1
+                logger.warning(
+                    f"Llamada '{name}' a {model} falló ({type(e).__name__}: {e}); "
+                    f"reintento {attempt + 1}/{self.max_retries} en {delay:.2f}s"
+                )
+                if on_retry is not None:
+                    await on_retry(e)
+                await asyncio.sleep(delay)
+                continue
+
+            breaker.record_success()
+            return result
+
+    async def stream(
+        self,
+        name: str,
+        model: str,
+        call: Callable[[], AsyncIterator[T]],
+        on_retry: Optional[Callable[[BaseException], Awaitable[None]]] = None,
+    ) -> AsyncIterator[T]:
+        """
+        Versión en streaming de `run`.
+
+        El plazo se aplica a la espera de cada fragmento. Solo se reintenta si
+        el error llega antes del primer fragmento; después se propaga para no
+        entregar texto duplicado. El streaming no usa hedging.
+        """
+        breaker = self._breaker(model)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                breaker.before_call(model)
+            except CircuitOpenError:
+                self._counters["rejected"] += 1
+                raise
+
+            self._counters["calls"] += 1
+            start = time.perf_counter()
+            started = False
+            iterator = call().__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            iterator.__anext__(), timeout=self.timeout_seconds
+                        )
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        self._counters["timeouts"] += 1
+                        raise
+                    started = True
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                # Si el consumidor corta el streaming tras recibir texto, el
+                # modelo ha respondido
+                if started:
+                    breaker.record_success()
+                else:
+                    breaker.release()
+                raise
+            except Exception as e:
+                if not is_retryable_error(e):
+                    breaker.release()
+                    raise
+
+                breaker.record_failure()
+                self._counters["failures"] += 1
+                if started or attempt >= self.max_retries:
+                    raise
+
+                delay = self._retry_delay(attempt)
+                self._counters["retries"] += 1
+                logger.warning(
+                    f"Llamada '{name}' a {model} falló ({type(e).__name__}: {e}); "
+                    f"reintento {attempt + 1}/{self.max_retries} en {delay:.2f}s"
+                )
+                if on_retry is not None:
+                    await on_retry(e)
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                if hasattr(iterator, "aclose"):
+                    await iterator.aclose()
+
+            self._latencies.setdefault(name, deque(maxlen=200)).append(
+                time.perf_counter() - start
+            )
+            breaker.record_success()
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de la política y estado de los circuit breakers."""
+        return {
+            **self._counters,
+            "circuit_breakers": {
+                model: {"state": breaker.state, "failures": breaker.failures}
+                for model, breaker in self._breakers.items()
+            },
+            "hedge_delays": {
+                name: self._hedge_delay(name) for name in self._latencies
+            },
+        }
+
+
+@lru_cache(maxsize=1)
+def get_llm_call_policy() -> LLMCallPolicy:
+    """Política compartida por todas las cadenas, configurada desde `settings`."""
+    return LLMCallPolicy(
+        timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+        max_retries=settings.LLM_MAX_RETRIES,
+        retry_base_delay_seconds=settings.LLM_RETRY_BASE_DELAY_SECONDS,
+        retry_max_delay_seconds=settings.LLM_RETRY_MAX_DELAY_SECONDS,
+        circuit_breaker_failures=settings.LLM_CIRCUIT_BREAKER_FAILURES,
+        circuit_breaker_reset_seconds=settings.LLM_CIRCUIT_BREAKER_RESET_SECONDS,
+        hedge_enabled=settings.LLM_HEDGE_ENABLED,
+        hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+        hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+    )
+
+
+def with_call_policy(
+    runnable: Runnable, name: str, model: str, streaming: bool = False
+) -> Runnable:
+    """
+    Envuelve una cadena para que sus llamadas asíncronas pasen por la política.
+
+    Con `streaming=True` la cadena resultante emite los fragmentos del modelo
+    a medida que llegan (`astream`); `ainvoke` devuelve los fragmentos unidos.
+    """
+    policy = get_llm_call_policy()
+
+    def report_retry(config: RunnableConfig) -> Callable[[BaseException], Awaitable[None]]:
+        # Los reintentos se notifican a los callbacks de la ejecución (línea temporal)
+        async def on_retry(error: BaseException) -> None:
+            await adispatch_custom_event(
+                LLM_RETRY_EVENT,
+                {"name": name, "model": model, "error": type(error).__name__},
+                config=config,
+            )
+
+        return on_retry
+
+    if streaming:
+
+        async def stream_with_policy(
+            inputs: Any, config: RunnableConfig
+        ) -> AsyncIterator[Any]:
+            # Al cortar el streaming se cierra también el de la política,
+            # que libera la llamada de prueba del circuit breaker
+            async with aclosing(
+                policy.stream(
+                    name,
+                    model,
+                    lambda: runnable.astream(inputs, config=config),
+                    on_retry=report_retry(config),
+                )
+            ) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+
+        return RunnableLambda(stream_with_policy, name=name)
+
+    async def call_with_policy(inputs: Any, config: RunnableConfig) -> Any:
+        return await policy.run(
+            name,
+            model,
+            lambda: runnable.ainvoke(inputs, config=config),
+            on_retry=report_retry(config),
+        )
+
+    return RunnableLambda(call_with_policy, name=name)
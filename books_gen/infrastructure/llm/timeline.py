@@ -0,0 +1,171 @@
+"""
+Línea temporal de la ejecución de un trabajo.
+
+TimelineTracker es un callback de LangChain que se pasa al ejecutar el grafo,
+junto a UsageTracker. Registra cada ejecución de un nodo de LangGraph,
+incluidos los del subgrafo de capítulo, con su inicio y fin, las llamadas al
+LLM que hace (latencia, errores y reintentos de la política de llamadas) y
+los bytes que lee y escribe en los archivos de los libros.
+"""
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from books_gen.config import settings
+from books_gen.infrastructure.llm.policy import LLM_RETRY_EVENT
+from books_gen.tools.io_stats import IOCounters
+
+
+class TimelineTracker(AsyncCallbackHandler):
+    """
+    Registra los nodos ejecutados en un trabajo, en orden de inicio.
+
+    Las llamadas al LLM y los reintentos se atribuyen al nodo más interno que
+    las contiene. La E/S de cada nodo se mide con los contadores `io`, que el
+    trabajo asocia a su ejecución con `track_io`; si varios nodos del mismo
+    trabajo se solapan, cada uno cuenta también la E/S de los demás.
+    """
+
+    def __init__(self) -> None:
+        self.io = IOCounters()
+        self.started_at = datetime.now().isoformat()
+        self.dropped = 0
+        self._start = time.perf_counter()
+        self._events: List[Dict[str, Any]] = []
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._nodes: Dict[UUID, Dict[str, Any]] = {}
+        self._io_at_start: Dict[UUID, tuple[int, int]] = {}
+        self._llm_runs: Dict[UUID, tuple[float, Optional[Dict[str, Any]]]] = {}
+
+    def _now(self) -> float:
+        return round(time.perf_counter() - self._start, 4)
+
+    def _node_for(self, run_id: Optional[UUID]) -> Optional[Dict[str, Any]]:
+        """Nodo en curso más interno que contiene la ejecución `run_id`."""
+        while run_id is not None:
+            if run_id in self._nodes:
+                return self._nodes[run_id]
+            run_id = self._parents.get(run_id)
+        return None
+
+    # --- Nodos del grafo ---
+
+    async def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._parents[run_id] = parent_run_id
+        node = (metadata or {}).get("langgraph_node")
+        # Solo la ejecución del propio nodo, no las cadenas que se ejecutan dentro
+        if not node or kwargs.get("name") != node:
+            return
+        if len(self._events) >= settings.JOB_TIMELINE_MAX_EVENTS:
+            self.dropped += 1
+            return
+
+        event: Dict[str, Any] = {"node": node, "start": self._now(), "end": None}
+        parent = self._node_for(parent_run_id)
+        if parent is not None:
+            event["parent"] = parent["node"]
+        if isinstance(inputs, dict) and inputs.get("current_chapter"):
+            event["chapter"] = inputs["current_chapter"]
+        event.update(
+            status="running",
+            llm_calls=0,
+            llm_errors=0,
+            llm_seconds=0.0,
+            retries=0,
+            bytes_read=0,
+            bytes_written=0,
+        )
+        self._events.append(event)
+        self._nodes[run_id] = event
+        self._io_at_start[run_id] = (self.io.bytes_read, self.io.bytes_written)
+
+    async def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_node(run_id, "ok")
+
+    async def on_chain_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._finish_node(run_id, "error")
+
+    def _finish_node(self, run_id: UUID, status: str) -> None:
+        self._parents.pop(run_id, None)
+        event = self._nodes.pop(run_id, None)
+        if event is None:
+            return
+        bytes_read, bytes_written = self._io_at_start.pop(run_id)
+        event["end"] = self._now()
+        event["status"] = status
+        event["bytes_read"] = self.io.bytes_read - bytes_read
+        event["bytes_written"] = self.io.bytes_written - bytes_written
+
+    # --- Llamadas al LLM ---
+
+    async def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: list,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._llm_runs[run_id] = (time.perf_counter(), self._node_for(parent_run_id))
+
+    async def on_llm_start(
+        self,
+        serialized: Dict[str, Any],
+        prompts: list,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._llm_runs[run_id] = (time.perf_counter(), self._node_for(parent_run_id))
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_llm(run_id, error=False)
+
+    async def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._finish_llm(run_id, error=True)
+
+    def _finish_llm(self, run_id: UUID, error: bool) -> None:
+        start, event = self._llm_runs.pop(run_id, (time.perf_counter(), None))
+        if event is None:
+            return
+        event["llm_calls"] += 1
+        event["llm_errors"] += int(error)
+        event["llm_seconds"] = round(
+            event["llm_seconds"] + time.perf_counter() - start, 4
+        )
+
+    async def on_custom_event(
+        self, name: str, data: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if name != LLM_RETRY_EVENT:
+            return
+        event = self._node_for(run_id)
+        if event is not None:
+            event["retries"] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Línea temporal serializable; los nodos en curso tienen `end` None."""
+        return {
+            "started_at": self.started_at,
+            "events": [dict(event) for event in self._events],
+            "dropped_events": self.dropped,
+        }
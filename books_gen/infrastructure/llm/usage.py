@@ -0,0 +1,194 @@
+"""
+Contabilidad de tokens y latencia de las llamadas al LLM.
+
+UsageTracker es un callback de LangChain que se pasa al ejecutar el grafo.
+Agrega, por nodo de LangGraph y por modelo, los tokens de entrada y salida
+que devuelve cada respuesta, el tiempo de cada llamada al LLM y el tiempo
+total de cada nodo. Las mismas medidas se acumulan en las métricas del
+proceso que expone `/metrics`.
+"""
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from books_gen.infrastructure.metrics import (
+    LLM_CALL_DURATION,
+    LLM_CALLS,
+    LLM_TOKENS,
+    NODE_DURATION,
+)
+
+
+def _empty_usage() -> Dict[str, float]:
+    return {
+        "llm_calls": 0,
+        "llm_errors": 0,
+        "cache_hits": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0,
+        "llm_seconds": 0.0,
+    }
+
+
+def merge_usage(base: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Suma recursivamente dos resúmenes de uso con la misma estructura."""
+    merged = dict(base)
+    for key, value in other.items():
+        if isinstance(value, dict):
+            merged[key] = merge_usage(merged.get(key, {}), value)
+        elif isinstance(value, (int, float)):
+            merged[key] = merged.get(key, 0) + value
+        else:
+            merged[key] = value
+    return merged
+
+
+class UsageTracker(AsyncCallbackHandler):
+    """Acumula tokens y tiempos por nodo y por modelo durante una ejecución."""
+
+    def __init__(self) -> None:
+        self._llm_runs: Dict[UUID, tuple[float, str, str]] = {}
+        self._node_runs: Dict[UUID, tuple[float, str]] = {}
+        self.total = _empty_usage()
+        self.by_node: Dict[str, Dict[str, float]] = {}
+        self.by_model: Dict[str, Dict[str, float]] = {}
+
+    def _bucket(self, group: Dict[str, Dict[str, float]], key: str) -> Dict[str, float]:
+        if key not in group:
+            group[key] = _empty_usage()
+        return group[key]
+
+    def _record(self, node: str, model: str, **values: float) -> None:
+        for bucket in (
+            self.total,
+            self._bucket(self.by_node, node),
+            self._bucket(self.by_model, model),
+        ):
+            for key, value in values.items():
+                bucket[key] += value
+
+    # --- Llamadas al LLM ---
+
+    async def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: list,
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start_llm(run_id, metadata)
+
+    async def on_llm_start(
+        self,
+        serialized: Dict[str, Any],
+        prompts: list,
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start_llm(run_id, metadata)
+
+    def _start_llm(self, run_id: UUID, metadata: Optional[Dict[str, Any]]) -> None:
+        metadata = metadata or {}
+        self._llm_runs[run_id] = (
+            time.perf_counter(),
+            metadata.get("langgraph_node", "unknown"),
+            metadata.get("ls_model_name", ""),
+        )
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        start, node, model = self._llm_runs.pop(
+            run_id, (time.perf_counter(), "unknown", "")
+        )
+        elapsed = time.perf_counter() - start
+
+        llm_output = response.llm_output or {}
+        model = llm_output.get("model_name", "") or model
+        usage: Dict[str, int] = {}
+        cache_hit = False
+
+        generations = response.generations[0] if response.generations else []
+        if generations:
+            message = getattr(generations[0], "message", None)
+            if message is not None:
+                usage = getattr(message, "usage_metadata", None) or {}
+                model = model or message.response_metadata.get("model_name", "")
+                cache_hit = bool(message.response_metadata.get("cache_hit"))
+
+        model = model or "unknown"
+        LLM_CALL_DURATION.observe(elapsed, model=model)
+        if cache_hit:
+            # Una respuesta servida desde la caché no consume tokens del proveedor
+            LLM_CALLS.inc(model=model, result="cache_hit")
+            self._record(node, model, llm_calls=1, cache_hits=1, llm_seconds=elapsed)
+            return
+
+        LLM_CALLS.inc(model=model, result="ok")
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), model=model, direction="input")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), model=model, direction="output")
+        self._record(
+            node,
+            model,
+            llm_calls=1,
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+            llm_seconds=elapsed,
+        )
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        start, node, model = self._llm_runs.pop(
+            run_id, (time.perf_counter(), "unknown", "")
+        )
+        elapsed = time.perf_counter() - start
+        model = model or "unknown"
+        LLM_CALL_DURATION.observe(elapsed, model=model)
+        LLM_CALLS.inc(model=model, result="error")
+        self._record(node, model, llm_calls=1, llm_errors=1, llm_seconds=elapsed)
+
+    # --- Nodos del grafo ---
+
+    async def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        # Solo la ejecución del propio nodo, no las cadenas que se ejecutan dentro
+        if node and kwargs.get("name") == node:
+            self._node_runs[run_id] = (time.perf_counter(), node)
+
+    async def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_node(run_id)
+
+    async def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish_node(run_id)
+
+    def _finish_node(self, run_id: UUID) -> None:
+        if run_id not in self._node_runs:
+            return
+        start, node = self._node_runs.pop(run_id)
+        elapsed = time.perf_counter() - start
+        NODE_DURATION.observe(elapsed, node=node)
+        bucket = self._bucket(self.by_node, node)
+        bucket["node_runs"] = bucket.get("node_runs", 0) + 1
+        bucket["node_seconds"] = bucket.get("node_seconds", 0.0) + elapsed
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumen serializable del uso acumulado."""
+        return {
+            "total": dict(self.total),
+            "by_node": {node: dict(values) for node, values in self.by_node.items()},
+            "by_model": {model: dict(values) for model, values in self.by_model.items()},
+        }
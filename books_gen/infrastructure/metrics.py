@@ -0,0 +1,224 @@
+"""
+Métricas en formato de texto de Prometheus, sin dependencias externas.
+
+Los contadores e histogramas se actualizan donde ocurre cada evento (el
+middleware de la API, los callbacks de las ejecuciones del grafo). Los
+valores que ya mantienen otros módulos (caché del LLM, política de llamadas,
+E/S de los libros, trabajos) se leen en el momento de la consulta mediante
+colectores registrados con `register_collector`.
+"""
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Límites de los buckets (segundos) según la duración típica de cada medida
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0, 120.0)
+NODE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Valor acumulado que solo crece."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [
+                (self.name, dict(zip(self.labelnames, key)), value)
+                for key, value in self._values.items()
+            ]
+
+
+class Histogram(_Metric):
+    """Distribución de observaciones en buckets acumulativos."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = HTTP_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * len(self.buckets), [0.0])
+            )
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            total[0] += value
+
+    def samples(self) -> List[Sample]:
+        samples: List[Sample] = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append(
+                        (
+                            f"{self.name}_bucket",
+                            {**labels, "le": _format_value(bound)},
+                            cumulative,
+                        )
+                    )
+                samples.append((f"{self.name}_sum", labels, total[0]))
+                samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class CollectedMetric:
+    """Métrica cuyos valores se leen de otro módulo en el momento de la consulta."""
+
+    def __init__(self, name: str, kind: str, documentation: str) -> None:
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.values: List[Tuple[Dict[str, str], float]] = []
+
+    def add(self, value: float, **labels: str) -> "CollectedMetric":
+        self.values.append((labels, value))
+        return self
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, labels, value) for labels, value in self.values]
+
+
+class MetricsRegistry:
+    """Conjunto de métricas del proceso y colectores, que se exponen en `/metrics`."""
+
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[CollectedMetric]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = HTTP_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(
+        self, collector: Callable[[], Iterable[CollectedMetric]]
+    ) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus (0.0.4)."""
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            metrics.extend(collector())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "books_gen_http_requests_total",
+    "Peticiones HTTP atendidas por la API.",
+    ("method", "route", "status"),
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "books_gen_http_request_duration_seconds",
+    "Latencia de las peticiones HTTP por ruta.",
+    ("method", "route"),
+    HTTP_BUCKETS,
+)
+NODE_DURATION = REGISTRY.histogram(
+    "books_gen_node_duration_seconds",
+    "Duración de cada ejecución de un nodo del grafo.",
+    ("node",),
+    NODE_BUCKETS,
+)
+LLM_CALL_DURATION = REGISTRY.histogram(
+    "books_gen_llm_call_duration_seconds",
+    "Latencia de cada llamada al LLM, incluidas las servidas desde la caché.",
+    ("model",),
+    LLM_BUCKETS,
+)
+LLM_CALLS = REGISTRY.counter(
+    "books_gen_llm_calls_total",
+    "Llamadas al LLM por modelo y resultado (ok, error, cache_hit).",
+    ("model", "result"),
+)
+LLM_TOKENS = REGISTRY.counter(
+    "books_gen_llm_tokens_total",
+    "Tokens consumidos por modelo y dirección (input, output).",
+    ("model", "direction"),
+)
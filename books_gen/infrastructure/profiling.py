@@ -0,0 +1,252 @@
+"""
+Perfilado bajo demanda de los trabajos de generación.
+
+Un trabajo perfilado se ejecuta bajo un muestreador de pila y, si está
+activado, `tracemalloc`. El muestreador es un hilo que cada
+`PROFILING_SAMPLE_INTERVAL_SECONDS` lee la pila del hilo del bucle de
+eventos y la atribuye al trabajo de la tarea asyncio que se está ejecutando
+(a través de su contexto), así que varios trabajos pueden perfilarse a la
+vez sin mezclar sus muestras. Al terminar se escriben en
+`PROFILING_DIR/{job_id}/`:
+
+- `stacks.folded`: pilas en formato "folded" (una pila por línea con su
+  número de muestras), listas para flamegraph.pl, speedscope o inferno.
+- `allocations.txt`: líneas con más memoria asignada durante el trabajo.
+- `summary.json`: duración, muestras y pico de memoria trazada.
+
+`tracemalloc` es global al proceso: las asignaciones de otros trabajos
+simultáneos también aparecen en `allocations.txt`, y el pico de memoria de
+trabajos perfilados a la vez se mide desde el inicio del primero.
+"""
+import asyncio
+import json
+import os
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from books_gen.config import settings
+
+
+ARTIFACTS = ("stacks.folded", "allocations.txt", "summary.json")
+
+_MAX_STACK_DEPTH = 200
+
+_active_profile: ContextVar[Optional["JobProfile"]] = ContextVar(
+    "active_profile", default=None
+)
+
+
+# Prefijos que se quitan de las rutas de los marcos para acortar las pilas
+_PATH_MARKERS = (
+    "site-packages" + os.sep,
+    str(settings.ROOT_DIR) + os.sep,
+    sysconfig.get_paths()["stdlib"] + os.sep,
+)
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    for marker in _PATH_MARKERS:
+        if marker in filename:
+            filename = filename.split(marker, 1)[1]
+            break
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _fold(frame: Optional[FrameType]) -> str:
+    """Pila del marco `frame` en formato folded, de la raíz al marco."""
+    labels: List[str] = []
+    while frame is not None and len(labels) < _MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class JobProfile:
+    """Muestras y estado de memoria de un trabajo perfilado."""
+
+    def __init__(self, job_id: str) -> None:
+        self.job_id = job_id
+        self.started_at = datetime.now().isoformat()
+        self.samples: Counter = Counter()
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self._start = time.perf_counter()
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self._start
+
+
+class _Sampler:
+    """Hilo que muestrea las pilas de los bucles de eventos con trabajos perfilados."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loops: Dict[int, asyncio.AbstractEventLoop] = {}
+        self._users = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def acquire(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            self._loops[threading.get_ident()] = loop
+            self._users += 1
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="profiling-sampler", daemon=True
+                )
+                self._thread.start()
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            thread, self._thread = self._thread, None
+            self._loops.clear()
+            self._stop.set()
+        if thread is not None:
+            thread.join()
+
+    def _run(self) -> None:
+        interval = settings.PROFILING_SAMPLE_INTERVAL_SECONDS
+        while not self._stop.wait(interval):
+            with self._lock:
+                loops = list(self._loops.items())
+            frames = sys._current_frames()
+            for thread_id, loop in loops:
+                task = asyncio.current_task(loop)
+                frame = frames.get(thread_id)
+                if task is None or frame is None:
+                    # Bucle en espera: no hay trabajo al que atribuir la muestra
+                    continue
+                profile = task.get_context().get(_active_profile)
+                if profile is not None:
+                    profile.samples[_fold(frame)] += 1
+
+
+_sampler = _Sampler()
+_tracemalloc_users = 0
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users
+    if _tracemalloc_users == 0:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # Con otro perfil en curso el pico se comparte: reiniciarlo borraría
+        # el de ese perfil
+        tracemalloc.reset_peak()
+    _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users
+    _tracemalloc_users -= 1
+    if _tracemalloc_users == 0:
+        tracemalloc.stop()
+
+
+def get_profile_dir(job_id: str) -> Path:
+    """Directorio de los artefactos de perfilado de un trabajo."""
+    return Path(settings.PROFILING_DIR) / job_id
+
+
+def _write_artifacts(profile: JobProfile, seconds: float) -> None:
+    directory = get_profile_dir(profile.job_id)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    with open(directory / "stacks.folded", "w", encoding="utf-8") as f:
+        for stack, count in profile.samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+    peak = None
+    allocations = []
+    if profile.snapshot is not None:
+        peak = tracemalloc.get_traced_memory()[1]
+        stats = tracemalloc.take_snapshot().compare_to(profile.snapshot, "lineno")
+        allocations = [
+            str(stat)
+            for stat in stats[: settings.PROFILING_TOP_ALLOCATIONS]
+            if stat.size_diff > 0
+        ]
+    with open(directory / "allocations.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(allocations) + "\n" if allocations else "")
+
+    with open(directory / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "job_id": profile.job_id,
+                "started_at": profile.started_at,
+                "seconds": round(seconds, 3),
+                "samples": sum(profile.samples.values()),
+                "sample_interval_seconds": settings.PROFILING_SAMPLE_INTERVAL_SECONDS,
+                "tracemalloc": profile.snapshot is not None,
+                "peak_traced_bytes": peak,
+            },
+            f,
+            indent=2,
+        )
+
+
+@contextmanager
+def profile_job(job_id: str, enabled: bool) -> Iterator[Optional[JobProfile]]:
+    """
+    Perfila el bloque, y las tareas que lance, como el trabajo `job_id`.
+
+    Debe usarse dentro del bucle de eventos que ejecuta el trabajo. Si
+    `enabled` es False no hace nada.
+    """
+    if not enabled:
+        yield None
+        return
+
+    profile = JobProfile(job_id)
+    if settings.PROFILING_TRACEMALLOC:
+        _start_tracemalloc()
+        profile.snapshot = tracemalloc.take_snapshot()
+    _sampler.acquire(asyncio.get_running_loop())
+    token = _active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _active_profile.reset(token)
+        _sampler.release()
+        seconds = profile.seconds
+        try:
+            _write_artifacts(profile, seconds)
+            logger.info(
+                f"Perfil del trabajo {job_id} guardado en {get_profile_dir(job_id)}"
+            )
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el perfil del trabajo {job_id}: {e}")
+        finally:
+            if profile.snapshot is not None:
+                _stop_tracemalloc()
+
+
+def list_profiles() -> List[Dict]:
+    """Resúmenes de los perfiles guardados, del más reciente al más antiguo."""
+    directory = Path(settings.PROFILING_DIR)
+    if not directory.exists():
+        return []
+
+    profiles = []
+    for summary_path in directory.glob("*/summary.json"):
+        with open(summary_path, "r", encoding="utf-8") as f:
+            profiles.append(json.load(f))
+    return sorted(profiles, key=lambda profile: profile["started_at"], reverse=True)
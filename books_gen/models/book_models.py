@@ -1,8 +1,8 @@
 """
 Modelos de datos para la aplicación.
 """
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Any, List, Dict, Literal, Optional, Set
 from enum import Enum
 
 
@@ -41,6 +41,9 @@ class FormatDownload(str, Enum):
     MARKDOWN = "markdown"
 
 
+GenerationMode = Literal["sequential", "parallel", "pipelined"]
+
+
 class BookInitRequest(BaseModel):
     """Modelo para la solicitud inicial del libro."""
 
@@ -49,6 +52,14 @@ class BookInitRequest(BaseModel):
     synopsis: str = Field(..., description="Sinopsis del libro")
     book_style: BookStyle = Field(..., description="Estilo del libro")
     pages: int = Field(..., description="Número de páginas del libro")
+    generate_chapters: bool = Field(
+        False,
+        description="Generar también los capítulos en la misma ejecución, empezando el primero mientras llega el índice",
+    )
+    generation_mode: Optional[GenerationMode] = Field(
+        None,
+        description="Modo de generación de capítulos si generate_chapters es True; por defecto el de la configuración",
+    )
 
     model_config = {
         "json_schema_extra": {
@@ -64,6 +75,10 @@ class BookInitRequest(BaseModel):
 
 class BookContentRequest(BaseModel):
     id: str = Field(..., description="ID único del libro")
+    generation_mode: Optional[GenerationMode] = Field(
+        None,
+        description="Modo de generación de capítulos; por defecto el de la configuración",
+    )
 
 
 class BookChapter(BaseModel):
@@ -73,6 +88,24 @@ class BookChapter(BaseModel):
     title: str = Field(..., description="Título del capítulo")
     description: str = Field(..., description="Descripción del capítulo")
     content: Optional[str] = Field(None, description="Contenido del capítulo")
+    content_hash: Optional[str] = Field(
+        None, description="Hash del contenido guardado del capítulo"
+    )
+    summary: Optional[str] = Field(None, description="Resumen del capítulo")
+    summary_hash: Optional[str] = Field(
+        None, description="Hash del contenido a partir del que se generó el resumen"
+    )
+    input_hashes: Optional[Dict[str, str]] = Field(
+        None,
+        description="Hashes de las entradas usadas al escribir el capítulo (índice y resumen anterior)",
+    )
+
+
+class ChapterIndexUpdate(BaseModel):
+    """Modelo para editar la entrada del índice de un capítulo."""
+
+    title: Optional[str] = Field(None, description="Nuevo título del capítulo")
+    description: Optional[str] = Field(None, description="Nueva descripción del capítulo")
 
 
 class BookIndex(BaseModel):
@@ -82,6 +115,54 @@ class BookIndex(BaseModel):
         default_factory=list, description="Lista de capítulos"
     )
 
+    _positions: Dict[str, int] = PrivateAttr(default_factory=dict)
+
+    def position(self, chapter_id: str) -> Optional[int]:
+        """
+        Posición de un capítulo en el índice, o None si no existe.
+
+        El mapa id -> posición se reconstruye solo cuando la lista de
+        capítulos ha cambiado.
+        """
+        position = self._positions.get(chapter_id)
+        if (
+            position is None
+            or position >= len(self.chapters)
+            or self.chapters[position].id != chapter_id
+        ):
+            self._positions = {
+                chapter.id: position for position, chapter in enumerate(self.chapters)
+            }
+            position = self._positions.get(chapter_id)
+        return position
+
+    def get_chapter(self, chapter_id: str) -> Optional[BookChapter]:
+        """Capítulo con el ID indicado, o None si no existe."""
+        position = self.position(chapter_id)
+        return None if position is None else self.chapters[position]
+
+
+class ArcSummary(BaseModel):
+    """Resumen de un arco: un grupo de capítulos consecutivos del índice."""
+
+    chapter_ids: List[str] = Field(..., description="IDs de los capítulos del arco")
+    summary: str = Field(..., description="Resumen del arco")
+    source_hash: str = Field(
+        "", description="Hash de los resúmenes de capítulo a partir de los que se generó"
+    )
+
+
+class BookSummary(BaseModel):
+    """Resumen jerárquico del libro: arcos cerrados y sinopsis global acotada."""
+
+    arcs: List[ArcSummary] = Field(
+        default_factory=list, description="Resúmenes de los arcos cerrados, en orden"
+    )
+    synopsis: str = Field("", description="Resumen global de los arcos incorporados")
+    synopsis_arcs: int = Field(
+        0, description="Número de arcos incorporados al resumen global"
+    )
+
 
 class Book(BaseModel):
     """Modelo para representar un libro completo."""
@@ -94,12 +175,41 @@ class Book(BaseModel):
     processed_chapters: List[str] = Field(
         default_factory=list, description="Lista de capítulos procesados"
     )
-    index: Dict = Field(..., description="Índice del libro")
+    index: BookIndex = Field(..., description="Índice del libro")
     created_at: str = Field(..., description="Fecha de creación")
     updated_at: str = Field(..., description="Fecha de última actualización")
     is_completed: bool = Field(
         default=False, description="Indica si el libro está completo"
     )
+    consistency_issues: List[Dict] = Field(
+        default_factory=list,
+        description="Incoherencias detectadas entre capítulos generados en paralelo",
+    )
+    usage: Dict = Field(
+        default_factory=dict,
+        description="Tokens y tiempos acumulados de las llamadas al LLM, por nodo y modelo",
+    )
+    summary: BookSummary = Field(
+        default_factory=BookSummary,
+        description="Resumen jerárquico del libro (arcos y sinopsis global)",
+    )
+
+    _processed: Set[str] = PrivateAttr(default_factory=set)
+    _processed_synced: int = PrivateAttr(default=-1)
+
+    def is_processed(self, chapter_id: str) -> bool:
+        """Indica si el capítulo ya se ha generado."""
+        if self._processed_synced != len(self.processed_chapters):
+            self._processed = set(self.processed_chapters)
+            self._processed_synced = len(self.processed_chapters)
+        return chapter_id in self._processed
+
+    def mark_processed(self, chapter_id: str) -> None:
+        """Marca un capítulo como generado, sin duplicarlo en `processed_chapters`."""
+        if not self.is_processed(chapter_id):
+            self.processed_chapters.append(chapter_id)
+            self._processed.add(chapter_id)
+            self._processed_synced = len(self.processed_chapters)
 
 
 class ChapterGenerationRequest(BaseModel):
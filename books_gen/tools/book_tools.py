@@ -1,15 +1,55 @@
 """
 Herramientas específicas para la generación de contenido de libros.
 """
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import copy
 import json
 import os
+import shutil
+import threading
+import time
 import uuid
 from datetime import datetime
 from langchain.tools import tool
+from loguru import logger
 
 from ..models.book_models import Book, BookIndex, BookChapter, BookStyle
 from books_gen.config import settings
+from books_gen.graphs.summary import content_hash
+from books_gen.infrastructure.llm.usage import merge_usage
+from books_gen.tools.io_stats import (
+    record_file_read,
+    record_file_write,
+    record_read,
+    record_write,
+)
+
+
+# Cada libro se guarda en BOOKS_DIR en tres partes:
+#
+# - `{book_id}.json`: metadatos e índice del libro, sin el contenido de los
+#   capítulos.
+# - `{book_id}.log.jsonl`: registro de cambios que solo crece. Cada
+#   actualización añade una línea con los campos modificados de los
+#   capítulos y del libro, en lugar de reescribir el archivo completo.
+# - `{book_id}.chapters/{chapter_id}.txt`: contenido de cada capítulo.
+#
+# El estado del libro es el archivo principal más las líneas del registro, y
+# se mantiene en memoria: cada lectura solo lee las líneas nuevas del
+# registro. Cuando el registro supera el tamaño del archivo principal (y
+# BOOK_LOG_COMPACT_BYTES), se incorpora a este y se vacía.
+
+_MAX_CACHED_BOOKS = 32
+
+# Funciones a las que se avisa al guardar el contenido de un capítulo, con
+# (book_id, chapter_id, content); por ejemplo, el índice de pasajes
+_content_listeners: List[Callable[[str, str, str], None]] = []
+
+
+def add_chapter_content_listener(listener: Callable[[str, str, str], None]) -> None:
+    """Registra una función a la que avisar cada vez que se guarda el contenido de un capítulo."""
+    _content_listeners.append(listener)
 
 
 def _get_book_path(book_id: str) -> str:
@@ -17,36 +57,401 @@ def _get_book_path(book_id: str) -> str:
     return os.path.join(settings.BOOKS_DIR, f"{book_id}.json")
 
 
-def _get_book_index_without_content(book_id: str) -> Book:
-    """Obtiene el índice del libro."""
-    book_path = _get_book_path(book_id)
-    if not os.path.exists(book_path):
+def _get_book_log_path(book_id: str) -> str:
+    """Obtiene la ruta del registro de cambios del libro."""
+    return os.path.join(settings.BOOKS_DIR, f"{book_id}.log.jsonl")
+
+
+def _get_chapters_dir(book_id: str) -> str:
+    """Obtiene el directorio con el contenido de los capítulos del libro."""
+    return os.path.join(settings.BOOKS_DIR, f"{book_id}.chapters")
+
+
+def _get_chapter_path(book_id: str, chapter_id: str) -> str:
+    """Obtiene la ruta del contenido de un capítulo."""
+    return os.path.join(_get_chapters_dir(book_id), f"{chapter_id}.txt")
+
+
+def _file_stat(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
         return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _write_file_atomic(path: str, text: str) -> None:
+    """Escribe `text` en `path` sin dejar el archivo a medias si el proceso se interrumpe."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        record_file_write(f)
+    os.replace(tmp_path, path)
+
+
+class _StoredBook:
+    """Estado de un libro en memoria: el archivo principal con el registro aplicado."""
+
+    def __init__(self, data: Dict, base_stat: Optional[Tuple[int, int]]) -> None:
+        self.data = data
+        self.base_stat = base_stat
+        self.log_offset = 0
+        self.data.setdefault("processed_chapters", [])
+        self.processed = set(self.data["processed_chapters"])
+        self.reindex()
+
+    def reindex(self) -> None:
+        self.chapters = {
+            chapter["id"]: chapter for chapter in self.data["index"].get("chapters", [])
+        }
+
+    def apply(self, entry: Dict) -> None:
+        """Aplica una línea del registro."""
+        for chapter_id, fields in entry.get("chapters", {}).items():
+            chapter = self.chapters.get(chapter_id)
+            if chapter is not None:
+                chapter.update(fields)
+        for chapter_id in entry.get("processed", []):
+            if chapter_id not in self.processed:
+                self.processed.add(chapter_id)
+                self.data["processed_chapters"].append(chapter_id)
+        self.data.update(entry.get("book", {}))
+
+
+_books: "OrderedDict[str, _StoredBook]" = OrderedDict()
+# Los endpoints síncronos de la API se ejecutan en otros hilos
+_books_lock = threading.RLock()
+
+
+def _write_book_base(book_id: str, stored: _StoredBook) -> None:
+    """Guarda el estado completo en el archivo principal y vacía el registro."""
+    _write_file_atomic(_get_book_path(book_id), json.dumps(stored.data, indent=2))
+    log_path = _get_book_log_path(book_id)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    stored.base_stat = _file_stat(_get_book_path(book_id))
+    stored.log_offset = 0
+
+
+def _read_book_log(book_id: str, stored: _StoredBook) -> bool:
+    """
+    Aplica las líneas del registro añadidas desde la última lectura.
 
-    with open(book_path, "r", encoding="utf-8") as f:
-        book_data = json.load(f)
+    Returns:
+        bool: False si el registro es más corto de lo ya leído (se vació
+        desde otro proceso) y hay que recargar el libro.
+    """
+    log_stat = _file_stat(_get_book_log_path(book_id))
+    size = log_stat[1] if log_stat else 0
+    if size < stored.log_offset:
+        return False
+    if size == stored.log_offset:
+        return True
+
+    with open(_get_book_log_path(book_id), "rb") as f:
+        f.seek(stored.log_offset)
+        chunk = f.read(size - stored.log_offset)
+    # Solo se aplican las líneas completas
+    end = chunk.rfind(b"\n") + 1
+    record_read(end)
+    for line in chunk[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            stored.apply(json.loads(line))
+        except json.JSONDecodeError:
+            logger.warning(f"Línea no válida en el registro del libro {book_id}")
+    stored.log_offset += end
+    return True
+
+
+def _migrate_inline_content(book_id: str, stored: _StoredBook) -> None:
+    """Mueve a archivos propios el contenido guardado dentro del archivo del libro."""
+    for chapter in stored.data["index"].get("chapters", []):
+        content = chapter.pop("content", None)
+        if content:
+            _write_file_atomic(_get_chapter_path(book_id, chapter["id"]), content)
+            chapter["content_hash"] = content_hash(content)
+    _write_book_base(book_id, stored)
+
+
+def _load_stored_book(book_id: str) -> Optional[_StoredBook]:
+    """Estado actual del libro, leyendo del disco solo lo que ha cambiado."""
+    base_stat = _file_stat(_get_book_path(book_id))
+    if base_stat is None:
+        _books.pop(book_id, None)
+        return None
 
-    for chapter in book_data["index"]["chapters"]:
-        # Eliminar el contenido del capítulo si existe
-        if chapter.get("content"):
-            del chapter["content"]
-    
-    
-    book = Book(
-        id=book_data["id"],
-        title=book_data["title"],
-        synopsis=book_data["synopsis"],
-        book_style=BookStyle(book_data["book_style"]),
-        processed_chapters=book_data["processed_chapters"],
-        pages=book_data["pages"],
-        index=book_data["index"],
-        created_at=book_data["created_at"],
-        updated_at=book_data["updated_at"],
-    )
+    stored = _books.get(book_id)
+    loaded = stored is None or stored.base_stat != base_stat
+    if loaded:
+        with open(_get_book_path(book_id), "r", encoding="utf-8") as f:
+            record_file_read(f)
+            stored = _StoredBook(json.load(f), base_stat)
+        _books[book_id] = stored
+        while len(_books) > _MAX_CACHED_BOOKS:
+            _books.popitem(last=False)
+    _books.move_to_end(book_id)
+
+    if not _read_book_log(book_id, stored):
+        _books.pop(book_id, None)
+        return _load_stored_book(book_id)
+
+    if loaded and any(
+        chapter.get("content") for chapter in stored.data["index"].get("chapters", [])
+    ):
+        _migrate_inline_content(book_id, stored)
+    return stored
+
+
+def _create_book_file(book: Book) -> None:
+    """Guarda el archivo inicial de un libro nuevo."""
+    data = json.loads(book.model_dump_json())
+    for chapter in data["index"]["chapters"]:
+        content = chapter.pop("content", None)
+        if content:
+            _write_file_atomic(_get_chapter_path(book.id, chapter["id"]), content)
+            chapter["content_hash"] = content_hash(content)
 
+    os.makedirs(settings.BOOKS_DIR, exist_ok=True)
+    with _books_lock:
+        stored = _StoredBook(data, None)
+        _write_book_base(book.id, stored)
+        _books[book.id] = stored
+
+
+def _update_book_index(book_id: str, index: Dict) -> None:
+    """
+    Sustituye el índice del libro por `index`.
+
+    Los capítulos del índice anterior y su contenido se descartan.
+    """
+    with _books_lock:
+        stored = _load_stored_book(book_id)
+        stored.data["index"] = index
+        stored.data["updated_at"] = datetime.now().isoformat()
+        stored.reindex()
+        shutil.rmtree(_get_chapters_dir(book_id), ignore_errors=True)
+        _write_book_base(book_id, stored)
+
+
+def _load_book_data(book_id: str, with_content: bool = False) -> Optional[Dict]:
+    """Datos del libro como diccionario, con el contenido de los capítulos si se pide."""
+    with _books_lock:
+        stored = _load_stored_book(book_id)
+        if stored is None:
+            return None
+        data = copy.deepcopy(stored.data)
+
+    if with_content:
+        for chapter in data["index"].get("chapters", []):
+            chapter["content"] = _get_chapter_content(book_id, chapter["id"]) or None
+    return data
+
+
+def _load_book(book_id: str) -> Optional[Book]:
+    """Obtiene el libro completo, con el contenido de los capítulos."""
+    book = _get_book_index_without_content(book_id)
+    if book is not None:
+        for chapter in book.index.chapters:
+            if chapter.content_hash:
+                chapter.content = _get_chapter_content(book_id, chapter.id)
     return book
 
 
+def _get_book_index_without_content(book_id: str) -> Optional[Book]:
+    """Obtiene el índice del libro, sin el contenido de los capítulos."""
+    with _books_lock:
+        stored = _load_stored_book(book_id)
+        if stored is None:
+            return None
+        return Book.model_validate(stored.data)
+
+
+def _get_content_hashes(book_id: str) -> Dict[str, str]:
+    """Hash del contenido guardado de los capítulos escritos, por ID."""
+    with _books_lock:
+        stored = _load_stored_book(book_id)
+        if stored is None:
+            return {}
+        return {
+            chapter_id: chapter["content_hash"]
+            for chapter_id, chapter in stored.chapters.items()
+            if chapter.get("content_hash")
+        }
+
+
+def _get_chapter_content(book_id: str, chapter_id: str) -> str:
+    """Obtiene el contenido guardado de un capítulo, o "" si no tiene."""
+    chapter_path = _get_chapter_path(book_id, chapter_id)
+    if not os.path.exists(chapter_path):
+        return ""
+
+    with open(chapter_path, "r", encoding="utf-8") as f:
+        record_file_read(f)
+        return f.read()
+
+
+def _get_partial_chapter_path(book_id: str, chapter_id: str) -> str:
+    """Obtiene la ruta del texto parcial de un capítulo que se está generando."""
+    return os.path.join(settings.BOOKS_DIR, f"{book_id}.partial", f"{chapter_id}.txt")
+
+
+def _read_partial_chapter(book_id: str, chapter_id: str) -> str:
+    """Obtiene el texto parcial guardado de un capítulo, o "" si no hay."""
+    partial_path = _get_partial_chapter_path(book_id, chapter_id)
+    if not os.path.exists(partial_path):
+        return ""
+
+    with open(partial_path, "r", encoding="utf-8") as f:
+        record_file_read(f)
+        return f.read()
+
+
+def _clear_partial_chapter(book_id: str, chapter_id: str) -> None:
+    """Elimina el texto parcial de un capítulo, si existe."""
+    partial_path = _get_partial_chapter_path(book_id, chapter_id)
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+        try:
+            os.rmdir(os.path.dirname(partial_path))
+        except OSError:
+            # Quedan textos parciales de otros capítulos
+            pass
+
+
+class PartialChapterWriter:
+    """
+    Guarda en disco, a intervalos, el texto de un capítulo que se está generando.
+
+    El texto se añade al archivo parcial del capítulo cada
+    `PARTIAL_FLUSH_SECONDS` segundos o `PARTIAL_FLUSH_CHARS` caracteres, para
+    poder retomarlo si el proceso se interrumpe. Salvo con `resume=True`, la
+    primera escritura sustituye el texto parcial que hubiera.
+    """
+
+    def __init__(self, book_id: str, chapter_id: str, resume: bool = False) -> None:
+        self.path = _get_partial_chapter_path(book_id, chapter_id)
+        self._mode = "a" if resume else "w"
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+
+    def append(self, text: str) -> None:
+        """Añade texto y lo guarda si ha pasado el intervalo."""
+        self._pending.append(text)
+        self._pending_chars += len(text)
+        if (
+            self._pending_chars >= settings.PARTIAL_FLUSH_CHARS
+            or time.monotonic() - self._last_flush >= settings.PARTIAL_FLUSH_SECONDS
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Guarda el texto pendiente."""
+        if self._mode == "a" and not self._pending:
+            return
+
+        text = "".join(self._pending)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, self._mode, encoding="utf-8") as f:
+            f.write(text)
+        record_write(len(text.encode("utf-8")))
+        self._mode = "a"
+        self._pending = []
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+
+    def reset(self) -> None:
+        """Descarta el texto guardado, por ejemplo antes de reintentar la generación."""
+        self._mode = "w"
+        self._pending = []
+        self._pending_chars = 0
+
+
+def _get_chapter_contents(book_id: str) -> Dict[str, str]:
+    """Obtiene el contenido guardado de los capítulos escritos, por ID."""
+    book = _get_book_index_without_content(book_id)
+    contents = {}
+    for chapter in book.index.chapters:
+        if chapter.content_hash:
+            content = _get_chapter_content(book_id, chapter.id)
+            if content:
+                contents[chapter.id] = content
+    return contents
+
+
+def _update_book_chapters(
+    book_id: str,
+    contents: Dict[str, str],
+    chapter_fields: Optional[Dict[str, Dict]] = None,
+    **fields,
+) -> None:
+    """
+    Guarda el contenido y los campos de varios capítulos y los campos del libro.
+
+    El contenido de cada capítulo se escribe en su propio archivo; el resto
+    de cambios (campos por ID de capítulo, como el resumen, capítulos
+    procesados y campos del libro) se añaden en una sola línea al registro,
+    sin reescribir el archivo del libro.
+    """
+    chapter_fields = {
+        chapter_id: dict(values) for chapter_id, values in (chapter_fields or {}).items()
+    }
+    for chapter_id, content in contents.items():
+        _write_file_atomic(_get_chapter_path(book_id, chapter_id), content)
+        chapter_fields.setdefault(chapter_id, {})["content_hash"] = content_hash(content)
+
+    with _books_lock:
+        stored = _load_stored_book(book_id)
+        entry: Dict = {}
+        if chapter_fields:
+            entry["chapters"] = chapter_fields
+        processed = fields.pop("processed_chapters", None)
+        if processed is not None:
+            new_processed = [
+                chapter_id for chapter_id in processed if chapter_id not in stored.processed
+            ]
+            if new_processed:
+                entry["processed"] = new_processed
+        entry["book"] = {**fields, "updated_at": datetime.now().isoformat()}
+
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        log_path = _get_book_log_path(book_id)
+        log_stat = _file_stat(log_path)
+        size = log_stat[1] if log_stat else 0
+        if size != stored.log_offset:
+            # Línea incompleta de una escritura interrumpida
+            line = b"\n" + line
+        with open(log_path, "ab") as f:
+            f.write(line)
+        record_write(len(line))
+        # Se aplica la copia serializada para no compartir objetos con el llamante
+        stored.apply(json.loads(line))
+        stored.log_offset = size + len(line)
+
+        if stored.log_offset > max(settings.BOOK_LOG_COMPACT_BYTES, stored.base_stat[1]):
+            _write_book_base(book_id, stored)
+
+    # El contenido definitivo sustituye al texto parcial de la generación
+    for chapter_id, content in contents.items():
+        _clear_partial_chapter(book_id, chapter_id)
+        for listener in _content_listeners:
+            listener(book_id, chapter_id, content)
+
+
+def _add_book_usage(book_id: str, usage: Dict) -> None:
+    """Acumula el uso de una ejecución en el registro del libro."""
+    with _books_lock:
+        stored = _load_stored_book(book_id)
+        if stored is None:
+            return
+        _update_book_chapters(
+            book_id, {}, usage=merge_usage(stored.data.get("usage", {}), usage)
+        )
+
+
 @tool
 def generate_book_index(title: str, synopsis: str) -> str:
     """
@@ -86,9 +491,7 @@ def generate_book_index(title: str, synopsis: str) -> str:
     ]
 
     # Guardar el libro
-    os.makedirs(settings.BOOKS_DIR, exist_ok=True)
-    with open(_get_book_path(book_id), "w", encoding="utf-8") as f:
-        f.write(book.model_dump_json(indent=2))
+    _create_book_file(book)
 
     return f"Se generó el índice para el libro '{title}' con ID: {book_id}"
 
@@ -107,18 +510,15 @@ def list_books() -> str:
     books = []
     for filename in os.listdir(settings.BOOKS_DIR):
         if filename.endswith(".json"):
-            with open(
-                os.path.join(settings.BOOKS_DIR, filename), "r", encoding="utf-8"
-            ) as f:
-                book_data = json.load(f)
-                books.append(
-                    {
-                        "id": book_data["id"],
-                        "title": book_data["title"],
-                        "synopsis": book_data["synopsis"],
-                        "chapters": len(book_data["index"]["chapters"]),
-                    }
-                )
+            book_data = _load_book_data(filename[: -len(".json")])
+            books.append(
+                {
+                    "id": book_data["id"],
+                    "title": book_data["title"],
+                    "synopsis": book_data["synopsis"],
+                    "chapters": len(book_data["index"]["chapters"]),
+                }
+            )
 
     if not books:
         return "No hay libros disponibles."
@@ -141,13 +541,10 @@ def get_book_index(book_id: str) -> str:
     Returns:
         Una representación en texto del índice del libro
     """
-    book_path = _get_book_path(book_id)
-    if not os.path.exists(book_path):
+    book_data = _load_book_data(book_id)
+    if book_data is None:
         return f"No se encontró el libro con ID: {book_id}"
 
-    with open(book_path, "r", encoding="utf-8") as f:
-        book_data = json.load(f)
-
     result = f"Índice del libro: {book_data['title']}\n\n"
 
     for i, chapter in enumerate(book_data["index"]["chapters"], 1):
@@ -170,32 +567,23 @@ def generate_chapter_content(book_id: str, chapter_id: str) -> str:
     Returns:
         Un mensaje indicando que se generó el contenido
     """
-    book_path = _get_book_path(book_id)
-    if not os.path.exists(book_path):
+    book_data = _load_book_data(book_id)
+    if book_data is None:
         return f"No se encontró el libro con ID: {book_id}"
 
-    with open(book_path, "r", encoding="utf-8") as f:
-        book_data = json.load(f)
-
     # Buscar el capítulo
     chapter_found = False
     for chapter in book_data["index"]["chapters"]:
         if chapter["id"] == chapter_id:
             chapter_found = True
             # En una implementación real, aquí se utilizaría el LLM de Groq
-            chapter[
-                "content"
-            ] = f"Este es el contenido generado para el capítulo '{chapter['title']}'. En una implementación real, este contenido sería generado por un modelo de lenguaje avanzado."
+            content = f"Este es el contenido generado para el capítulo '{chapter['title']}'. En una implementación real, este contenido sería generado por un modelo de lenguaje avanzado."
             break
 
     if not chapter_found:
         return f"No se encontró el capítulo con ID: {chapter_id}"
 
-    # Actualizar fecha
-    book_data["updated_at"] = datetime.now().isoformat()
-
-    # Guardar el libro actualizado
-    with open(book_path, "w", encoding="utf-8") as f:
-        json.dump(book_data, f, indent=2)
+    # Guardar el contenido; también actualiza la fecha del libro
+    _update_book_chapters(book_id, {chapter_id: content})
 
     return f"Se generó el contenido para el capítulo con ID: {chapter_id}"
@@ -0,0 +1,76 @@
+"""
+Contadores de lectura y escritura de los archivos de los libros.
+
+Las funciones de almacenamiento registran los bytes que leen y escriben.
+Los totales del proceso se acumulan siempre; además, una ejecución puede
+asociar sus propios contadores con `track_io` para medir su E/S (por
+ejemplo, la línea temporal de un trabajo).
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import IO, Dict, Iterator, Optional
+
+
+class IOCounters:
+    """Operaciones y bytes de lectura y escritura acumulados."""
+
+    def __init__(self) -> None:
+        self.reads = 0
+        self.writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "reads": self.reads,
+            "writes": self.writes,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+
+_totals = IOCounters()
+_current: ContextVar[Optional[IOCounters]] = ContextVar("io_counters", default=None)
+
+
+def record_read(nbytes: int) -> None:
+    """Registra una lectura de `nbytes` bytes."""
+    for counters in (_totals, _current.get()):
+        if counters is not None:
+            counters.reads += 1
+            counters.bytes_read += nbytes
+
+
+def record_write(nbytes: int) -> None:
+    """Registra una escritura de `nbytes` bytes."""
+    for counters in (_totals, _current.get()):
+        if counters is not None:
+            counters.writes += 1
+            counters.bytes_written += nbytes
+
+
+def record_file_read(f: IO) -> None:
+    """Registra la lectura completa del archivo abierto `f`."""
+    record_read(os.fstat(f.fileno()).st_size)
+
+
+def record_file_write(f: IO) -> None:
+    """Registra la escritura completa del archivo `f`, abierto en modo "w"."""
+    f.flush()
+    record_write(os.fstat(f.fileno()).st_size)
+
+
+@contextmanager
+def track_io(counters: IOCounters) -> Iterator[IOCounters]:
+    """Acumula también en `counters` la E/S del bloque y de las tareas que lance."""
+    token = _current.set(counters)
+    try:
+        yield counters
+    finally:
+        _current.reset(token)
+
+
+def get_io_stats() -> Dict[str, int]:
+    """Totales de E/S del proceso."""
+    return _totals.stats()
@@ -0,0 +1,4 @@
+import os
+
+# La configuración se lee al importar el paquete: los tests usan el modelo local
+os.environ.setdefault("LLM_BACKEND", "fake")
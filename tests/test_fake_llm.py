@@ -0,0 +1,37 @@
+from langchain_core.messages import HumanMessage
+
+from books_gen.infrastructure.llm.fake import FakeBookChatModel
+
+
+def _responses(model: FakeBookChatModel, prompts):
+    return [model.invoke([HumanMessage(content=prompt)]).content for prompt in prompts]
+
+
+def test_degenerate_outputs_depend_only_on_prompt_and_seed():
+    prompts = [f"Escribe el capítulo {n}" for n in range(20)]
+    model = FakeBookChatModel(degenerate_rate=0.5, chapter_words=60)
+
+    first = _responses(model, prompts)
+    other_model = FakeBookChatModel(degenerate_rate=0.5, chapter_words=60)
+    shuffled = _responses(other_model, prompts[::-1])
+
+    assert shuffled[::-1] == first
+    assert _responses(model, prompts) == first
+    assert any(len(text.split()) > 60 for text in first)
+
+
+def test_degenerate_outputs_follow_seed():
+    prompts = [f"Escribe el capítulo {n}" for n in range(20)]
+
+    assert _responses(FakeBookChatModel(degenerate_rate=0.5, seed=1), prompts) != (
+        _responses(FakeBookChatModel(degenerate_rate=0.5, seed=2), prompts)
+    )
+
+
+def test_degenerate_rate_does_not_change_normal_outputs():
+    prompts = [f"Escribe el capítulo {n}" for n in range(20)]
+    normal = _responses(FakeBookChatModel(chapter_words=60), prompts)
+    mixed = _responses(FakeBookChatModel(degenerate_rate=0.3, chapter_words=60), prompts)
+
+    unchanged = sum(a == b for a, b in zip(normal, mixed))
+    assert 0 < unchanged < len(prompts)
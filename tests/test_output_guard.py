@@ -0,0 +1,70 @@
+from books_gen.graphs.output_guard import RepetitionDetector, trim_to_sentence
+
+
+def _feed(detector: RepetitionDetector, text: str, size: int) -> bool:
+    looped = False
+    for start in range(0, len(text), size):
+        looped = detector.feed(text[start : start + size]) or looped
+    return looped
+
+
+def test_repetition_detector_finds_loop_and_its_start():
+    intro = "Era una noche fría en el puerto. "
+    loop = "La puerta se abrió y nadie entró en la casa. "
+    detector = RepetitionDetector(ngram_size=5, max_repeats=3)
+
+    assert detector.feed(intro + loop * 3 + "Fin.")
+    assert detector.loop_start == len(intro) + len(loop)
+
+
+def test_repetition_detector_same_result_for_any_chunking():
+    text = "Hola. " + "el viento soplaba sobre el mar, " * 4 + "adiós."
+    loop_starts = set()
+    for size in (1, 3, 7, len(text)):
+        detector = RepetitionDetector(ngram_size=4, max_repeats=3)
+        assert _feed(detector, text, size)
+        loop_starts.add(detector.loop_start)
+
+    assert len(loop_starts) == 1
+
+
+def test_repetition_detector_ignores_case_and_punctuation():
+    detector = RepetitionDetector(ngram_size=3, max_repeats=2)
+
+    assert detector.feed("El Faro brilla. el faro, BRILLA otra vez")
+
+
+def test_repetition_detector_accepts_varied_text():
+    detector = RepetitionDetector(ngram_size=4, max_repeats=2)
+    text = " ".join(f"palabra{n}" for n in range(200)) + " "
+
+    assert not _feed(detector, text, 11)
+    assert detector.loop_start is None
+    assert detector.text == text
+
+
+def test_repetition_detector_waits_for_complete_last_word():
+    detector = RepetitionDetector(ngram_size=2, max_repeats=2)
+
+    assert not detector.feed("uno dos uno do")
+    assert detector.feed("s ")
+
+
+def test_trim_to_sentence_cuts_after_last_full_sentence():
+    assert trim_to_sentence("Primera frase. Segunda frase! Y una a me") == (
+        "Primera frase. Segunda frase!"
+    )
+
+
+def test_trim_to_sentence_keeps_closing_quotes():
+    assert trim_to_sentence("Dijo: «¿Vienes?» Y luego") == "Dijo: «¿Vienes?»"
+    assert trim_to_sentence('—Sí." Entonces') == '—Sí."'
+
+
+def test_trim_to_sentence_ignores_dots_inside_words():
+    assert trim_to_sentence("Costó 3.5 euros. El total era 1.2") == "Costó 3.5 euros."
+
+
+def test_trim_to_sentence_without_sentence_end():
+    assert trim_to_sentence("sin punto final   ") == "sin punto final"
+    assert trim_to_sentence("") == ""
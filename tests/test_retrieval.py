@@ -0,0 +1,117 @@
+import pytest
+
+from books_gen.config import settings
+from books_gen.graphs import retrieval
+from books_gen.graphs.context import count_tokens
+from books_gen.graphs.retrieval import PassageIndex, chunk_chapter, get_passage_index
+from books_gen.models.book_models import Book, BookChapter
+from books_gen.tools import book_tools
+
+
+def test_chunk_chapter_keeps_paragraphs_within_budget():
+    paragraphs = [f"Párrafo número {n} con algunas palabras más." for n in range(10)]
+    budget = count_tokens(paragraphs[0]) * 3
+
+    chunks = chunk_chapter("\n\n".join(paragraphs), budget)
+
+    assert "\n\n".join(chunks).split("\n\n") == paragraphs
+    assert all(count_tokens(chunk) <= budget for chunk in chunks)
+    assert len(chunks) == 4
+
+
+def test_chunk_chapter_skips_blank_paragraphs():
+    assert chunk_chapter("Uno.\n\n   \n\n\n\nDos.", 100) == ["Uno.\n\nDos."]
+    assert chunk_chapter("", 100) == []
+
+
+def test_chunk_chapter_keeps_long_paragraph_whole():
+    paragraph = " ".join(["palabra"] * 50)
+
+    assert chunk_chapter(f"Corto.\n\n{paragraph}", 10) == ["Corto.", paragraph]
+
+
+def _index() -> PassageIndex:
+    index = PassageIndex(chunk_tokens=20)
+    index.update_chapter(
+        "1", "El faro del puerto se apagó aquella noche.\n\nLos pescadores volvieron tarde."
+    )
+    index.update_chapter("2", "La inspectora interrogó al farero sobre la tormenta.")
+    index.update_chapter("3", "En la ciudad, el mercado abrió como cada mañana.")
+    return index
+
+
+def test_search_ranks_matching_passages_first():
+    results = _index().search("faro apagado en el puerto", k=2)
+
+    assert results[0][:2] == ("1", 0)
+    assert "faro" in results[0][2]
+
+
+def test_search_ignores_accents_case_and_stopwords():
+    results = _index().search("MERCADO de la Ciudad", k=3)
+
+    assert [chapter_id for chapter_id, _, _ in results] == ["3"]
+
+
+def test_search_filters_by_chapter():
+    results = _index().search("faro farero tormenta", k=5, chapter_ids=["2"])
+
+    assert {chapter_id for chapter_id, _, _ in results} == {"2"}
+
+
+def test_search_without_matches_or_passages():
+    assert _index().search("dragones", k=3) == []
+    assert PassageIndex(chunk_tokens=20).search("faro", k=3) == []
+    assert _index().search("faro", k=0) == []
+
+
+def test_update_chapter_replaces_previous_content():
+    index = _index()
+
+    assert not index.update_chapter("3", "En la ciudad, el mercado abrió como cada mañana.")
+    assert index.update_chapter("3", "Un tren cruzó el valle nevado.")
+    assert index.search("mercado", k=3) == []
+    assert index.search("tren valle", k=3)[0][0] == "3"
+
+    index.remove_chapter("3")
+    assert "3" not in index
+    assert index.search("tren", k=3) == []
+
+
+@pytest.fixture
+def book_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "BOOKS_DIR", tmp_path)
+    book = Book(
+        id="libro",
+        title="T",
+        synopsis="S",
+        book_style="misterio",
+        pages=10,
+        index={
+            "chapters": [
+                BookChapter(id=str(n), title=f"Capítulo {n}", description="D")
+                for n in range(1, 4)
+            ]
+        },
+        created_at="",
+        updated_at="",
+    )
+    book_tools._create_book_file(book)
+    yield book.id
+    retrieval._indexes.pop(book.id, None)
+
+
+def test_passage_index_follows_saved_chapters_without_rereading(book_id, monkeypatch):
+    book_tools._update_book_chapters(book_id, {"1": "El faro del puerto se apagó."})
+    assert get_passage_index(book_id).search("faro", k=1)[0][0] == "1"
+
+    reads = []
+    monkeypatch.setattr(
+        retrieval,
+        "_get_chapter_content",
+        lambda *args: reads.append(args) or "",
+    )
+    book_tools._update_book_chapters(book_id, {"2": "La tormenta llegó al puerto."})
+
+    assert get_passage_index(book_id).search("tormenta", k=1)[0][0] == "2"
+    assert reads == []